@@ -49,6 +49,7 @@ MIDDLEWARE = [
     'django.contrib.sessions.middleware.SessionMiddleware',
     'middleware.session_validation_middleware.SessionValidationMiddleware',  # Session验证中间件
     'middleware.performance_middleware.CompressionMiddleware',
+    'middleware.cache_warmup_middleware.CacheWarmupMiddleware',  # 记录热门视图，供缓存预热使用
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -97,17 +98,81 @@ DATABASES = {
     }
   }
 
+# MongoDB连接池配置（进程内所有视图、MongoEngine和脚本共享同一个MongoClient）
+MONGODB_CLIENT_OPTIONS = {
+    'maxPoolSize': 50,
+    'maxIdleTimeMS': 60000,
+    'waitQueueTimeoutMS': 5000,
+    'serverSelectionTimeoutMS': 5000,
+    'readPreference': 'primary',
+}
+
 # 缓存配置
+# default: 进程内L1 + 共享L2，多个worker共用同一份缓存（聚合只计算一次）
+# shared: 设置环境变量 REDIS_URL 时使用Redis，否则使用同机多进程共享的SQLite文件
+REDIS_URL = os.environ.get('REDIS_URL', '')
+
+if REDIS_URL:
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        'TIMEOUT': 300,
+    }
+else:
+    SHARED_CACHE = {
+        'BACKEND': 'app_mongo.cache_backends.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'shared_cache', 'cache.sqlite3'),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_SIZE': 256 * 1024 * 1024,
+        }
+    }
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+        'BACKEND': 'app_mongo.cache_backends.TieredCache',
         'TIMEOUT': 300,  # 5分钟缓存
         'OPTIONS': {
-            'MAX_ENTRIES': 1000,
-            'CULL_FREQUENCY': 3,
+            'SHARED_ALIAS': 'shared',
+            'L1_TIMEOUT': 5,
+            'L1_MAX_ENTRIES': 1000,
+            'COMPRESS_MIN_SIZE': 1024,
         }
-    }
+    },
+    'shared': SHARED_CACHE,
+}
+
+# 响应压缩（middleware.performance_middleware.CompressionMiddleware）
+# 安装brotli库后对支持的浏览器优先使用brotli，否则使用gzip
+COMPRESSION = {
+    'MIN_SIZE': 1024,       # 小于该字节数的响应不压缩
+    'BROTLI_QUALITY': 5,
+}
+
+# 缓存预热：启动时、过期前（ttl*REFRESH_AHEAD）和每批数据入库后重新计算热门缓存
+CACHE_WARMUP = {
+    'ENABLED': True,
+    'CONCURRENCY': 2,           # 同时执行的预热任务数
+    'INTERVAL': 30,             # 调度检查间隔（秒）
+    'REFRESH_AHEAD': 0.8,
+    'STARTUP_DELAY': 5,
+    'MAX_TASKS_PER_CYCLE': 10,
+    'HOT_CALL_LIMIT': 20,       # 记录的热门可重放调用数
+}
+
+# 图表渲染结果缓存（内存层 + 磁盘层，均按LRU淘汰）
+CHART_CACHE = {
+    'DIRECTORY': os.path.join(BASE_DIR, 'chart_cache'),
+    'MEMORY_LIMIT': 64 * 1024 * 1024,
+    'DISK_LIMIT': 512 * 1024 * 1024,
+    'KEY_LIMIT': 100000,        # 磁盘键文件数上限
+}
+
+# 图表并行渲染进程池（TIMEOUT为单个图表的超时秒数）
+CHART_RENDER_POOL = {
+    'WORKERS': min(4, os.cpu_count() or 1),
+    'TIMEOUT': 60,
+    'START_METHOD': 'spawn',
 }
 
 
@@ -206,11 +271,26 @@ LOGGING = {
     },
 }
 
-# Session配置优化 - 使用数据库存储确保数据一致性
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'  # 改为纯数据库存储
+# Session配置 - 不再每个请求读写MySQL会话表
+# SESSION_BACKEND 环境变量可选:
+#   cache          - 存放在shared缓存（Redis/同机SQLite），多进程一致，默认
+#   signed_cookies - 签名Cookie，服务端零存储；内容客户端可读（仅签名不加密），不要放敏感数据
+#   db             - 原MySQL会话表
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'cache')
+SESSION_ENGINE = {
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+    'db': 'django.contrib.sessions.backends.db',
+}.get(SESSION_BACKEND, 'django.contrib.sessions.backends.cache')
+# 会话不经过进程内L1，避免退出登录后其他进程短时间内仍读到旧会话
+SESSION_CACHE_ALIAS = 'shared'
 SESSION_COOKIE_AGE = 3600  # 1小时
 SESSION_COOKIE_NAME = 'house_analysis_sessionid'  # 自定义session名称
-SESSION_SAVE_EVERY_REQUEST = True  # 每次请求都保存session
+SESSION_SAVE_EVERY_REQUEST = False  # 只在session内容变化时保存
+# 滑动过期：已登录会话距上次续期超过该秒数时才写一次，代替每个请求都保存
+SESSION_REFRESH_INTERVAL = SESSION_COOKIE_AGE // 2
+# 每个进程记住已验证通过的会话数量上限
+SESSION_VALIDATION_CACHE_SIZE = 10000
 
 # 静态文件优化
 STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+训练房价预测模型并注册为新版本
+例如：python manage.py train_price_model --n-jobs -1 --n-estimators 200
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.utils import price_model
+
+
+class Command(BaseCommand):
+    help = '训练房价随机森林模型，保存到模型注册表'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--n-estimators', type=int, default=100, help='决策树数量')
+        parser.add_argument('--n-jobs', type=int, default=-1, help='并行核心数，-1表示全部核心')
+        parser.add_argument('--no-activate', action='store_true', help='只保存，不切换为当前版本')
+        parser.add_argument('--list', action='store_true', help='列出已有版本')
+        parser.add_argument('--activate', metavar='VERSION', help='切换到指定版本')
+
+    def handle(self, *args, **options):
+        registry = price_model.registry
+
+        if options['list']:
+            current = registry.current_version()
+            for version in registry.list_versions():
+                meta = registry.read_meta(version)
+                mark = '*' if version == current else ' '
+                self.stdout.write(f"{mark} {version}  样本: {meta.get('n_samples', '-')}  耗时: {meta.get('train_seconds', '-')}s")
+            return
+
+        if options['activate']:
+            try:
+                registry.activate(options['activate'])
+            except FileNotFoundError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f"✅ 已切换到版本 {options['activate']}"))
+            return
+
+        try:
+            version = price_model.train_price_model(
+                n_estimators=options['n_estimators'],
+                n_jobs=options['n_jobs'],
+                activate=not options['no_activate']
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"✅ 模型训练完成，版本 {version}"))
@@ -33,6 +33,8 @@ urlpatterns = [
     path('housewordcloud/', views.housewordcloud, name='housewordcloud'),
     path('servicemoney/', views.servicemoney, name='servicemoney'),
     path('train-model/', views.train_house_model, name='train_model'),
+    path('train-model/status/', views.train_model_status, name='train_model_status'),
+    path('api/price-grid/', views.predict_price_grid_api, name='predict_price_grid_api'),
     path('predict-all-prices/', views.predict_all_prices, name='predict_all_prices'),
     path('pricePredict/', views.predict_all_prices, name='price_predict_alt'),
     path('heatmap-analysis/', views.heatmap_analysis, name='heatmap_analysis'),
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+模型版本注册表
+每次训练的模型保存在 <根目录>/<名称>/<版本>/model.joblib，同目录下写入meta.json，
+CURRENT 文件记录当前启用的版本；进程内只加载一次，并以mmap方式共享模型数组
+"""
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+import joblib
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# 模型根目录，可在settings中通过 MODEL_REGISTRY_DIR 覆盖
+DEFAULT_REGISTRY_DIR = os.path.join(settings.BASE_DIR, 'ml_models')
+
+# 检查CURRENT指针是否变化的间隔（秒），CLI训练出新版本后Web进程自动切换
+RELOAD_CHECK_INTERVAL = 30
+
+
+class ModelRegistry:
+    """按名称管理一组模型版本"""
+
+    def __init__(self, name, root=None, keep_versions=5):
+        self.name = name
+        self.root = os.path.join(root or getattr(settings, 'MODEL_REGISTRY_DIR', DEFAULT_REGISTRY_DIR), name)
+        self.keep_versions = keep_versions
+        self._lock = threading.Lock()
+        self._loaded = None          # (version, model, meta)
+        self._last_check = 0.0
+
+    # ---- 写入 ----
+
+    def register(self, model, meta=None, activate=True):
+        """
+        保存新版本模型
+
+        Args:
+            model: 已训练的sklearn模型
+            meta: 附加元数据（样本数、评分等）
+            activate: 是否设为当前版本
+
+        Returns:
+            str: 版本号
+        """
+        version = datetime.now().strftime('%Y%m%d%H%M%S%f')
+        version_dir = os.path.join(self.root, version)
+        os.makedirs(version_dir, exist_ok=True)
+
+        # 不压缩保存，加载时才能用mmap_mode映射numpy数组
+        joblib.dump(model, os.path.join(version_dir, 'model.joblib'))
+        meta = dict(meta or {}, version=version, created_at=datetime.now().isoformat())
+        with open(os.path.join(version_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        if activate:
+            self.activate(version)
+        self._prune()
+        logger.info(f"模型 {self.name} 已注册版本 {version}")
+        return version
+
+    def activate(self, version):
+        """切换当前版本（原子替换CURRENT文件）"""
+        if not os.path.exists(os.path.join(self.root, version, 'model.joblib')):
+            raise FileNotFoundError(f"模型版本不存在: {self.name}/{version}")
+        pointer = os.path.join(self.root, 'CURRENT')
+        tmp = f"{pointer}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(version)
+        os.replace(tmp, pointer)
+
+    def _prune(self):
+        """只保留最近 keep_versions 个版本（当前版本始终保留）"""
+        current = self.current_version()
+        for version in self.list_versions()[self.keep_versions:]:
+            if version != current:
+                shutil.rmtree(os.path.join(self.root, version), ignore_errors=True)
+
+    # ---- 读取 ----
+
+    def list_versions(self):
+        """全部版本，最新的在前"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            (d for d in os.listdir(self.root) if os.path.isfile(os.path.join(self.root, d, 'model.joblib'))),
+            reverse=True
+        )
+
+    def current_version(self):
+        pointer = os.path.join(self.root, 'CURRENT')
+        try:
+            with open(pointer, encoding='utf-8') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            versions = self.list_versions()
+            return versions[0] if versions else None
+
+    def read_meta(self, version):
+        try:
+            with open(os.path.join(self.root, version, 'meta.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {'version': version}
+
+    def load(self):
+        """
+        获取当前版本模型（进程内缓存）
+
+        Returns:
+            tuple: (model, meta)；没有任何版本时抛出FileNotFoundError
+        """
+        now = time.monotonic()
+        loaded = self._loaded
+        if loaded is not None and now - self._last_check < RELOAD_CHECK_INTERVAL:
+            return loaded[1], loaded[2]
+
+        with self._lock:
+            self._last_check = now
+            version = self.current_version()
+            if version is None:
+                raise FileNotFoundError(f"模型 {self.name} 尚未训练")
+            if self._loaded is None or self._loaded[0] != version:
+                path = os.path.join(self.root, version, 'model.joblib')
+                model = joblib.load(path, mmap_mode='r')
+                self._loaded = (version, model, self.read_meta(version))
+                logger.info(f"模型 {self.name} 已加载版本 {version}")
+            return self._loaded[1], self._loaded[2]
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+房价预测模型服务
+训练：读取House表，用多核随机森林拟合，保存到模型注册表（命令行或后台线程执行）
+预测：构造 城市×房型 全量特征网格，一次向量化predict得到全部格子的价格
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict
+
+import pandas as pd
+from django.db.models import Avg, Count
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder
+
+from app.models import House
+from app.utils.model_registry import ModelRegistry
+
+logger = logging.getLogger(__name__)
+
+FEATURES = ['type', 'city', 'area', 'direct']
+CATEGORICAL_FEATURES = ['type', 'city', 'direct']
+TARGET = 'price'
+
+registry = ModelRegistry('house_price')
+
+# 后台训练状态
+_train_lock = threading.Lock()
+_train_state = {'running': False, 'version': None, 'error': None, 'finished_at': None}
+
+
+def build_model(n_estimators=100, n_jobs=-1):
+    """创建预处理+随机森林管道，n_jobs=-1 使用全部CPU核心"""
+    preprocessor = ColumnTransformer(
+        transformers=[
+            ('cat', OneHotEncoder(handle_unknown='ignore'), CATEGORICAL_FEATURES)
+        ],
+        remainder='passthrough'
+    )
+    return Pipeline(steps=[
+        ('preprocessor', preprocessor),
+        ('regressor', RandomForestRegressor(n_estimators=n_estimators, n_jobs=n_jobs))
+    ])
+
+
+def load_training_frame():
+    """只取训练需要的列"""
+    return pd.DataFrame.from_records(House.objects.values(*FEATURES, TARGET).iterator(chunk_size=5000))
+
+
+def train_price_model(n_estimators=100, n_jobs=-1, activate=True):
+    """
+    训练并注册新版本
+
+    Returns:
+        str: 新版本号
+    """
+    data = load_training_frame()
+    if data.empty:
+        raise ValueError('No data available')
+
+    started = time.time()
+    model = build_model(n_estimators=n_estimators, n_jobs=n_jobs)
+    model.fit(data[FEATURES], data[TARGET])
+
+    # 预测阶段是小批量，单线程避免线程池开销
+    model.named_steps['regressor'].set_params(n_jobs=1)
+
+    return registry.register(model, meta={
+        'n_samples': int(len(data)),
+        'n_estimators': n_estimators,
+        'features': FEATURES,
+        'train_seconds': round(time.time() - started, 2)
+    }, activate=activate)
+
+
+def train_in_background(n_estimators=100, n_jobs=-1):
+    """
+    在后台线程中训练，已有训练任务时直接返回False
+    """
+    if not _train_lock.acquire(blocking=False):
+        return False
+
+    _train_state.update(running=True, error=None)
+
+    def _run():
+        try:
+            _train_state['version'] = train_price_model(n_estimators=n_estimators, n_jobs=n_jobs)
+        except Exception as e:
+            logger.error(f"房价模型训练失败: {e}")
+            _train_state['error'] = str(e)
+        finally:
+            _train_state.update(running=False, finished_at=time.time())
+            _train_lock.release()
+
+    threading.Thread(target=_run, name='price-model-train', daemon=True).start()
+    return True
+
+
+def training_status():
+    status = dict(_train_state)
+    status['current_version'] = registry.current_version()
+    return status
+
+
+def _most_common(counter_rows, key_fields):
+    """[(key..., direct, count)] -> {key: 最常见的朝向}"""
+    best = {}
+    for row in counter_rows:
+        key = tuple(row[f] for f in key_fields)
+        if row['direct'] and (key not in best or row['count'] > best[key][1]):
+            best[key] = (row['direct'], row['count'])
+    return {key: value[0] for key, value in best.items()}
+
+
+def build_prediction_grid():
+    """
+    构造 房型×城市 特征网格，缺失的面积/朝向按 格子 -> 房型 -> 全局 三级回退
+
+    两次分组查询取代逐格聚合
+
+    Returns:
+        tuple: (types, cities, DataFrame)
+    """
+    cell_area = {}
+    type_area_sum = defaultdict(float)
+    type_area_n = defaultdict(int)
+    for row in House.objects.values('type', 'city').annotate(avg=Avg('area'), n=Count('id')):
+        cell_area[(row['type'], row['city'])] = row['avg']
+        if row['avg'] is not None:
+            type_area_sum[row['type']] += row['avg'] * row['n']
+            type_area_n[row['type']] += row['n']
+
+    direct_rows = list(House.objects.values('type', 'city', 'direct').annotate(count=Count('id')))
+    cell_direct = _most_common(direct_rows, ['type', 'city'])
+
+    type_direct_rows = defaultdict(int)
+    global_direct_rows = defaultdict(int)
+    for row in direct_rows:
+        type_direct_rows[(row['type'], row['direct'])] += row['count']
+        global_direct_rows[row['direct']] += row['count']
+    type_direct = _most_common(
+        [{'type': t, 'direct': d, 'count': c} for (t, d), c in type_direct_rows.items()], ['type']
+    )
+
+    total_n = sum(type_area_n.values())
+    global_area = sum(type_area_sum.values()) / total_n if total_n else 0
+    global_direct = max(
+        ((d, c) for d, c in global_direct_rows.items() if d), key=lambda x: x[1], default=('未知', 0)
+    )[0]
+
+    types = sorted({t for t, _ in cell_area if t})
+    cities = sorted({c for _, c in cell_area if c})
+
+    rows = []
+    for house_type in types:
+        type_avg = type_area_sum[house_type] / type_area_n[house_type] if type_area_n[house_type] else None
+        for city in cities:
+            rows.append({
+                'type': house_type,
+                'city': city,
+                'area': cell_area.get((house_type, city)) or type_avg or global_area,
+                'direct': cell_direct.get((house_type, city))
+                          or type_direct.get((house_type,)) or global_direct
+            })
+    return types, cities, pd.DataFrame(rows, columns=FEATURES)
+
+
+def predict_price_grid():
+    """
+    一次向量化预测全部 房型×城市 格子
+
+    Returns:
+        dict: types / cities / predictions({房型: [各城市价格]}) / model_version
+    """
+    model, meta = registry.load()
+    types, cities, grid = build_prediction_grid()
+
+    predictions = {house_type: [] for house_type in types}
+    if len(grid):
+        prices = model.predict(grid)
+        for house_type, price in zip(grid['type'], prices):
+            predictions[house_type].append(round(float(price), 2))
+
+    return {
+        'types': types,
+        'cities': cities,
+        'predictions': predictions,
+        'model_version': meta.get('version')
+    }
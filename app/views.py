@@ -5,13 +5,8 @@ from collections import defaultdict
 from django.shortcuts import render, redirect
 from app.models import House, User, Histroy
 from app.utils import getHistoryTableData
+from app.utils import price_model
 from django.http import JsonResponse
-import pandas as pd
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.preprocessing import OneHotEncoder
-from sklearn.compose import ColumnTransformer
-from sklearn.pipeline import Pipeline
-import joblib
 from django.db.models import Avg, Count, Min, Max
 
 # Create your views here.
@@ -424,105 +419,41 @@ def servicemoney(request):
 
 
 def train_house_model(request):
-    # 获取所有房源数据
-    queryset = House.objects.all().values()
-    data = pd.DataFrame.from_records(queryset)
-
-    if data.empty:
+    # 训练在后台线程中进行（多核），请求立即返回；也可用 python manage.py train_price_model
+    if not House.objects.exists():
         return JsonResponse({'error': 'No data available'}, status=400)
 
-    # 定义特征和目标
-    features = ['type', 'city', 'area', 'direct']
-    X = data[features]
-    y = data['price']
-
-    # 数据预处理：对分类变量进行编码
-    categorical_features = ['type', 'city', 'direct']
-    preprocessor = ColumnTransformer(
-        transformers=[
-            ('cat', OneHotEncoder(handle_unknown='ignore'), categorical_features)
-        ])
+    started = price_model.train_in_background()
+    status = price_model.training_status()
+    if started:
+        return JsonResponse({'status': 'Model training started', **status}, status=202)
+    return JsonResponse({'status': 'Model training already running', **status}, status=409)
 
-    # 创建模型管道
-    model = Pipeline(steps=[
-        ('preprocessor', preprocessor),
-        ('regressor', RandomForestRegressor(n_estimators=100))
-    ])
 
-    # 训练模型
-    model.fit(X, y)
+def train_model_status(request):
+    return JsonResponse(price_model.training_status())
 
-    # 保存模型到文件
-    joblib.dump(model, 'house_price_model.joblib')
 
-    return JsonResponse({'status': 'Model trained successfully'})
+def predict_price_grid_api(request):
+    # 整个 房型×城市 网格一次向量化预测
+    try:
+        result = price_model.predict_price_grid()
+    except FileNotFoundError:
+        return JsonResponse({'error': 'Model not found. Train the model first.'}, status=404)
+    return JsonResponse(result)
 
 
 def predict_all_prices(request):
     username = request.session['username'].get('username')
     useravatar = request.session['username'].get('avatar')
     try:
-        model = joblib.load('house_price_model.joblib')
+        # 模型在进程内只加载一次，整个网格一次predict
+        result = price_model.predict_price_grid()
     except FileNotFoundError:
         return JsonResponse({'error': 'Model not found. Train the model first.'}, status=404)
 
-    # 获取排序后的唯一值（确保顺序一致）
-    all_cities = sorted(House.objects.values_list('city', flat=True).distinct())
-    all_types = sorted(House.objects.values_list('type', flat=True).distinct())
-
-    # 预加载全局统计数据
-    global_stats = {
-        'avg_area': House.objects.aggregate(avg=Avg('area'))['avg'] or 0,
-        'common_direct': House.objects.values('direct').annotate(
-            count=Count('direct')).order_by('-count').first()['direct'] or '未知'
-    }
-
-    # 批量预加载每个类型的统计数据
-    type_stats = {}
-    for house_type in all_types:
-        type_data = House.objects.filter(type=house_type)
-        type_stats[house_type] = {
-            'avg_area': type_data.aggregate(avg=Avg('area'))['avg'] or global_stats['avg_area'],
-            'common_direct': type_data.values('direct').annotate(
-                count=Count('direct')).order_by('-count').first()['direct'] or global_stats['common_direct']
-        }
-
-    # 生成预测结果字典
-    predictions = {}
-    for house_type in all_types:
-        price_list = []
-        for city in all_cities:  # 按固定顺序遍历城市
-            # 获取特征值（使用三级回退策略）
-            city_data = House.objects.filter(type=house_type, city=city)
-
-            if city_data.exists():
-                area = city_data.aggregate(avg=Avg('area'))['avg']
-                direct = city_data.values('direct').annotate(
-                    count=Count('direct')).order_by('-count').first()['direct']
-            else:
-                area = type_stats[house_type]['avg_area']
-                direct = type_stats[house_type]['common_direct']
-
-            # 最终处理空值
-            final_area = area or global_stats['avg_area']
-            final_direct = direct or global_stats['common_direct']
-
-            # 构建输入数据
-            input_data = pd.DataFrame([{
-                'type': house_type,
-                'city': city,
-                'area': final_area,
-                'direct': final_direct
-            }])
-
-            # 执行预测
-            try:
-                predicted_price = round(float(model.predict(input_data)[0]), 2)
-            except Exception as e:
-                predicted_price = 0.00  # 错误兜底值
-            price_list.append(predicted_price)
-        predictions[house_type] = price_list
-    context = {'username': username, 'useravatar':useravatar,'predictions': predictions,'cities': all_cities,'types': all_types}
+    context = {'username': username, 'useravatar': useravatar, 'predictions': result['predictions'],
+               'cities': result['cities'], 'types': result['types']}
     return render(request, 'pricePredict.html', context)
 
 def heatmap_analysis(request):
@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+"""
+共享缓存后端
+多个Web进程（gunicorn worker）共用一份缓存，聚合结果只计算一次：
+- TieredCache: 进程内L1（短TTL、LRU）+ 共享L2（Redis或SQLiteCache），
+  大值压缩后写入L2，并按命名空间（缓存键第一个冒号之前的部分）统计写入量和命中情况
+- SQLiteCache: 单机部署时的共享缓存，多个进程通过同一个SQLite文件（WAL模式）共享，
+  add/incr 在事务中执行，可用于单飞锁和标签代数
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict, defaultdict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# 编码后的值前缀：原始pickle / zlib压缩的pickle
+RAW_MARKER = b'P'
+COMPRESSED_MARKER = b'Z'
+
+
+def cache_namespace(key):
+    """缓存键的命名空间，如 house_stats:xxx -> house_stats"""
+    return str(key).split(':', 1)[0]
+
+
+class SQLiteCache(BaseCache):
+    """
+    基于SQLite文件的共享缓存
+
+    OPTIONS:
+        MAX_SIZE: 缓存文件中值的总字节数上限，超出后先删除过期项，再按过期时间从早到晚淘汰
+        CULL_EVERY: 每写入多少次检查一次容量
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._max_size = options.get('MAX_SIZE', 256 * 1024 * 1024)
+        self._cull_every = options.get('CULL_EVERY', 200)
+        self._writes = 0
+        self._local = threading.local()
+
+    def _connection(self):
+        # 每个线程/进程使用自己的连接（fork后的子进程重新连接）
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self._path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache_entries ('
+                'key TEXT PRIMARY KEY, namespace TEXT, value BLOB, expires REAL, size INTEGER)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS cache_entries_expires ON cache_entries (expires)')
+            conn.execute('CREATE INDEX IF NOT EXISTS cache_entries_namespace ON cache_entries (namespace)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _expires(self, timeout):
+        # get_backend_timeout 返回过期的时间戳（None表示永不过期）
+        expires = self.get_backend_timeout(timeout)
+        return float('inf') if expires is None else expires
+
+    def _write(self, conn, key, raw_key, value, timeout):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        conn.execute(
+            'INSERT OR REPLACE INTO cache_entries (key, namespace, value, expires, size) VALUES (?, ?, ?, ?, ?)',
+            (key, cache_namespace(raw_key), data, self._expires(timeout), len(data))
+        )
+
+    def _read(self, conn, key):
+        row = conn.execute('SELECT value, expires FROM cache_entries WHERE key = ?', (key,)).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return pickle.loads(row[0])
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        cache_key = self.make_and_validate_key(key, version=version)
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if self._read(conn, cache_key) is not None:
+                conn.execute('COMMIT')
+                return False
+            self._write(conn, cache_key, key, value, timeout)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._maybe_cull()
+        return True
+
+    def get(self, key, default=None, version=None):
+        cache_key = self.make_and_validate_key(key, version=version)
+        value = self._read(self._connection(), cache_key)
+        return default if value is None else value
+
+    def get_many(self, keys, version=None):
+        key_map = {self.make_and_validate_key(key, version=version): key for key in keys}
+        if not key_map:
+            return {}
+        placeholders = ','.join('?' * len(key_map))
+        rows = self._connection().execute(
+            f'SELECT key, value FROM cache_entries WHERE key IN ({placeholders}) AND expires > ?',
+            (*key_map, time.time())
+        ).fetchall()
+        return {key_map[key]: pickle.loads(value) for key, value in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        cache_key = self.make_and_validate_key(key, version=version)
+        self._write(self._connection(), cache_key, key, value, timeout)
+        self._maybe_cull()
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        cache_key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute(
+            'UPDATE cache_entries SET expires = ? WHERE key = ? AND expires > ?',
+            (self._expires(timeout), cache_key, time.time())
+        )
+        return cursor.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        cache_key = self.make_and_validate_key(key, version=version)
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT value, expires FROM cache_entries WHERE key = ? AND expires > ?', (cache_key, time.time())
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            conn.execute('UPDATE cache_entries SET value = ?, size = ? WHERE key = ?', (data, len(data), cache_key))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return value
+
+    def delete(self, key, version=None):
+        cache_key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute('DELETE FROM cache_entries WHERE key = ?', (cache_key,))
+        return cursor.rowcount > 0
+
+    def has_key(self, key, version=None):
+        cache_key = self.make_and_validate_key(key, version=version)
+        return self._connection().execute(
+            'SELECT 1 FROM cache_entries WHERE key = ? AND expires > ?', (cache_key, time.time())
+        ).fetchone() is not None
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache_entries')
+
+    def _maybe_cull(self):
+        self._writes += 1
+        if self._writes % self._cull_every:
+            return
+        conn = self._connection()
+        conn.execute('DELETE FROM cache_entries WHERE expires <= ?', (time.time(),))
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM cache_entries').fetchone()[0]
+        if total <= self._max_size:
+            return
+        # 按过期时间从早到晚淘汰，直到回到上限的90%
+        excess = total - int(self._max_size * 0.9)
+        removed = 0
+        for key, size in conn.execute('SELECT key, size FROM cache_entries ORDER BY expires').fetchall():
+            if removed >= excess:
+                break
+            conn.execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+            removed += size
+
+    def namespace_sizes(self):
+        """各命名空间当前的条目数和字节数"""
+        rows = self._connection().execute(
+            'SELECT namespace, COUNT(*), SUM(size) FROM cache_entries WHERE expires > ? GROUP BY namespace',
+            (time.time(),)
+        ).fetchall()
+        return {namespace: {'entries': count, 'bytes': size or 0} for namespace, count, size in rows}
+
+
+# 进程内的L1存储与命名空间统计：{名称: (OrderedDict, 锁, 统计, 统计锁)}
+_local_stores = {}
+
+
+class TieredCache(BaseCache):
+    """
+    两级缓存：进程内L1 + 共享L2（settings.CACHES中SHARED_ALIAS指定的后端）
+
+    L1只缓存读取结果且TTL很短，跨进程一致性由L2保证；add/incr/delete直接作用于L2，
+    因此单飞锁和标签代数在所有进程间共享（L1_EXCLUDE中的键前缀和锁键不进入L1）
+
+    OPTIONS:
+        SHARED_ALIAS: 共享后端的别名
+        L1_TIMEOUT: L1最长保留时间（秒）
+        L1_MAX_ENTRIES: L1条目上限（LRU淘汰）
+        L1_EXCLUDE: 不进入L1的键前缀
+        COMPRESS_MIN_SIZE: 序列化后超过该字节数的值压缩后写入L2
+        COMPRESS_LEVEL: zlib压缩级别
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = options.get('SHARED_ALIAS', 'shared')
+        self._l1_timeout = options.get('L1_TIMEOUT', 5)
+        self._l1_max_entries = options.get('L1_MAX_ENTRIES', 1000)
+        self._l1_exclude = tuple(options.get('L1_EXCLUDE', ('cache_tag:',)))
+        self._compress_min_size = options.get('COMPRESS_MIN_SIZE', 1024)
+        self._compress_level = options.get('COMPRESS_LEVEL', 6)
+        # Django为每个线程创建一个后端实例，L1和统计按名称在进程内共享（与LocMemCache相同）
+        self._l1, self._l1_lock, self._stats, self._stats_lock = _local_stores.setdefault(
+            location or self._shared_alias,
+            (OrderedDict(), threading.Lock(), defaultdict(lambda: defaultdict(int)), threading.Lock())
+        )
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    # 编码：整数原样保存（L2的incr需要），其他值pickle，超过阈值时压缩
+
+    def _encode(self, value):
+        """返回 (写入L2的值, 压缩前字节数)"""
+        if type(value) is int:
+            return value, 0
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) >= self._compress_min_size:
+            compressed = zlib.compress(data, self._compress_level)
+            if len(compressed) < len(data):
+                return COMPRESSED_MARKER + compressed, len(data)
+        return RAW_MARKER + data, len(data)
+
+    @staticmethod
+    def _decode(stored):
+        if isinstance(stored, bytes):
+            if stored[:1] == COMPRESSED_MARKER:
+                return pickle.loads(zlib.decompress(stored[1:]))
+            if stored[:1] == RAW_MARKER:
+                return pickle.loads(stored[1:])
+        return stored
+
+    def _count(self, key, **increments):
+        with self._stats_lock:
+            counters = self._stats[cache_namespace(key)]
+            for name, value in increments.items():
+                counters[name] += value
+
+    def _account_write(self, key, stored, raw_size):
+        if isinstance(stored, bytes):
+            self._count(key, writes=1, bytes_written=len(stored), raw_bytes_written=raw_size,
+                        compressed_writes=int(stored[:1] == COMPRESSED_MARKER))
+        else:
+            self._count(key, writes=1)
+
+    # L1
+
+    def _l1_enabled(self, key):
+        return self._l1_timeout > 0 and not str(key).endswith(':lock') and not str(key).startswith(self._l1_exclude)
+
+    def _l1_get(self, key, version):
+        l1_key = self.make_and_validate_key(key, version=version)
+        with self._l1_lock:
+            item = self._l1.get(l1_key)
+            if item is None:
+                return None
+            if item[1] <= time.monotonic():
+                del self._l1[l1_key]
+                return None
+            self._l1.move_to_end(l1_key)
+            return item[0]
+
+    def _l1_set(self, key, stored, timeout, version):
+        if not self._l1_enabled(key):
+            return
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        ttl = self._l1_timeout if timeout is None else min(self._l1_timeout, timeout)
+        if ttl <= 0:
+            return
+        l1_key = self.make_and_validate_key(key, version=version)
+        with self._l1_lock:
+            self._l1[l1_key] = (stored, time.monotonic() + ttl)
+            self._l1.move_to_end(l1_key)
+            while len(self._l1) > self._l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_delete(self, key, version):
+        l1_key = self.make_and_validate_key(key, version=version)
+        with self._l1_lock:
+            self._l1.pop(l1_key, None)
+
+    # 缓存接口
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        stored, raw_size = self._encode(value)
+        added = self.shared.add(key, stored, timeout=timeout, version=version)
+        if added:
+            self._account_write(key, stored, raw_size)
+            self._l1_delete(key, version)
+        return added
+
+    def get(self, key, default=None, version=None):
+        if self._l1_enabled(key):
+            stored = self._l1_get(key, version)
+            if stored is not None:
+                self._count(key, l1_hits=1)
+                return self._decode(stored)
+        return self.get_shared(key, default, version)
+
+    def get_shared(self, key, default=None, version=None):
+        """跳过L1直接读取L2（并刷新L1），用于L1中的值可能已被其他进程更新的场景"""
+        stored = self.shared.get(key, version=version)
+        if stored is None:
+            self._count(key, misses=1)
+            return default
+        self._count(key, l2_hits=1)
+        self._l1_set(key, stored, self.default_timeout, version)
+        return self._decode(stored)
+
+    def get_many(self, keys, version=None):
+        result = {}
+        remaining = []
+        for key in keys:
+            stored = self._l1_get(key, version) if self._l1_enabled(key) else None
+            if stored is None:
+                remaining.append(key)
+            else:
+                self._count(key, l1_hits=1)
+                result[key] = self._decode(stored)
+        if remaining:
+            found = self.shared.get_many(remaining, version=version)
+            for key in remaining:
+                if key in found:
+                    self._count(key, l2_hits=1)
+                    self._l1_set(key, found[key], self.default_timeout, version)
+                    result[key] = self._decode(found[key])
+                else:
+                    self._count(key, misses=1)
+        return result
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        stored, raw_size = self._encode(value)
+        self.shared.set(key, stored, timeout=timeout, version=version)
+        self._account_write(key, stored, raw_size)
+        self._l1_set(key, stored, timeout, version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l1_delete(key, version)
+        return self.shared.touch(key, timeout=timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self._l1_delete(key, version)
+        return self.shared.incr(key, delta, version=version)
+
+    def delete(self, key, version=None):
+        self._l1_delete(key, version)
+        return self.shared.delete(key, version=version)
+
+    def has_key(self, key, version=None):
+        if self._l1_enabled(key) and self._l1_get(key, version) is not None:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def clear(self):
+        with self._l1_lock:
+            self._l1.clear()
+        self.shared.clear()
+
+    def clear_local(self):
+        """只清空本进程的L1"""
+        with self._l1_lock:
+            self._l1.clear()
+
+    def namespace_stats(self):
+        """
+        按命名空间的缓存统计
+
+        Returns:
+            dict: {命名空间: 本进程的L1/L2命中、未命中、写入次数和写入字节数（压缩前后），
+                   以及共享后端能提供时的当前条目数/字节数}
+        """
+        with self._stats_lock:
+            stats = {namespace: dict(counters) for namespace, counters in self._stats.items()}
+        sizes = getattr(self.shared, 'namespace_sizes', None)
+        if sizes is not None:
+            for namespace, size in sizes().items():
+                stats.setdefault(namespace, {}).update(
+                    stored_entries=size['entries'], stored_bytes=size['bytes']
+                )
+        return stats
@@ -2,87 +2,441 @@
 """
 缓存工具模块
 提供查询结果缓存功能
+
+标签失效：每个缓存结果声明它依赖的标签（如 houses、houses:city=天河、users），
+缓存中为每个标签保存一个代数，写入方只需递增相关标签的代数，
+依赖旧代数的缓存项在读取时即视为未命中，无需清空整个缓存
 """
 
-from django.core.cache import cache
+from django.core.cache import cache, caches
 from django.views.decorators.cache import cache_page
+from collections import defaultdict
+from contextlib import contextmanager
 from functools import wraps
 import hashlib
 import json
+import math
+import random
+import threading
 import time
+import uuid
+
+from mongodb_integration.stats_rollup import extract_groups
+
+# 标签代数在缓存中的键前缀
+TAG_KEY_PREFIX = 'cache_tag'
+
+# 等待其他调用方重算结果时的轮询间隔（秒）
+LOCK_POLL_INTERVAL = 0.05
+
+# 房源相关标签：任意房源变化 / 某城市房源变化 / 无法确定城市的批量变化
+HOUSES_TAG = 'houses'
+HOUSES_ALL_TAG = 'houses:all'
+USERS_TAG = 'users'
+
+
+def city_tag(city):
+    return f"{HOUSES_TAG}:city={city}"
+
+
+def user_tag(username):
+    return f"{USERS_TAG}:name={username}"
+
+
+def history_tag(username):
+    return f"history:user={username}"
+
+
+def house_tags(city=None):
+    """
+    读取方的房源依赖标签
+
+    按城市过滤的结果只依赖该城市（以及全量变更），其他城市的新房源不会使其失效
+    """
+    if city:
+        return [city_tag(city), HOUSES_ALL_TAG]
+    return [HOUSES_TAG]
+
+
+def house_write_tags(doc=None):
+    """
+    写入方需要递增的房源标签
+
+    Args:
+        doc: 被写入/删除的房源（HouseDocument或原始文档）；为None表示范围未知的批量变更
+    """
+    city = None
+    if doc is not None:
+        city = dict(extract_groups(doc)).get('city')
+    if city:
+        return [HOUSES_TAG, city_tag(city)]
+    return [HOUSES_TAG, HOUSES_ALL_TAG]
+
+
+def _tag_key(tag):
+    return f"{TAG_KEY_PREFIX}:{hashlib.md5(tag.encode()).hexdigest()}"
+
+
+def _initial_version():
+    # 以当前时间（纳秒）作为初始代数：标签被淘汰后重建的代数必然大于之前的任何代数
+    return time.time_ns()
+
+
+def get_tag_versions(tags):
+    """
+    读取标签的当前代数，不存在的标签即时初始化
+
+    Returns:
+        dict: {标签: 代数}
+    """
+    keys = {_tag_key(tag): tag for tag in tags}
+    found = cache.get_many(list(keys))
+    versions = {}
+    for key, tag in keys.items():
+        if key not in found:
+            cache.add(key, _initial_version(), None)
+            found[key] = cache.get(key)
+        versions[tag] = found[key]
+    return versions
+
 
-def cache_query_result(timeout=300, key_prefix='query'):
+def bump_tags(*tags):
+    """
+    递增标签代数，使依赖这些标签的缓存项全部失效
+
+    Returns:
+        bool: 是否成功
+    """
+    try:
+        for tag in set(tags):
+            key = _tag_key(tag)
+            try:
+                cache.incr(key)
+            except ValueError:
+                # 标签还没有被任何缓存项读取过（或已被淘汰），初始化即等同于失效
+                cache.add(key, _initial_version(), None)
+        return True
+    except Exception as e:
+        print(f"标签失效失败 {tags}: {e}")
+        return False
+
+
+def _resolve_tags(tags, args, kwargs):
+    if tags is None:
+        return []
+    if callable(tags):
+        tags = tags(*args, **kwargs)
+    return [tags] if isinstance(tags, str) else list(tags or [])
+
+
+def _make_cache_key(func, key_prefix, args, kwargs):
+    cache_key_data = {
+        'func_name': func.__name__,
+        'args': str(args),
+        'kwargs': str(sorted(kwargs.items()))
+    }
+    cache_key_str = json.dumps(cache_key_data, sort_keys=True)
+    return f"{key_prefix}:{hashlib.md5(cache_key_str.encode()).hexdigest()}"
+
+
+# 进程内缓存统计：{key_prefix: {计数项: 值}}
+_stats_lock = threading.Lock()
+_stats = defaultdict(lambda: defaultdict(float))
+
+
+def _record(key_prefix, **increments):
+    with _stats_lock:
+        counters = _stats[key_prefix]
+        for name, value in increments.items():
+            counters[name] += value
+
+
+def _record_recompute(key_prefix, execution_time):
+    with _stats_lock:
+        counters = _stats[key_prefix]
+        counters['recomputes'] += 1
+        counters['recompute_time'] += execution_time
+        counters['recompute_time_max'] = max(counters['recompute_time_max'], execution_time)
+
+
+# 线程本地状态：force_refresh() 范围内的调用跳过缓存直接重算并写回（缓存预热使用）
+_local = threading.local()
+
+# 访问监听：每次经过cache_query_result的调用都会通知，参数为 (key_prefix, func, args, kwargs, timeout)
+_access_listeners = []
+
+
+@contextmanager
+def force_refresh():
+    """在该范围内调用的缓存函数忽略已有结果、重新计算并写入缓存"""
+    previous = getattr(_local, 'force_refresh', False)
+    _local.force_refresh = True
+    try:
+        yield
+    finally:
+        _local.force_refresh = previous
+
+
+def add_access_listener(listener):
+    if listener not in _access_listeners:
+        _access_listeners.append(listener)
+
+
+def _notify_access(key_prefix, func, args, kwargs, timeout):
+    for listener in _access_listeners:
+        try:
+            listener(key_prefix, func, args, kwargs, timeout)
+        except Exception as e:
+            print(f"缓存访问记录失败: {e}")
+
+
+def _get_shared(key):
+    """分层缓存时跳过进程内L1读取共享缓存，其他后端等同cache.get"""
+    backend = caches['default']
+    return getattr(backend, 'get_shared', backend.get)(key)
+
+
+def _read_entry(cache_key, shared=False):
+    entry = _get_shared(cache_key) if shared else cache.get(cache_key)
+    if not isinstance(entry, dict) or 'expires_at' not in entry:
+        return None
+    return entry
+
+
+def _acquire_lock(lock_key, lock_timeout):
+    """跨进程单飞锁：cache.add 只有一个调用方能成功"""
+    token = uuid.uuid4().hex
+    if cache.add(lock_key, token, lock_timeout):
+        return token
+    return None
+
+
+def _release_lock(lock_key, token):
+    if cache.get(lock_key) == token:
+        cache.delete(lock_key)
+
+
+def _should_refresh_early(entry, beta, now):
+    """
+    概率提前刷新（XFetch）：越接近过期、重算越慢，提前刷新的概率越高，
+    使热门键在过期前由单个请求刷新，而不是在过期瞬间同时未命中
+    """
+    if beta <= 0:
+        return False
+    delta = entry.get('delta', 0)
+    return now - delta * beta * math.log(random.random() or 1e-12) >= entry['expires_at']
+
+
+def cache_query_result(timeout=300, key_prefix='query', tags=None, stale_timeout=0,
+                       early_refresh_beta=1.0, lock_timeout=30):
     """
     查询结果缓存装饰器
+
+    同一缓存键同一时间只有一个调用方重算（单飞锁），其余调用方返回旧值或等待结果；
+    过期前按概率提前刷新；过期后stale_timeout内先返回旧值并在后台刷新
     
     Args:
         timeout: 缓存超时时间（秒）
         key_prefix: 缓存键前缀
+        tags: 结果依赖的标签列表，或根据函数参数返回标签列表的函数
+        stale_timeout: 过期后仍可返回旧值的时间（秒），0表示不返回过期值
+        early_refresh_beta: 提前刷新系数，0表示关闭
+        lock_timeout: 重算锁的超时时间（秒），也是其他调用方等待结果的上限
     """
     def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            # 生成缓存键
-            cache_key_data = {
-                'func_name': func.__name__,
-                'args': str(args),
-                'kwargs': str(sorted(kwargs.items()))
-            }
-            cache_key_str = json.dumps(cache_key_data, sort_keys=True)
-            cache_key = f"{key_prefix}:{hashlib.md5(cache_key_str.encode()).hexdigest()}"
-            
-            # 尝试从缓存获取
-            cached_result = cache.get(cache_key)
-            if cached_result is not None:
-                return cached_result
-            
+        def recompute(cache_key, versions, args, kwargs):
             # 执行查询
             start_time = time.time()
             result = func(*args, **kwargs)
             execution_time = time.time() - start_time
+            _record_recompute(key_prefix, execution_time)
             
-            # 存储到缓存
-            cache.set(cache_key, result, timeout)
+            # 存储到缓存（记录查询前读取的代数，查询期间发生的写入会让这一项下次读取时失效）
+            # 缓存项多保留stale_timeout秒，用于过期后返回旧值
+            if result is not None:
+                entry = {
+                    'value': result,
+                    'tags': versions,
+                    'expires_at': time.time() + timeout,
+                    'delta': execution_time,
+                }
+                cache.set(cache_key, entry, timeout + stale_timeout)
             
             # 记录性能信息
             if execution_time > 0.1:  # 超过100ms的查询记录日志
                 print(f"Slow query cached: {func.__name__} took {execution_time:.3f}s")
             
             return result
+
+        def refresh_async(cache_key, lock_key, token, versions, args, kwargs):
+            def run():
+                try:
+                    recompute(cache_key, versions, args, kwargs)
+                except Exception as e:
+                    print(f"后台刷新缓存失败 {func.__name__}: {e}")
+                finally:
+                    _release_lock(lock_key, token)
+
+            threading.Thread(target=run, name=f'cache-refresh-{key_prefix}', daemon=True).start()
+
+        def wait_for_result(cache_key, lock_key, versions):
+            """其他调用方正在重算：等待其写入结果，锁释放或超时后返回None"""
+            deadline = time.time() + lock_timeout
+            while time.time() < deadline:
+                time.sleep(LOCK_POLL_INTERVAL)
+                entry = _read_entry(cache_key, shared=True)
+                if entry is not None and entry.get('tags') == versions and time.time() < entry['expires_at']:
+                    return entry
+                if cache.get(lock_key) is None:
+                    break
+            return None
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            # 生成缓存键
+            cache_key = _make_cache_key(func, key_prefix, args, kwargs)
+            lock_key = f"{cache_key}:lock"
+            
+            # 尝试从缓存获取：依赖标签的代数与写入时一致才算命中
+            result_tags = _resolve_tags(tags, args, kwargs)
+            versions = get_tag_versions(result_tags) if result_tags else {}
+            
+            # 预热：直接重算（其他调用方正在重算时按正常流程等待其结果）
+            if getattr(_local, 'force_refresh', False):
+                token = _acquire_lock(lock_key, lock_timeout)
+                if token:
+                    try:
+                        return recompute(cache_key, versions, args, kwargs)
+                    finally:
+                        _release_lock(lock_key, token)
+            else:
+                _notify_access(key_prefix, func, args, kwargs, timeout)
+            
+            now = time.time()
+            entry = _read_entry(cache_key)
+            if entry is not None and (entry.get('tags') != versions or now >= entry['expires_at']):
+                # 进程内L1中的旧值：以共享缓存中的为准（其他进程可能已经刷新）
+                entry = _read_entry(cache_key, shared=True)
+            
+            if entry is not None and entry.get('tags') == versions:
+                if now < entry['expires_at']:
+                    _record(key_prefix, hits=1)
+                    if _should_refresh_early(entry, early_refresh_beta, now):
+                        token = _acquire_lock(lock_key, lock_timeout)
+                        if token:
+                            _record(key_prefix, early_refreshes=1)
+                            refresh_async(cache_key, lock_key, token, versions, args, kwargs)
+                    return entry['value']
+                
+                # 已过期但仍在stale_timeout内：返回旧值，后台刷新（已有刷新在进行时不重复）
+                token = _acquire_lock(lock_key, lock_timeout)
+                if token:
+                    refresh_async(cache_key, lock_key, token, versions, args, kwargs)
+                _record(key_prefix, stale_hits=1)
+                return entry['value']
+            
+            _record(key_prefix, misses=1)
+            token = _acquire_lock(lock_key, lock_timeout)
+            if token is None:
+                # 其他调用方正在重算：标签失效的旧值可以先返回，否则等待其结果
+                if entry is not None and now < entry['expires_at'] + stale_timeout:
+                    _record(key_prefix, stale_hits=1)
+                    return entry['value']
+                _record(key_prefix, lock_waits=1)
+                waited = wait_for_result(cache_key, lock_key, versions)
+                if waited is not None:
+                    return waited['value']
+                token = _acquire_lock(lock_key, lock_timeout)
+            
+            try:
+                return recompute(cache_key, versions, args, kwargs)
+            finally:
+                if token:
+                    _release_lock(lock_key, token)
         return wrapper
     return decorator
 
-def cache_aggregation_result(timeout=600, key_prefix='agg'):
+def cache_aggregation_result(timeout=600, key_prefix='agg', tags=None, stale_timeout=None):
     """
     聚合查询结果缓存装饰器（更长的缓存时间）
+
+    聚合重算代价高，默认过期后一个周期内先返回旧值、后台刷新
     """
-    return cache_query_result(timeout=timeout, key_prefix=key_prefix)
+    if stale_timeout is None:
+        stale_timeout = timeout
+    return cache_query_result(timeout=timeout, key_prefix=key_prefix, tags=tags, stale_timeout=stale_timeout)
 
 def clear_cache_by_pattern(pattern):
     """
     根据模式清除缓存
+
+    pattern按标签处理：只使依赖该标签的缓存项失效，不再清空整个缓存
     """
-    try:
-        # 注意：这个功能在生产环境中需要Redis等支持模式匹配的缓存后端
-        # 当前使用的LocMemCache不支持模式匹配，这里只是示例
-        cache.clear()  # 简单清除所有缓存
-        return True
-    except Exception as e:
-        print(f"清除缓存失败: {e}")
-        return False
+    return bump_tags(pattern)
+
+def _summarize(counters):
+    hits = int(counters.get('hits', 0))
+    stale_hits = int(counters.get('stale_hits', 0))
+    misses = int(counters.get('misses', 0))
+    recomputes = int(counters.get('recomputes', 0))
+    lookups = hits + stale_hits + misses
+    recompute_time = counters.get('recompute_time', 0.0)
+    return {
+        'hits': hits,
+        'stale_hits': stale_hits,
+        'misses': misses,
+        'hit_rate': round((hits + stale_hits) / lookups, 4) if lookups else 0.0,
+        'early_refreshes': int(counters.get('early_refreshes', 0)),
+        'lock_waits': int(counters.get('lock_waits', 0)),
+        'recomputes': recomputes,
+        'recompute_time': round(recompute_time, 4),
+        'recompute_time_avg': round(recompute_time / recomputes, 4) if recomputes else 0.0,
+        'recompute_time_max': round(counters.get('recompute_time_max', 0.0), 4)
+    }
 
 class CacheManager:
     """缓存管理器"""
     
     @staticmethod
     def get_cache_stats():
-        """获取缓存统计信息"""
+        """
+        获取缓存统计信息（当前进程内cache_query_result的计数）
+
+        Returns:
+            dict: 后端名称、总体命中率，以及按key_prefix分组的
+                  命中/过期命中/未命中/提前刷新/等待锁次数和重算耗时
+        """
         try:
-            # 这里可以添加缓存统计逻辑
-            return {
-                'cache_backend': 'LocMemCache',
-                'status': 'active'
+            with _stats_lock:
+                snapshot = {prefix: dict(counters) for prefix, counters in _stats.items()}
+            
+            namespaces = {}
+            totals = defaultdict(float)
+            for prefix, counters in sorted(snapshot.items()):
+                for name, value in counters.items():
+                    if name == 'recompute_time_max':
+                        totals[name] = max(totals[name], value)
+                    else:
+                        totals[name] += value
+                namespaces[prefix] = _summarize(counters)
+            
+            backend = caches['default']
+            stats = {
+                'cache_backend': type(backend).__name__,
+                'status': 'active',
+                'totals': _summarize(totals),
+                'namespaces': namespaces
             }
+            try:
+                from app_mongo.cache_warmup import warmup_status
+                stats['warmup'] = warmup_status()
+            except Exception as e:
+                stats['warmup'] = {'error': str(e)}
+            # 分层缓存：附带共享后端名称和按命名空间的L1/L2命中与存储量
+            if hasattr(backend, 'namespace_stats'):
+                stats['shared_backend'] = type(backend.shared).__name__
+                stats['storage'] = backend.namespace_stats()
+            return stats
         except Exception as e:
             return {
                 'error': str(e),
@@ -90,28 +444,27 @@ class CacheManager:
             }
     
     @staticmethod
-    def warm_up_cache():
-        """预热缓存"""
+    def warm_up_cache(names=None):
+        """
+        立即预热缓存（全部注册的预热任务，或names指定的任务）
+
+        后台调度见 cache_warmup.WarmupScheduler
+        """
         try:
-            from app_mongo.models import MongoQueryHelper
+            from app_mongo.cache_warmup import prime_all
             
-            # 预热常用查询
             print("开始缓存预热...")
-            
-            # 预热房源统计
-            MongoQueryHelper.get_house_stats()
-            print("✅ 房源统计缓存预热完成")
-            
-            # 预热城市分布
-            MongoQueryHelper.get_city_distribution()
-            print("✅ 城市分布缓存预热完成")
-            
-            # 预热房型分布
-            MongoQueryHelper.get_type_distribution()
-            print("✅ 房型分布缓存预热完成")
+            results = prime_all(names)
+            failed = 0
+            for name, (elapsed, error) in results.items():
+                if error:
+                    failed += 1
+                    print(f"❌ {name} 预热失败: {error}")
+                else:
+                    print(f"✅ {name} 预热完成 ({elapsed:.2f}s)")
             
             print("🎉 缓存预热完成")
-            return True
+            return failed == 0
             
         except Exception as e:
             print(f"❌ 缓存预热失败: {e}")
@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+"""
+缓存预热
+记录哪些缓存键和视图被频繁访问（计数定期合并到共享缓存，重启后仍然有效），
+后台调度线程在进程启动时、缓存过期前以及每批数据入库后重新计算热门结果，
+预热任务在有限的并发预算内执行，多个worker之间通过缓存中的认领键避免重复预热
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache_utils import add_access_listener, force_refresh
+
+logger = logging.getLogger(__name__)
+
+# 共享缓存中的键
+ACCESS_STATS_KEY = 'warmup:access'
+INGEST_KEY = 'warmup:ingest'
+CLAIM_KEY_PREFIX = 'warmup:claim'
+
+# 合并访问计数时旧计数的衰减系数，使长期不访问的键逐渐冷却
+ACCESS_DECAY = 0.9
+
+# 可重放的调用参数序列化后的最大长度
+MAX_SPEC_ARGS_LENGTH = 512
+
+DEFAULT_OPTIONS = {
+    'ENABLED': True,
+    'CONCURRENCY': 2,
+    'INTERVAL': 30,
+    'REFRESH_AHEAD': 0.8,
+    'STARTUP_DELAY': 5,
+    'MAX_TASKS_PER_CYCLE': 10,
+    'HOT_CALL_LIMIT': 20,
+}
+
+# name: 任务名；prime: 无参预热函数；key_prefix: 对应的cache_query_result前缀；
+# views: 依赖该结果的视图(url name)；ttl: 结果有效期（秒，None表示只在启动和入库后预热）；
+# per_process: 结果保存在进程内（每个worker都要预热，不参与跨进程认领）
+WarmupTask = namedtuple('WarmupTask', 'name prime key_prefix views ttl per_process')
+
+_tasks = {}
+_defaults_registered = False
+
+_access_lock = threading.Lock()
+_pending_views = Counter()
+_pending_keys = Counter()
+_pending_calls = {}
+
+
+def get_options():
+    options = dict(DEFAULT_OPTIONS)
+    options.update(getattr(settings, 'CACHE_WARMUP', {}))
+    return options
+
+
+def register_warmup(name, prime, key_prefix=None, views=(), ttl=None, per_process=False):
+    """注册预热任务"""
+    _tasks[name] = WarmupTask(name, prime, key_prefix, tuple(views), ttl, per_process)
+
+
+def _register_defaults():
+    """仪表板依赖的聚合结果（首次使用时注册，避免导入时加载模型）"""
+    global _defaults_registered
+    if _defaults_registered:
+        return
+    _defaults_registered = True
+
+    from mongodb_integration.mongodb_config import get_database
+    from .dashboard_snapshot import SNAPSHOT_MAX_AGE, refresh_dashboard_snapshot
+    from .models import MongoQueryHelper
+    from .price_impact import PRICE_IMPACT_TIMEOUT, get_price_impact_data
+    from .price_matrix import get_price_matrix
+    from .viz_data import FRAME_MAX_AGE, prime_houses_frame
+
+    register_warmup('dashboard_snapshot', refresh_dashboard_snapshot,
+                    views=('mongo_index',), ttl=SNAPSHOT_MAX_AGE)
+    register_warmup('house_stats', MongoQueryHelper.get_house_stats, key_prefix='house_stats', ttl=600)
+    register_warmup('city_dist', MongoQueryHelper.get_city_distribution, key_prefix='city_dist', ttl=600)
+    register_warmup('type_dist', MongoQueryHelper.get_type_distribution, key_prefix='type_dist', ttl=600)
+    register_warmup('price_impact', get_price_impact_data, key_prefix='price_impact',
+                    views=('mongo_service_money',), ttl=PRICE_IMPACT_TIMEOUT)
+    register_warmup('price_matrix', lambda: get_price_matrix(get_database()['houses']),
+                    views=('mongo_predict_all_prices', 'mongo_price_predict_alt', 'mongo_price_matrix_api'))
+    register_warmup('viz_frame', lambda: prime_houses_frame(get_database()),
+                    views=('python_dashboard', 'static_charts_page', 'interactive_charts_page',
+                           'chart_api', 'chart_batch_api', 'mongo_heatmap_analysis'),
+                    ttl=FRAME_MAX_AGE, per_process=True)
+
+
+def get_tasks():
+    _register_defaults()
+    return dict(_tasks)
+
+
+# 访问记录
+
+def record_view(view_name):
+    """记录一次视图访问（由中间件调用）"""
+    with _access_lock:
+        _pending_views[view_name] += 1
+
+
+def _call_spec(func, args, kwargs):
+    """模块级函数且参数可JSON序列化时，返回可在预热时重放的调用描述"""
+    if '<locals>' in func.__qualname__:
+        return None
+    try:
+        arguments = json.dumps([list(args), kwargs], sort_keys=True, ensure_ascii=False)
+    except (TypeError, ValueError):
+        return None
+    if len(arguments) > MAX_SPEC_ARGS_LENGTH:
+        return None
+    return {'module': func.__module__, 'qualname': func.__qualname__, 'arguments': arguments}
+
+
+def _record_key_access(key_prefix, func, args, kwargs, timeout):
+    spec = _call_spec(func, args, kwargs)
+    with _access_lock:
+        _pending_keys[key_prefix] += 1
+        if spec is not None:
+            spec_id = hashlib.md5(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+            entry = _pending_calls.setdefault(
+                spec_id, dict(spec, key_prefix=key_prefix, ttl=timeout, count=0)
+            )
+            entry['count'] += 1
+
+
+add_access_listener(_record_key_access)
+
+
+def flush_access_stats(hot_call_limit=None):
+    """
+    把本进程的访问计数合并到共享缓存
+
+    Returns:
+        dict: 合并后的访问统计 {'views': {...}, 'keys': {...}, 'calls': {spec_id: spec}}
+    """
+    hot_call_limit = hot_call_limit or get_options()['HOT_CALL_LIMIT']
+    with _access_lock:
+        views, keys, calls = dict(_pending_views), dict(_pending_keys), dict(_pending_calls)
+        _pending_views.clear()
+        _pending_keys.clear()
+        _pending_calls.clear()
+
+    stats = cache.get(ACCESS_STATS_KEY) or {'views': {}, 'keys': {}, 'calls': {}}
+    if not (views or keys or calls):
+        return stats
+
+    for section, counts in (('views', views), ('keys', keys)):
+        merged = {name: count * ACCESS_DECAY for name, count in stats[section].items()}
+        for name, count in counts.items():
+            merged[name] = merged.get(name, 0) + count
+        stats[section] = {name: count for name, count in merged.items() if count >= 0.5}
+
+    merged_calls = {}
+    for spec_id, spec in stats['calls'].items():
+        merged_calls[spec_id] = dict(spec, count=spec['count'] * ACCESS_DECAY)
+    for spec_id, spec in calls.items():
+        count = merged_calls.get(spec_id, {}).get('count', 0) + spec['count']
+        merged_calls[spec_id] = dict(spec, count=count)
+    ranked = sorted(merged_calls.items(), key=lambda item: item[1]['count'], reverse=True)
+    stats['calls'] = dict(ranked[:hot_call_limit])
+
+    cache.set(ACCESS_STATS_KEY, stats, None)
+    return stats
+
+
+def notify_ingest():
+    """一批房源入库后调用：各进程的调度线程据此重新预热"""
+    try:
+        cache.incr(INGEST_KEY)
+    except ValueError:
+        cache.add(INGEST_KEY, 1, None)
+
+
+# 预热任务
+
+Job = namedtuple('Job', 'name run ttl per_process score')
+
+
+def _replay(spec):
+    target = import_module(spec['module'])
+    for part in spec['qualname'].split('.'):
+        target = getattr(target, part)
+    args, kwargs = json.loads(spec['arguments'])
+    return lambda: target(*args, **kwargs)
+
+
+def hot_jobs(stats=None):
+    """
+    按访问热度排序的预热任务：有访问记录的注册任务和热门的可重放调用；
+    还没有任何访问记录时（首次部署）预热全部注册任务
+    """
+    stats = stats or {'views': {}, 'keys': {}, 'calls': {}}
+    tasks = get_tasks()
+    jobs = []
+    for task in tasks.values():
+        score = stats['keys'].get(task.key_prefix, 0) + sum(stats['views'].get(view, 0) for view in task.views)
+        if score > 0 or not (stats['views'] or stats['keys']):
+            jobs.append(Job(task.name, task.prime, task.ttl, task.per_process, score))
+
+    task_prefixes = {task.key_prefix for task in tasks.values() if task.key_prefix}
+    for spec_id, spec in stats['calls'].items():
+        if spec['key_prefix'] in task_prefixes:
+            continue
+        try:
+            jobs.append(Job(f"call:{spec_id}", _replay(spec), spec.get('ttl'), False, spec['count']))
+        except Exception as e:
+            logger.debug(f"无法重放缓存调用 {spec.get('qualname')}: {e}")
+    return sorted(jobs, key=lambda job: job.score, reverse=True)
+
+
+def _run_job(job):
+    started = time.time()
+    try:
+        with force_refresh():
+            job.run()
+        return job.name, time.time() - started, None
+    except Exception as e:
+        return job.name, time.time() - started, str(e)
+
+
+def run_jobs(jobs, concurrency=None, claim=None):
+    """
+    在并发预算内执行预热任务
+
+    Args:
+        jobs: Job列表
+        concurrency: 同时执行的任务数
+        claim: 函数 job -> (认领键, 超时)；认领失败（其他进程已在该窗口内预热）的任务跳过
+
+    Returns:
+        dict: {任务名: (耗时, 错误信息)}
+    """
+    concurrency = concurrency or get_options()['CONCURRENCY']
+    selected = []
+    for job in jobs:
+        if claim is not None and not job.per_process:
+            claim_key, claim_timeout = claim(job)
+            if not cache.add(claim_key, os.getpid(), claim_timeout):
+                continue
+        selected.append(job)
+    if not selected:
+        return {}
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='cache-warmup') as executor:
+        for name, elapsed, error in executor.map(_run_job, selected):
+            results[name] = (elapsed, error)
+            if error:
+                logger.warning(f"缓存预热失败 {name}: {error}")
+            else:
+                logger.info(f"缓存预热完成 {name}: {elapsed:.2f}s")
+    return results
+
+
+def prime_all(names=None, concurrency=None):
+    """立即预热（忽略认领和热度），names为空时预热全部注册任务"""
+    tasks = get_tasks()
+    jobs = [
+        Job(task.name, task.prime, task.ttl, task.per_process, 0)
+        for task in tasks.values() if not names or task.name in names
+    ]
+    return run_jobs(jobs, concurrency)
+
+
+class WarmupScheduler:
+    """
+    后台预热调度
+
+    - 启动：STARTUP_DELAY秒后预热热门任务
+    - 过期前：每INTERVAL秒检查一次，距上次预热超过 ttl*REFRESH_AHEAD 的热门任务重新预热
+    - 入库后：共享缓存中的入库计数变化时预热全部热门任务
+    每轮最多执行MAX_TASKS_PER_CYCLE个任务，并发数为CONCURRENCY
+    """
+
+    def __init__(self, options=None):
+        self.options = options or get_options()
+        self._last_primed = {}
+        self._ingest_version = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_results = {}
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='cache-warmup-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        if self._stop.wait(self.options['STARTUP_DELAY']):
+            return
+        self.run_cycle(startup=True)
+        while not self._stop.wait(self.options['INTERVAL']):
+            self.run_cycle()
+
+    def _claim(self, window):
+        def claim(job):
+            if window is not None:
+                return f"{CLAIM_KEY_PREFIX}:{job.name}:{window}", self.options['INTERVAL'] * 10
+            gap = job.ttl * self.options['REFRESH_AHEAD'] if job.ttl else self.options['INTERVAL']
+            return f"{CLAIM_KEY_PREFIX}:{job.name}", max(int(gap), 1)
+        return claim
+
+    def run_cycle(self, startup=False):
+        try:
+            stats = flush_access_stats(self.options['HOT_CALL_LIMIT'])
+            jobs = hot_jobs(stats)
+
+            ingest_version = cache.get(INGEST_KEY) or 0
+            ingested = self._ingest_version is not None and ingest_version != self._ingest_version
+            self._ingest_version = ingest_version
+
+            now = time.time()
+            if startup or ingested:
+                due = jobs
+            else:
+                due = [
+                    job for job in jobs
+                    if job.ttl and now - self._last_primed.get(job.name, 0) >= job.ttl * self.options['REFRESH_AHEAD']
+                ]
+            due = due[:self.options['MAX_TASKS_PER_CYCLE']]
+            if not due:
+                return {}
+
+            window = f"ingest:{ingest_version}" if ingested else None
+            results = run_jobs(due, self.options['CONCURRENCY'], claim=self._claim(window))
+            for job in due:
+                self._last_primed[job.name] = now
+            self.last_results = results
+            return results
+        except Exception as e:
+            logger.error(f"缓存预热调度失败: {e}")
+            return {}
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start_warmup_scheduler():
+    """
+    启动进程内的预热调度线程（settings.CACHE_WARMUP['ENABLED']为False时不启动）
+
+    由 CacheWarmupMiddleware 在加载时调用，因此只有处理请求的Web进程会启动调度，
+    管理命令和脚本不会
+    """
+    global _scheduler
+    options = get_options()
+    if not options['ENABLED']:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = WarmupScheduler(options)
+            _scheduler.start()
+    return _scheduler
+
+
+def warmup_status():
+    """预热状态（用于缓存统计）"""
+    stats = cache.get(ACCESS_STATS_KEY) or {'views': {}, 'keys': {}, 'calls': {}}
+    return {
+        'scheduler_running': _scheduler is not None,
+        'last_results': dict(_scheduler.last_results) if _scheduler else {},
+        'hot_views': dict(Counter(stats['views']).most_common(10)),
+        'hot_keys': dict(Counter(stats['keys']).most_common(10)),
+        'hot_calls': [f"{spec['qualname']}{spec['arguments']}" for spec in stats['calls'].values()],
+    }
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+渲染结果缓存
+图表按 (图表类型, 参数, 数据版本) 生成缓存键，渲染结果（PNG字节或Plotly HTML）按内容摘要存储：
+内存层和磁盘层都按LRU淘汰并限制总大小，相同内容只保存一份，通过URL + ETag 提供给浏览器
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+Artifact = namedtuple('Artifact', ['digest', 'content_type', 'body'])
+
+CONTENT_EXTENSIONS = {
+    'image/png': 'png',
+    'text/html; charset=utf-8': 'html',
+}
+EXTENSION_TYPES = {ext: content_type for content_type, ext in CONTENT_EXTENSIONS.items()}
+
+DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+
+_DATA_URI_PREFIX = 'data:image/png;base64,'
+
+
+def chart_cache_key(chart_type, params, data_version):
+    """(图表类型, 参数, 数据版本) -> 缓存键"""
+    raw = json.dumps([chart_type, params or {}, data_version], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def encode_chart(result):
+    """
+    ChartGenerator 的返回值 -> (字节, content_type)
+
+    静态图表返回 data:image/png;base64 字符串，交互式图表返回HTML
+    """
+    if result.startswith(_DATA_URI_PREFIX):
+        return base64.b64decode(result[len(_DATA_URI_PREFIX):]), 'image/png'
+    return result.encode('utf-8'), 'text/html; charset=utf-8'
+
+
+class ChartArtifactCache:
+    """
+    两级图表缓存
+
+    内存层：OrderedDict 维护LRU顺序，按字节数限制
+    磁盘层：<目录>/blobs/<摘要>.<扩展名> 保存内容，<目录>/keys/<缓存键> 记录键到摘要的映射，
+           读取时更新文件修改时间，超过大小上限时删除最久未访问的内容，
+           并同步删除指向这些内容的键文件；键文件数超过上限时删除最久未访问的键
+    """
+
+    def __init__(self, directory, memory_limit=64 * 1024 * 1024, disk_limit=512 * 1024 * 1024,
+                 key_limit=100000):
+        self.directory = directory
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self.key_limit = key_limit
+        self._keys = OrderedDict()      # 缓存键 -> 摘要
+        self._blobs = OrderedDict()     # 摘要 -> (content_type, body)
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0}
+        os.makedirs(os.path.join(directory, 'blobs'), exist_ok=True)
+        os.makedirs(os.path.join(directory, 'keys'), exist_ok=True)
+        # 磁盘键文件数，写入新键时递增，超过上限时重新扫描目录
+        self._key_files = sum(1 for _ in os.scandir(os.path.join(directory, 'keys')))
+
+    # ---- 内存层 ----
+
+    def _remember(self, key, digest, content_type, body):
+        with self._lock:
+            if key is not None:
+                self._keys[key] = digest
+                self._keys.move_to_end(key)
+            if digest in self._blobs:
+                self._blobs.move_to_end(digest)
+                return
+            if len(body) > self.memory_limit:
+                return
+            self._blobs[digest] = (content_type, body)
+            self._memory_size += len(body)
+            while self._memory_size > self.memory_limit and self._blobs:
+                _, (_, evicted) = self._blobs.popitem(last=False)
+                self._memory_size -= len(evicted)
+            # 键映射只是短字符串，按条数限制
+            while len(self._keys) > 10000:
+                self._keys.popitem(last=False)
+
+    def _memory_get(self, digest):
+        with self._lock:
+            entry = self._blobs.get(digest)
+            if entry is not None:
+                self._blobs.move_to_end(digest)
+            return entry
+
+    # ---- 磁盘层 ----
+
+    def _key_path(self, key):
+        return os.path.join(self.directory, 'keys', key)
+
+    def _blob_path(self, digest, content_type):
+        return os.path.join(self.directory, 'blobs', f"{digest}.{CONTENT_EXTENSIONS[content_type]}")
+
+    def _find_blob(self, digest):
+        for ext, content_type in EXTENSION_TYPES.items():
+            path = os.path.join(self.directory, 'blobs', f"{digest}.{ext}")
+            if os.path.exists(path):
+                return path, content_type
+        return None, None
+
+    def _write_atomic(self, path, data):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _disk_get(self, digest):
+        path, content_type = self._find_blob(digest)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                body = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return content_type, body
+
+    def _evict_disk(self):
+        blob_dir = os.path.join(self.directory, 'blobs')
+        entries = []
+        total = 0
+        for entry in os.scandir(blob_dir):
+            if entry.name.endswith('.tmp'):
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        if total <= self.disk_limit:
+            return
+        evicted = set()
+        for _mtime, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            evicted.add(os.path.basename(path).split('.', 1)[0])
+            total -= size
+            if total <= self.disk_limit:
+                break
+        self._evict_keys(evicted)
+
+    def _evict_keys(self, evicted_digests=()):
+        """删除指向已淘汰内容的键文件，剩余键文件数仍超过上限时按修改时间删除最旧的"""
+        key_dir = os.path.join(self.directory, 'keys')
+        entries = []
+        for entry in os.scandir(key_dir):
+            if entry.name.endswith('.tmp'):
+                continue
+            try:
+                if evicted_digests:
+                    with open(entry.path, 'r') as f:
+                        digest = f.read().strip()
+                    if digest in evicted_digests:
+                        os.remove(entry.path)
+                        continue
+                entries.append((entry.stat().st_mtime, entry.path))
+            except OSError:
+                continue
+        if len(entries) > self.key_limit:
+            entries.sort()
+            excess = len(entries) - self.key_limit
+            for _mtime, path in entries[:excess]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            entries = entries[excess:]
+        with self._lock:
+            self._key_files = len(entries)
+            if evicted_digests:
+                for key in [k for k, d in self._keys.items() if d in evicted_digests]:
+                    del self._keys[key]
+
+    # ---- 对外接口 ----
+
+    def get(self, key):
+        """按缓存键读取，未命中返回None"""
+        with self._lock:
+            digest = self._keys.get(key)
+        if digest is None:
+            try:
+                with open(self._key_path(key), 'r') as f:
+                    digest = f.read().strip()
+                os.utime(self._key_path(key))
+            except OSError:
+                digest = None
+        if digest is None:
+            self._stats['misses'] += 1
+            return None
+
+        artifact = self.get_blob(digest, key=key)
+        if artifact is None:
+            self._stats['misses'] += 1
+            # 内容已被淘汰，顺带清理悬空的键映射
+            with self._lock:
+                self._keys.pop(key, None)
+            try:
+                os.remove(self._key_path(key))
+            except OSError:
+                pass
+        return artifact
+
+    def get_blob(self, digest, key=None):
+        """按内容摘要读取（图表URL使用）"""
+        entry = self._memory_get(digest)
+        if entry is not None:
+            self._stats['memory_hits'] += 1
+            if key is not None:
+                self._remember(key, digest, *entry)
+            return Artifact(digest, entry[0], entry[1])
+
+        entry = self._disk_get(digest)
+        if entry is None:
+            return None
+        self._stats['disk_hits'] += 1
+        self._remember(key, digest, *entry)
+        return Artifact(digest, entry[0], entry[1])
+
+    def put(self, key, body, content_type):
+        """保存渲染结果，返回Artifact"""
+        digest = hashlib.sha256(body).hexdigest()
+        try:
+            path = self._blob_path(digest, content_type)
+            if not os.path.exists(path):
+                self._write_atomic(path, body)
+                self._evict_disk()
+            key_path = self._key_path(key)
+            is_new_key = not os.path.exists(key_path)
+            self._write_atomic(key_path, digest.encode('ascii'))
+            if is_new_key:
+                with self._lock:
+                    self._key_files += 1
+                    over_limit = self._key_files > self.key_limit
+                if over_limit:
+                    self._evict_keys()
+        except OSError as e:
+            logger.warning(f"图表缓存写入磁盘失败: {e}")
+        self._remember(key, digest, content_type, body)
+        self._stats['stores'] += 1
+        return Artifact(digest, content_type, body)
+
+    def get_or_render(self, key, render):
+        """
+        命中直接返回；否则调用render()渲染并保存
+
+        Returns:
+            tuple: (Artifact, 是否命中)
+        """
+        artifact = self.get(key)
+        if artifact is not None:
+            return artifact, True
+        body, content_type = encode_chart(render())
+        return self.put(key, body, content_type), False
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(memory_bytes=self._memory_size, memory_items=len(self._blobs), keys=len(self._keys))
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_chart_cache():
+    """进程内共享的图表缓存，配置见 settings.CHART_CACHE"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                options = getattr(settings, 'CHART_CACHE', {})
+                _cache = ChartArtifactCache(
+                    options.get('DIRECTORY', os.path.join(settings.BASE_DIR, 'chart_cache')),
+                    memory_limit=options.get('MEMORY_LIMIT', 64 * 1024 * 1024),
+                    disk_limit=options.get('DISK_LIMIT', 512 * 1024 * 1024),
+                    key_limit=options.get('KEY_LIMIT', 100000)
+                )
+    return _cache
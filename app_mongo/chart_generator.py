@@ -7,7 +7,8 @@ Python可视化图表生成器
 
 import matplotlib
 matplotlib.use('Agg')  # 使用非交互式后端
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import seaborn as sns
 import plotly.graph_objects as go
 import plotly.express as px
@@ -19,14 +20,85 @@ import base64
 from django.conf import settings
 import os
 
-# 设置中文字体
-plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'Arial Unicode MS']
-plt.rcParams['axes.unicode_minus'] = False
+from .downsample import DEFAULT_MAX_POINTS, downsample_points
+
+# 设置中文字体（导入时设置一次，渲染时不再修改全局状态）
+matplotlib.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'Arial Unicode MS', 'DejaVu Sans']
+matplotlib.rcParams['axes.unicode_minus'] = False
 
 # 设置Seaborn样式
 sns.set_style("whitegrid")
 sns.set_palette("husl")
 
+# 规范化后的列 -> 候选来源字段（按顺序取第一个存在的值：MongoDB嵌套路径，或降级数据/MySQL的扁平字段）
+FIELD_SOURCES = {
+    'price': ['price.monthly_rent', 'monthly_rent', 'price'],
+    'area': ['features.area', 'area'],
+    'city': ['location.city', 'city'],
+    'street': ['location.street', 'street'],
+    'rental_type': ['rental_type', 'type'],
+    'direction': ['features.direction', 'direction', 'orientation', 'direct'],
+    'title': ['title'],
+}
+NUMERIC_FIELDS = ['price', 'area']
+CATEGORY_FIELDS = ['city', 'street', 'rental_type', 'direction']
+MISSING_TEXT = '未知'
+
+
+def _first_value(doc, sources):
+    for source in sources:
+        value = doc
+        for part in source.split('.'):
+            value = value.get(part) if isinstance(value, dict) else None
+            if value is None:
+                break
+        # 价格字段可能是 {'monthly_rent': ...} 字典，此时跳过扁平候选；NaN（来自DataFrame的缺失值）视为不存在
+        if value is not None and not isinstance(value, dict) and value == value:
+            return value
+    return None
+
+
+def _is_normalized(df):
+    return all(column in df.columns for column in FIELD_SOURCES) and \
+        all(df[column].dtype == np.float32 for column in NUMERIC_FIELDS)
+
+
+def normalize_houses(data):
+    """
+    把嵌套的MongoDB文档或扁平的降级/MySQL数据一次性转换为类型化列式DataFrame
+
+    价格/面积为float32（缺失为NaN），城市/街道/租赁类型/朝向为category（缺失为“未知”），
+    已规范化的DataFrame（如 viz_data 的加载结果）直接返回
+
+    Args:
+        data: DataFrame、字典列表或MongoDB游标
+
+    Returns:
+        pandas.DataFrame: 列为 FIELD_SOURCES 的键
+    """
+    if isinstance(data, pd.DataFrame):
+        if _is_normalized(data):
+            return data
+        data = data.to_dict('records')
+    elif not isinstance(data, list):
+        data = list(data)
+
+    # 直接按列构造：每列取第一个存在的候选字段（嵌套路径或扁平字段）
+    columns = {
+        column: [_first_value(doc, sources) for doc in data]
+        for column, sources in FIELD_SOURCES.items()
+    }
+
+    frame = pd.DataFrame(columns)
+    for column in NUMERIC_FIELDS:
+        frame[column] = pd.to_numeric(frame[column], errors='coerce').astype('float32')
+    for column in CATEGORY_FIELDS:
+        frame[column] = frame[column].where(frame[column].notna() & (frame[column] != ''), MISSING_TEXT)\
+            .astype(str).astype('category')
+    frame['title'] = frame['title'].fillna('').astype(str)
+    return frame
+
+
 class ChartGenerator:
     """图表生成器基类"""
     
@@ -38,6 +110,7 @@ class ChartGenerator:
             data_source: 数据源，可以是DataFrame或数据库查询结果
         """
         self.data = data_source
+        self._frame = None
         self.static_charts_dir = os.path.join(settings.STATIC_ROOT or 'static', 'charts')
         
         # 确保图表目录存在
@@ -45,25 +118,50 @@ class ChartGenerator:
     
     def prepare_data(self, data=None):
         """
-        准备数据，转换为DataFrame格式
+        准备数据，统一规范化为类型化的列式DataFrame（见 normalize_houses）
         
         Args:
-            data: 输入数据
+            data: 输入数据，为None时使用初始化的数据源（规范化结果会被复用）
             
         Returns:
             pandas.DataFrame: 处理后的数据
         """
-        if data is None:
-            data = self.data
-            
-        if isinstance(data, pd.DataFrame):
-            return data
-        elif isinstance(data, list):
-            return pd.DataFrame(data)
-        else:
-            # 假设是MongoDB查询结果
-            return pd.DataFrame(list(data))
+        if data is not None:
+            return normalize_houses(data)
+        if self._frame is None:
+            self._frame = normalize_houses(self.data if self.data is not None else [])
+        return self._frame
     
+    def _new_figure(self, nrows=1, ncols=1, figsize=(12, 8)):
+        """
+        创建独立的Figure（面向对象API，不使用pyplot全局状态，可在多线程/多进程中并发渲染）
+
+        Returns:
+            tuple: (Figure, Axes 或 Axes数组)
+        """
+        fig = Figure(figsize=figsize)
+        FigureCanvasAgg(fig)
+        axes = fig.subplots(nrows, ncols)
+        return fig, axes
+
+    def _export_figure(self, fig, save_path=None, **savefig_kwargs):
+        """保存到文件或返回base64 data URI"""
+        if save_path:
+            fig.savefig(save_path, dpi=300, bbox_inches='tight', **savefig_kwargs)
+            return save_path
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='png', dpi=300, bbox_inches='tight', **savefig_kwargs)
+        image_base64 = base64.b64encode(buffer.getvalue()).decode()
+        return f"data:image/png;base64,{image_base64}"
+
+    def generate_error_chart(self, title, message, save_path=None):
+        """数据不足或渲染失败时的占位图"""
+        fig, ax = self._new_figure(figsize=(12, 6))
+        ax.text(0.5, 0.5, f'{title}\n{message}', ha='center', va='center',
+                transform=ax.transAxes, fontsize=16)
+        ax.set_axis_off()
+        return self._export_figure(fig, save_path)
+
     def generate_price_histogram(self, data=None, save_path=None):
         """
         生成房源价格分布直方图 (Seaborn)
@@ -78,76 +176,53 @@ class ChartGenerator:
         df = self.prepare_data(data)
         
         # 创建图表
-        plt.figure(figsize=(12, 8))
+        fig, ax = self._new_figure()
         
         # 提取价格数据
-        prices = []
-        for _, row in df.iterrows():
-            price = None
-
-            # 尝试多种方式提取价格
-            if isinstance(row.get('price'), dict):
-                price = row['price'].get('monthly_rent', 0)
-            elif isinstance(row.get('price'), (int, float)):
-                price = row.get('price', 0)
-            elif 'monthly_rent' in row:
-                price = row.get('monthly_rent', 0)
-
-            if price and isinstance(price, (int, float)) and price > 0:
-                prices.append(float(price))
-
-        prices = pd.Series(prices)
+        prices = df.loc[df['price'] > 0, 'price'].astype('float64')
         print(f"提取到 {len(prices)} 个有效价格数据")
         
         # 绘制直方图
         if len(prices) > 10:
             # 数据充足时使用Seaborn
-            sns.histplot(data=prices, bins=30, kde=False, alpha=0.7)
+            sns.histplot(data=prices, bins=30, kde=False, alpha=0.7, ax=ax)
         elif len(prices) > 1:
             # 数据较少时使用简单直方图
-            plt.hist(prices, bins=min(10, len(prices)//2 + 1), alpha=0.7, edgecolor='black')
+            ax.hist(prices, bins=min(10, len(prices)//2 + 1), alpha=0.7, edgecolor='black')
         else:
             # 数据太少时显示提示
-            plt.text(0.5, 0.5, f'数据不足\n仅有{len(prices)}条记录',
-                    ha='center', va='center', transform=plt.gca().transAxes, fontsize=14)
+            ax.text(0.5, 0.5, f'数据不足\n仅有{len(prices)}条记录',
+                    ha='center', va='center', transform=ax.transAxes, fontsize=14)
         
         # 添加统计信息
         if len(prices) > 0:
             mean_price = prices.mean()
             median_price = prices.median()
 
-            plt.axvline(mean_price, color='red', linestyle='--',
+            ax.axvline(mean_price, color='red', linestyle='--',
                        label=f'平均价格: ¥{mean_price:.0f}')
-            plt.axvline(median_price, color='orange', linestyle='--',
+            ax.axvline(median_price, color='orange', linestyle='--',
                        label=f'中位数价格: ¥{median_price:.0f}')
         
-        plt.title('广州市房源价格分布直方图', fontsize=16, fontweight='bold')
-        plt.xlabel('月租金 (元)', fontsize=12)
-        plt.ylabel('房源数量', fontsize=12)
-        plt.legend()
-        plt.grid(True, alpha=0.3)
+        ax.set_title('广州市房源价格分布直方图', fontsize=16, fontweight='bold')
+        ax.set_xlabel('月租金 (元)', fontsize=12)
+        ax.set_ylabel('房源数量', fontsize=12)
+        ax.legend()
+        ax.grid(True, alpha=0.3)
         
         # 保存或返回
-        if save_path:
-            plt.savefig(save_path, dpi=300, bbox_inches='tight')
-            plt.close()
-            return save_path
-        else:
-            # 转换为base64
-            buffer = io.BytesIO()
-            plt.savefig(buffer, format='png', dpi=300, bbox_inches='tight')
-            buffer.seek(0)
-            image_base64 = base64.b64encode(buffer.getvalue()).decode()
-            plt.close()
-            return f"data:image/png;base64,{image_base64}"
+        return self._export_figure(fig, save_path)
     
-    def generate_area_price_scatter(self, data=None, save_path=None):
+    def generate_area_price_scatter(self, data=None, save_path=None, max_points=DEFAULT_MAX_POINTS,
+                                    sampling='stratified'):
         """
         生成面积vs价格散点图 (Matplotlib + Seaborn)
         
         Args:
             data: 房源数据
             save_path: 保存路径
+            max_points: 绘制的最大点数
+            sampling: 超出点数时的降采样模式 grid / stratified / lttb（见 downsample 模块）
             
         Returns:
             str: 图表的base64编码或文件路径
@@ -155,75 +230,37 @@ class ChartGenerator:
         df = self.prepare_data(data)
         
         # 提取面积和价格数据
-        areas = []
-        prices = []
-        cities = []
-        
-        for _, row in df.iterrows():
-            # 提取面积
-            if isinstance(row.get('features'), dict):
-                area = row['features'].get('area', 0)
-            else:
-                area = row.get('area', 0)
-            
-            # 提取价格
-            if isinstance(row.get('price'), dict):
-                price = row['price'].get('monthly_rent', 0)
-            else:
-                price = row.get('price', 0)
-            
-            # 提取城市
-            if isinstance(row.get('location'), dict):
-                city = row['location'].get('city', '未知')
-            else:
-                city = row.get('city', '未知')
-            
-            if area > 0 and price > 0:
-                areas.append(area)
-                prices.append(price)
-                cities.append(city)
-        
-        # 创建DataFrame
-        scatter_df = pd.DataFrame({
-            'area': areas,
-            'price': prices,
-            'city': cities
-        })
+        mask = (df['area'] > 0) & (df['price'] > 0)
+        scatter_df = df.loc[mask, ['area', 'price', 'city']]
+        areas = scatter_df['area'].to_numpy(dtype='float64')
+        prices = scatter_df['price'].to_numpy(dtype='float64')
+        plot_df = downsample_points(scatter_df, 'area', 'price', max_points, sampling, group='city')
         
         # 创建图表
-        plt.figure(figsize=(12, 8))
+        fig, ax = self._new_figure()
         
-        # 按城市分组绘制散点图
-        for city in scatter_df['city'].unique():
-            city_data = scatter_df[scatter_df['city'] == city]
-            plt.scatter(city_data['area'], city_data['price'], 
-                       label=city, alpha=0.6, s=50)
+        # 按城市分组绘制散点图，网格分箱时点的大小表示格内房源数
+        for city, city_data in plot_df.groupby('city', observed=True):
+            sizes = 20 + 15 * np.log1p(city_data['count']) if 'count' in city_data else 50
+            ax.scatter(city_data['area'], city_data['price'], 
+                       label=city, alpha=0.6, s=sizes)
         
-        # 添加回归线
+        # 添加回归线（用全部数据拟合）
         if len(areas) > 1:
             z = np.polyfit(areas, prices, 1)
             p = np.poly1d(z)
-            plt.plot(areas, p(areas), "r--", alpha=0.8, linewidth=2, 
+            line_x = np.array([areas.min(), areas.max()])
+            ax.plot(line_x, p(line_x), "r--", alpha=0.8, linewidth=2, 
                     label=f'趋势线 (斜率: {z[0]:.1f})')
         
-        plt.title('房源面积与价格关系散点图', fontsize=16, fontweight='bold')
-        plt.xlabel('面积 (㎡)', fontsize=12)
-        plt.ylabel('月租金 (元)', fontsize=12)
-        plt.legend()
-        plt.grid(True, alpha=0.3)
+        ax.set_title('房源面积与价格关系散点图', fontsize=16, fontweight='bold')
+        ax.set_xlabel('面积 (㎡)', fontsize=12)
+        ax.set_ylabel('月租金 (元)', fontsize=12)
+        ax.legend()
+        ax.grid(True, alpha=0.3)
         
         # 保存或返回
-        if save_path:
-            plt.savefig(save_path, dpi=300, bbox_inches='tight')
-            plt.close()
-            return save_path
-        else:
-            buffer = io.BytesIO()
-            plt.savefig(buffer, format='png', dpi=300, bbox_inches='tight')
-            buffer.seek(0)
-            image_base64 = base64.b64encode(buffer.getvalue()).decode()
-            plt.close()
-            return f"data:image/png;base64,{image_base64}"
+        return self._export_figure(fig, save_path)
 
     def generate_price_trend_line(self, data=None, save_path=None):
         """
@@ -240,48 +277,24 @@ class ChartGenerator:
         df = self.prepare_data(data)
 
         # 提取价格数据并按城市分组
-        city_prices = {}
-
-        for _, row in df.iterrows():
-            # 提取价格
-            if isinstance(row.get('price'), dict):
-                price = row['price'].get('monthly_rent', 0)
-            else:
-                price = row.get('price', 0)
-
-            # 提取城市
-            if isinstance(row.get('location'), dict):
-                city = row['location'].get('city', '未知')
-            else:
-                city = row.get('city', '未知')
-
-            if price > 0 and city != '未知':
-                if city not in city_prices:
-                    city_prices[city] = []
-                city_prices[city].append(price)
-
-        # 计算每个城市的价格统计
-        city_stats = {}
-        for city, prices in city_prices.items():
-            if len(prices) >= 10:  # 只包含有足够数据的城市
-                city_stats[city] = {
-                    'mean': np.mean(prices),
-                    'median': np.median(prices),
-                    'q25': np.percentile(prices, 25),
-                    'q75': np.percentile(prices, 75),
-                    'count': len(prices)
-                }
+        mask = (df['price'] > 0) & (df['city'] != MISSING_TEXT)
+        grouped = df.loc[mask, ['city', 'price']].astype({'price': 'float64'}).groupby('city', observed=True)['price']
+        summary = pd.DataFrame({
+            'mean': grouped.mean(),
+            'median': grouped.median(),
+            'q25': grouped.quantile(0.25),
+            'q75': grouped.quantile(0.75),
+            'count': grouped.size()
+        })
+
+        # 计算每个城市的价格统计，只包含有足够数据的城市
+        city_stats = summary[summary['count'] >= 10].to_dict('index')
 
         if not city_stats:
-            return self.generate_error_chart("价格趋势折线图", "数据不足")
+            return self.generate_error_chart("价格趋势折线图", "数据不足", save_path)
 
         # 创建图表
-        plt.style.use('seaborn-v0_8')
-        fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 10))
-
-        # 设置中文字体
-        plt.rcParams['font.sans-serif'] = ['SimHei', 'DejaVu Sans']
-        plt.rcParams['axes.unicode_minus'] = False
+        fig, (ax1, ax2) = self._new_figure(2, 1, figsize=(12, 10))
 
         # 上图：价格趋势线
         cities = list(city_stats.keys())
@@ -327,22 +340,10 @@ class ChartGenerator:
         ax2.legend(fontsize=11)
         ax2.grid(True, alpha=0.3)
 
-        plt.tight_layout()
+        fig.tight_layout()
 
         # 保存或返回base64
-        if save_path:
-            plt.savefig(save_path, dpi=300, bbox_inches='tight',
-                       facecolor='white', edgecolor='none')
-            plt.close()
-            return save_path
-        else:
-            buffer = io.BytesIO()
-            plt.savefig(buffer, format='png', dpi=300, bbox_inches='tight',
-                       facecolor='white', edgecolor='none')
-            buffer.seek(0)
-            image_base64 = base64.b64encode(buffer.getvalue()).decode()
-            plt.close()
-            return f"data:image/png;base64,{image_base64}"
+        return self._export_figure(fig, save_path, facecolor='white', edgecolor='none')
 
     def generate_city_price_boxplot(self, data=None, save_path=None):
         """
@@ -358,56 +359,28 @@ class ChartGenerator:
         df = self.prepare_data(data)
         
         # 提取城市和价格数据
-        city_price_data = []
-        
-        for _, row in df.iterrows():
-            # 提取价格
-            if isinstance(row.get('price'), dict):
-                price = row['price'].get('monthly_rent', 0)
-            else:
-                price = row.get('price', 0)
-            
-            # 提取城市
-            if isinstance(row.get('location'), dict):
-                city = row['location'].get('city', '未知')
-            else:
-                city = row.get('city', '未知')
-            
-            if price > 0:
-                city_price_data.append({'city': city, 'price': price})
-        
-        # 创建DataFrame
-        boxplot_df = pd.DataFrame(city_price_data)
+        boxplot_df = df.loc[df['price'] > 0, ['city', 'price']]
+        boxplot_df['city'] = boxplot_df['city'].cat.remove_unused_categories()
         
         # 创建图表
-        plt.figure(figsize=(12, 8))
+        fig, ax = self._new_figure()
         
         # 绘制箱线图
-        sns.boxplot(data=boxplot_df, x='city', y='price', palette='Set2')
+        sns.boxplot(data=boxplot_df, x='city', y='price', hue='city', palette='Set2', legend=False, ax=ax)
         
         # 添加均值点
         sns.pointplot(data=boxplot_df, x='city', y='price', 
                      estimator=np.mean, color='red', markers='D', 
-                     linestyles='', scale=0.8, label='均值')
+                     linestyle='none', markersize=6, label='均值', ax=ax)
         
-        plt.title('各城市房源价格分布箱线图', fontsize=16, fontweight='bold')
-        plt.xlabel('城市', fontsize=12)
-        plt.ylabel('月租金 (元)', fontsize=12)
-        plt.xticks(rotation=45)
-        plt.grid(True, alpha=0.3)
+        ax.set_title('各城市房源价格分布箱线图', fontsize=16, fontweight='bold')
+        ax.set_xlabel('城市', fontsize=12)
+        ax.set_ylabel('月租金 (元)', fontsize=12)
+        ax.tick_params(axis='x', rotation=45)
+        ax.grid(True, alpha=0.3)
         
         # 保存或返回
-        if save_path:
-            plt.savefig(save_path, dpi=300, bbox_inches='tight')
-            plt.close()
-            return save_path
-        else:
-            buffer = io.BytesIO()
-            plt.savefig(buffer, format='png', dpi=300, bbox_inches='tight')
-            buffer.seek(0)
-            image_base64 = base64.b64encode(buffer.getvalue()).decode()
-            plt.close()
-            return f"data:image/png;base64,{image_base64}"
+        return self._export_figure(fig, save_path)
     
     def generate_interactive_heatmap(self, data=None):
         """
@@ -422,35 +395,10 @@ class ChartGenerator:
         df = self.prepare_data(data)
         
         # 准备热力图数据
-        heatmap_data = []
-        
-        for _, row in df.iterrows():
-            # 提取位置信息
-            if isinstance(row.get('location'), dict):
-                city = row['location'].get('city', '未知')
-                street = row['location'].get('street', '未知')
-            else:
-                city = row.get('city', '未知')
-                street = row.get('street', '未知')
-            
-            # 提取价格
-            if isinstance(row.get('price'), dict):
-                price = row['price'].get('monthly_rent', 0)
-            else:
-                price = row.get('price', 0)
-            
-            if price > 0:
-                heatmap_data.append({
-                    'city': city,
-                    'street': street,
-                    'price': price
-                })
-        
-        # 创建DataFrame
-        heatmap_df = pd.DataFrame(heatmap_data)
+        heatmap_df = df.loc[df['price'] > 0, ['city', 'street', 'price']]
         
         # 计算城市-街道的平均价格
-        pivot_data = heatmap_df.groupby(['city', 'street'])['price'].mean().reset_index()
+        pivot_data = heatmap_df.groupby(['city', 'street'], observed=True)['price'].mean().reset_index()
         pivot_table = pivot_data.pivot(index='street', columns='city', values='price')
         
         # 创建交互式热力图
@@ -473,12 +421,14 @@ class ChartGenerator:
         
         return fig.to_html(div_id="interactive_heatmap", include_plotlyjs=True)
     
-    def generate_interactive_scatter_3d(self, data=None):
+    def generate_interactive_scatter_3d(self, data=None, max_points=DEFAULT_MAX_POINTS, sampling='stratified'):
         """
         生成3D交互式散点图 (Plotly)
         
         Args:
             data: 房源数据
+            max_points: 发送到浏览器的最大点数
+            sampling: 超出点数时的降采样模式 grid / stratified / lttb
             
         Returns:
             str: Plotly图表的HTML div
@@ -486,50 +436,24 @@ class ChartGenerator:
         df = self.prepare_data(data)
         
         # 准备3D散点图数据
-        scatter_data = []
-        
-        for _, row in df.iterrows():
-            # 提取面积
-            if isinstance(row.get('features'), dict):
-                area = row['features'].get('area', 0)
-            else:
-                area = row.get('area', 0)
-            
-            # 提取价格
-            if isinstance(row.get('price'), dict):
-                price = row['price'].get('monthly_rent', 0)
-            else:
-                price = row.get('price', 0)
-            
-            # 提取城市
-            if isinstance(row.get('location'), dict):
-                city = row['location'].get('city', '未知')
-            else:
-                city = row.get('city', '未知')
-            
-            # 计算单价
-            unit_price = price / area if area > 0 else 0
-            
-            if area > 0 and price > 0:
-                scatter_data.append({
-                    'area': area,
-                    'price': price,
-                    'unit_price': unit_price,
-                    'city': city,
-                    'title': row.get('title', '未知房源')
-                })
-        
-        # 创建DataFrame
-        scatter_df = pd.DataFrame(scatter_data)
-        
-        # 创建3D散点图
+        mask = (df['area'] > 0) & (df['price'] > 0)
+        scatter_df = df.loc[mask, ['area', 'price', 'city', 'title']]
+        # 计算单价
+        scatter_df['unit_price'] = scatter_df['price'] / scatter_df['area']
+        scatter_df = downsample_points(scatter_df, 'area', 'price', max_points, sampling,
+                                       group='city', extra_columns=('unit_price',))
+        if 'title' in scatter_df:
+            scatter_df['title'] = scatter_df['title'].replace('', '未知房源')
+        scatter_df['city'] = scatter_df['city'].astype('category').cat.remove_unused_categories()
+        
+        # 创建3D散点图（网格分箱时悬停显示格内房源数）
         fig = px.scatter_3d(
             scatter_df, 
             x='area', 
             y='price', 
             z='unit_price',
             color='city',
-            hover_data=['title'],
+            hover_data=['count'] if 'count' in scatter_df else ['title'],
             title='房源面积-价格-单价 3D散点图',
             labels={
                 'area': '面积 (㎡)',
@@ -554,26 +478,11 @@ class ChartGenerator:
         """生成面积对价格影响的图表"""
         try:
             # 准备数据
-            areas = []
-            prices = []
-
-            for house in houses_data:
-                area = house.get('area', 0)
-                price = house.get('price', {})
-                if isinstance(price, dict):
-                    monthly_rent = price.get('monthly_rent', 0)
-                else:
-                    monthly_rent = price
-
-                if area and monthly_rent:
-                    areas.append(area)
-                    prices.append(monthly_rent)
-
-            if not areas:
-                return self.generate_sample_chart("面积对价格影响")
+            df = self.prepare_data(houses_data)
+            df = df.loc[(df['area'] > 0) & (df['price'] > 0), ['area', 'price']]
 
-            # 创建DataFrame
-            df = pd.DataFrame({'area': areas, 'price': prices})
+            if df.empty:
+                return self.generate_sample_chart("面积对价格影响")
 
             # 创建面积区间
             df['area_range'] = pd.cut(df['area'], bins=5, labels=['小户型', '紧凑型', '标准型', '大户型', '豪华型'])
@@ -600,26 +509,11 @@ class ChartGenerator:
         """生成房型对价格影响的图表"""
         try:
             # 准备数据
-            types = []
-            prices = []
-
-            for house in houses_data:
-                rental_type = house.get('rental_type', '整租')
-                price = house.get('price', {})
-                if isinstance(price, dict):
-                    monthly_rent = price.get('monthly_rent', 0)
-                else:
-                    monthly_rent = price
-
-                if monthly_rent:
-                    types.append(rental_type)
-                    prices.append(monthly_rent)
-
-            if not types:
-                return self.generate_sample_chart("房型对价格影响")
+            df = self.prepare_data(houses_data)
+            df = df.loc[df['price'] > 0, ['rental_type', 'price']].rename(columns={'rental_type': 'type'})
 
-            # 创建DataFrame
-            df = pd.DataFrame({'type': types, 'price': prices})
+            if df.empty:
+                return self.generate_sample_chart("房型对价格影响")
 
             # 计算每种房型的平均价格
             type_avg = df.groupby('type')['price'].mean().reset_index()
@@ -643,26 +537,11 @@ class ChartGenerator:
         """生成朝向对价格影响的图表"""
         try:
             # 准备数据
-            directions = []
-            prices = []
-
-            for house in houses_data:
-                direction = house.get('direction', '南')
-                price = house.get('price', {})
-                if isinstance(price, dict):
-                    monthly_rent = price.get('monthly_rent', 0)
-                else:
-                    monthly_rent = price
-
-                if monthly_rent:
-                    directions.append(direction)
-                    prices.append(monthly_rent)
-
-            if not directions:
-                return self.generate_sample_chart("朝向对价格影响")
+            df = self.prepare_data(houses_data)
+            df = df.loc[df['price'] > 0, ['direction', 'price']]
 
-            # 创建DataFrame
-            df = pd.DataFrame({'direction': directions, 'price': prices})
+            if df.empty:
+                return self.generate_sample_chart("朝向对价格影响")
 
             # 计算每种朝向的平均价格
             direction_avg = df.groupby('direction')['price'].mean().reset_index()
@@ -686,26 +565,11 @@ class ChartGenerator:
         """生成城市对价格影响的图表"""
         try:
             # 准备数据
-            cities = []
-            prices = []
-
-            for house in houses_data:
-                city = house.get('city', '北京')
-                price = house.get('price', {})
-                if isinstance(price, dict):
-                    monthly_rent = price.get('monthly_rent', 0)
-                else:
-                    monthly_rent = price
-
-                if monthly_rent:
-                    cities.append(city)
-                    prices.append(monthly_rent)
-
-            if not cities:
-                return self.generate_sample_chart("城市对价格影响")
+            df = self.prepare_data(houses_data)
+            df = df.loc[df['price'] > 0, ['city', 'price']]
 
-            # 创建DataFrame
-            df = pd.DataFrame({'city': cities, 'price': prices})
+            if df.empty:
+                return self.generate_sample_chart("城市对价格影响")
 
             # 计算每个城市的平均价格
             city_avg = df.groupby('city')['price'].mean().reset_index()
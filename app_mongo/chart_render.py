@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+图表并行渲染
+多个图表提交到进程池并发渲染，按完成顺序返回结果；每个图表从开始执行起有超时限制，
+超时只放弃本请求的任务，卡住的进程池在其他请求的任务完成后才被回收，不会拖住后续请求
+"""
+
+import functools
+import logging
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import (FIRST_COMPLETED, CancelledError, Future, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+from .chart_generator import normalize_houses
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def render_chart(method_name, data, params=None):
+    """
+    渲染单个图表（在工作进程中执行，必须是模块级函数）
+
+    Args:
+        method_name: ChartGenerator 方法名
+        data: 已规范化的房源DataFrame
+        params: 传给图表方法的参数
+    """
+    from .chart_generator import ChartGenerator
+    generator = ChartGenerator(data)
+    return getattr(generator, method_name)(**(params or {}))
+
+
+class ChartRenderPool:
+    """
+    图表渲染进程池
+
+    任务先进入池自己的队列，只在有空闲工作进程时才提交给执行器，因此超时从任务真正开始执行时计时。
+    超时只影响发起请求自己的任务：未开始的任务直接取消，已在运行的任务被放弃，
+    当前进程池退役、排队任务改用新进程池；退役的进程池等其他请求正在运行的任务完成后，再终止卡住的工作进程
+
+    进程无法启动时（如受限环境）退化为线程池：图表方法只使用面向对象的Figure API，线程间互不干扰
+    """
+
+    # 检查排队任务是否已开始执行的间隔（秒）
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, workers=2, timeout=60, start_method='spawn'):
+        self.workers = workers
+        self.timeout = timeout
+        self.start_method = start_method
+        self._executor = None
+        self._uses_processes = False
+        # 回调可能在持有锁的线程中同步触发，需要可重入锁
+        self._lock = threading.RLock()
+        self._queue = deque()       # 等待空闲工作进程的任务 (对外Future, 参数)
+        self._free = 0              # 当前进程池的空闲工作进程数
+        self._inner = {}            # 对外Future -> 执行器中的Future
+        self._inflight = {}         # 进程池 -> 正在运行的执行器Future
+        self._abandoned = set()     # 已超时放弃、不再等待的执行器Future
+        self._retired = set()       # 已退役、等待排空的进程池
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                try:
+                    context = multiprocessing.get_context(self.start_method)
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=context, initializer=_init_worker
+                    )
+                    self._uses_processes = True
+                except (OSError, ValueError, NotImplementedError) as e:
+                    logger.warning(f"图表渲染进程池启动失败，改用线程池: {e}")
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                        thread_name_prefix='chart-render')
+                    self._uses_processes = False
+                self._free = self.workers
+            return self._executor
+
+    def _submit(self, method_name, frame, params):
+        """任务入队，返回对外Future；开始执行后 running() 为True"""
+        future = Future()
+        with self._lock:
+            self._queue.append((future, (method_name, frame, params)))
+        self._dispatch()
+        return future
+
+    def _dispatch(self):
+        """把排队任务提交给有空闲工作进程的进程池"""
+        with self._lock:
+            while self._queue and (self._executor is None or self._free > 0):
+                future, args = self._queue.popleft()
+                if not future.set_running_or_notify_cancel():
+                    continue
+                executor = self._get_executor()
+                try:
+                    inner = executor.submit(render_chart, *args)
+                except (BrokenProcessPool, RuntimeError, OSError) as e:
+                    logger.error(f"图表渲染进程池不可用: {e}")
+                    self._executor = None
+                    future.set_exception(e)
+                    continue
+                self._free -= 1
+                self._inner[future] = inner
+                self._inflight.setdefault(executor, set()).add(inner)
+                inner.add_done_callback(functools.partial(self._finished, executor, future))
+
+    def _finished(self, executor, future, inner):
+        with self._lock:
+            self._inner.pop(future, None)
+            self._inflight.get(executor, set()).discard(inner)
+            self._abandoned.discard(inner)
+            if executor is self._executor:
+                self._free += 1
+        if inner.cancelled():
+            future.set_exception(CancelledError())
+        elif inner.exception() is not None:
+            future.set_exception(inner.exception())
+        else:
+            future.set_result(inner.result())
+        self._dispatch()
+
+    def _reset(self):
+        """丢弃当前进程池（进程池已损坏或关闭时使用），不终止工作进程"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            if executor is not None:
+                self._inflight.pop(executor, None)
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._dispatch()
+
+    def _retire(self, future):
+        """放弃超时任务，并让其所在的进程池退役：排队任务改用新进程池，旧池在后台排空后关闭"""
+        with self._lock:
+            inner = self._inner.get(future)
+            executor = next((ex for ex, running in self._inflight.items() if inner in running), None)
+            if executor is None:
+                return
+            self._abandoned.add(inner)
+            if executor in self._retired:
+                return
+            self._retired.add(executor)
+            if self._executor is executor:
+                self._executor = None
+        threading.Thread(target=self._drain, args=(executor,), name='chart-render-drain',
+                         daemon=True).start()
+        self._dispatch()
+
+    def _drain(self, executor):
+        """等待退役进程池中其他请求的任务完成，然后终止卡住的工作进程"""
+        while True:
+            with self._lock:
+                busy = [inner for inner in self._inflight.get(executor, ())
+                        if inner not in self._abandoned]
+            if not busy:
+                break
+            wait(busy, timeout=self.POLL_INTERVAL)
+        if isinstance(executor, ProcessPoolExecutor):
+            # ProcessPoolExecutor 没有公开的终止接口，直接结束其工作进程
+            for process in list((getattr(executor, '_processes', None) or {}).values()):
+                try:
+                    process.terminate()
+                except Exception:
+                    pass
+        executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            self._inflight.pop(executor, None)
+            self._retired.discard(executor)
+
+    def iter_render(self, jobs, data, timeout=None):
+        """
+        并发渲染一批图表，按完成顺序逐个返回
+
+        Args:
+            jobs: {名称: (ChartGenerator方法名, 参数字典)}
+            data: 房源数据（DataFrame/字典列表），提交前统一规范化一次
+            timeout: 单个图表的超时（秒，从该图表开始执行时计时，排队时间不计入）
+
+        Yields:
+            tuple: (名称, 渲染结果, 错误信息)，成功时错误信息为None
+        """
+        if not jobs:
+            return
+        timeout = timeout or self.timeout
+        frame = normalize_houses(data)
+
+        futures = {
+            self._submit(method_name, frame, params): name
+            for name, (method_name, params) in jobs.items()
+        }
+        pending = set(futures)
+        started = {}
+        try:
+            while pending:
+                now = time.monotonic()
+                for future in pending:
+                    if future not in started and future.running():
+                        started[future] = now
+
+                expired = [future for future in pending
+                           if future in started and now - started[future] >= timeout]
+                for future in expired:
+                    pending.discard(future)
+                    if not future.cancel():
+                        self._retire(future)
+                    name = futures[future]
+                    logger.warning(f"图表渲染超时 {name} ({timeout}s)")
+                    yield name, None, f'渲染超时（{timeout}秒）'
+                if not pending:
+                    break
+
+                wait_for = self.POLL_INTERVAL
+                deadlines = [started[future] + timeout for future in pending if future in started]
+                if deadlines:
+                    wait_for = min(wait_for, max(min(deadlines) - now, 0))
+                done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = futures[future]
+                    try:
+                        yield name, future.result(), None
+                    except BrokenProcessPool:
+                        self._reset()
+                        yield name, None, '渲染进程异常退出'
+                    except (RuntimeError, OSError) as e:
+                        yield name, None, f'渲染进程池不可用: {e}'
+                    except Exception as e:
+                        logger.error(f"图表渲染失败 {name}: {e}")
+                        yield name, None, str(e)
+        finally:
+            # 调用方提前停止迭代时，取消本请求尚未开始的任务
+            for future in pending:
+                future.cancel()
+
+    def render_all(self, jobs, data, timeout=None):
+        """并发渲染并等待全部完成，返回 {名称: (结果, 错误信息)}"""
+        return {name: (result, error) for name, result, error in self.iter_render(jobs, data, timeout)}
+
+    def shutdown(self):
+        self._reset()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_render_pool():
+    """进程内共享的渲染池，配置见 settings.CHART_RENDER_POOL"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                options = getattr(settings, 'CHART_RENDER_POOL', {})
+                _pool = ChartRenderPool(
+                    workers=options.get('WORKERS', 2),
+                    timeout=options.get('TIMEOUT', 60),
+                    start_method=options.get('START_METHOD', 'spawn')
+                )
+    return _pool
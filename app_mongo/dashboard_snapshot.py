@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+首页仪表板快照
+将mongo_index需要的统计结果物化为stats_cache集合中的一条文档，
+首页只需一次索引读取，统计由后台任务或写操作触发重新计算
+"""
+
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from app_mongo.models import MongoUser, MongoStats, HouseDocument, MongoQueryHelper
+
+logger = logging.getLogger(__name__)
+
+# 快照在stats_cache中的定位键，命中 ('stat_type', 'stat_key') 复合索引
+SNAPSHOT_STAT_TYPE = 'dashboard'
+SNAPSHOT_STAT_KEY = 'mongo_index'
+
+# 快照过期时间（秒），过期后返回旧快照并在后台重新计算
+SNAPSHOT_MAX_AGE = 300
+
+_refresh_lock = threading.Lock()
+
+
+def _default_user_time():
+    """用户注册分布的默认数据"""
+    today = datetime.now()
+    return [
+        {'name': (today - timedelta(days=2)).strftime('%Y-%m-%d'), 'value': 2},
+        {'name': (today - timedelta(days=1)).strftime('%Y-%m-%d'), 'value': 3},
+        {'name': today.strftime('%Y-%m-%d'), 'value': 1}
+    ]
+
+
+def build_dashboard_snapshot():
+    """
+    计算首页所需的全部统计数据
+
+    Returns:
+        dict: 可直接存入MongoStats.stat_value的快照内容
+    """
+    # 用户注册时间分布
+    try:
+        user_time_pipeline = [
+            {
+                '$group': {
+                    '_id': {
+                        '$dateToString': {
+                            'format': '%Y-%m-%d',
+                            'date': '$time'
+                        }
+                    },
+                    'count': {'$sum': 1}
+                }
+            },
+            {'$sort': {'_id': 1}}
+        ]
+        user_time = [
+            {'name': item['_id'], 'value': item['count']}
+            for item in MongoUser.objects.aggregate(user_time_pipeline)
+            if item['_id']  # 过滤掉None值
+        ]
+        if not user_time:
+            user_time = _default_user_time()
+    except Exception as e:
+        logger.warning(f"用户时间数据获取失败: {e}")
+        user_time = _default_user_time()
+
+    # 最新用户，只保留模板需要的字段
+    newuserlist = [
+        {
+            'username': user.username,
+            'phone': user.phone or '',
+            'time': user.time,
+            'avatar': user.avatar or ''
+        }
+        for user in MongoUser.objects.only('username', 'phone', 'time', 'avatar').order_by('-time').limit(5)
+    ]
+
+    house_stats = MongoQueryHelper.get_house_stats()
+
+    # 最高价格房源
+    highest_price_house = HouseDocument.objects.only('price.monthly_rent', 'location.building').order_by('-price.monthly_rent').first()
+
+    # 最大面积房源
+    largest_area_house = HouseDocument.objects.only('features.area').order_by('-features.area').first()
+
+    # 房型分布：过滤空值后取前3
+    valid_types = [item['_id'] for item in MongoQueryHelper.get_type_distribution() if item['_id']][:3]
+
+    # 城市分布：取前3
+    top_3_cities = [item['_id'] for item in MongoQueryHelper.get_city_distribution()[:3]]
+
+    return {
+        'userTime': user_time,
+        'newuserlist': newuserlist,
+        'houseslength': house_stats.get('total_count', 0),
+        'userlength': MongoUser.objects.count(),
+        'averageprice': float(highest_price_house.price.monthly_rent) if highest_price_house else 0,
+        'buildingtype': highest_price_house.location.building if highest_price_house else '',
+        'area_max': float(largest_area_house.features.area) if largest_area_house else 0,
+        'str0': "~".join(valid_types),
+        'str1': "~".join(top_3_cities),
+        'generated_at': datetime.now()
+    }
+
+
+def refresh_dashboard_snapshot():
+    """重新计算并写入快照，返回新的快照内容"""
+    snapshot = build_dashboard_snapshot()
+    MongoStats.objects(stat_type=SNAPSHOT_STAT_TYPE, stat_key=SNAPSHOT_STAT_KEY).update_one(
+        upsert=True,
+        set__stat_value=snapshot,
+        set__updated_time=datetime.now(),
+        set_on_insert__created_time=datetime.now()
+    )
+    logger.info("首页仪表板快照已刷新")
+    return snapshot
+
+
+def refresh_dashboard_snapshot_async():
+    """
+    在后台线程中刷新快照
+
+    同一时刻只允许一个刷新任务运行，重复调用直接返回False
+    """
+    if not _refresh_lock.acquire(blocking=False):
+        return False
+
+    def _run():
+        try:
+            refresh_dashboard_snapshot()
+        except Exception as e:
+            logger.error(f"首页仪表板快照刷新失败: {e}")
+        finally:
+            _refresh_lock.release()
+
+    threading.Thread(target=_run, name='dashboard-snapshot-refresh', daemon=True).start()
+    return True
+
+
+def get_dashboard_snapshot(max_age=SNAPSHOT_MAX_AGE):
+    """
+    读取首页仪表板快照
+
+    没有快照时同步计算一次；快照过期时先返回旧数据，再在后台刷新
+
+    Args:
+        max_age: 快照允许的最大存活时间（秒）
+
+    Returns:
+        dict: 快照内容
+    """
+    doc = MongoStats.objects(
+        stat_type=SNAPSHOT_STAT_TYPE, stat_key=SNAPSHOT_STAT_KEY
+    ).only('stat_value', 'updated_time').first()
+
+    if doc is None or not doc.stat_value:
+        return refresh_dashboard_snapshot()
+
+    if doc.updated_time and datetime.now() - doc.updated_time > timedelta(seconds=max_age):
+        refresh_dashboard_snapshot_async()
+
+    return doc.stat_value
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+散点数据降采样
+无论集合多大，发送给 Plotly/ECharts 的点数都控制在预算以内（默认5000），同时保留分布形状和离群点：
+- grid: 二维网格分箱，每个非空格子输出一个点（格内均值 + 数量），分位数范围外的离群点保留原始点
+- stratified: 按分组（如城市）分层抽样，各组按比例分配名额且至少保留一个点，并保留组内极值
+- lttb: Largest-Triangle-Three-Buckets，按x排序后保留视觉上最重要的点，适合趋势线
+"""
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAX_POINTS = 5000
+SAMPLING_MODES = ('grid', 'stratified', 'lttb')
+
+# 固定随机种子：相同数据得到相同的抽样结果，渲染结果可以被缓存
+RANDOM_SEED = 42
+
+
+def clamp_max_points(value, default=DEFAULT_MAX_POINTS, upper=50000):
+    """解析请求中的点数预算"""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(10, min(value, upper))
+
+
+def _extreme_index(df, columns):
+    """各列最小/最大值所在行，降采样时始终保留"""
+    index = set()
+    for column in columns:
+        values = df[column]
+        if values.notna().any():
+            index.add(values.idxmin())
+            index.add(values.idxmax())
+    return index
+
+
+def grid_bin(df, x, y, max_points=DEFAULT_MAX_POINTS, extra_columns=()):
+    """
+    二维网格分箱
+
+    网格边界取 0.5% - 99.5% 分位数，范围之外的离群点原样保留（占用预算）
+
+    Returns:
+        pandas.DataFrame: 列为 x、y、count（以及extra_columns的格内均值）
+    """
+    if len(df) <= max_points:
+        result = df[[x, y, *extra_columns]].copy()
+        result['count'] = 1
+        return result.reset_index(drop=True)
+
+    xs = df[x].to_numpy(dtype='float64')
+    ys = df[y].to_numpy(dtype='float64')
+    x_low, x_high = np.nanquantile(xs, [0.005, 0.995])
+    y_low, y_high = np.nanquantile(ys, [0.005, 0.995])
+    inside = (xs >= x_low) & (xs <= x_high) & (ys >= y_low) & (ys <= y_high)
+
+    # 离群点过多时抽样，但x/y的最小最大值所在行始终保留
+    outliers = df.loc[~inside, [x, y, *extra_columns]]
+    if len(outliers) > max_points // 10:
+        extremes = outliers.loc[list(_extreme_index(outliers, (x, y)))]
+        sampled = outliers.drop(index=extremes.index).sample(max_points // 10, random_state=RANDOM_SEED)
+        outliers = pd.concat([extremes, sampled])
+    outliers = outliers.assign(count=1)
+
+    budget = max(max_points - len(outliers), 1)
+    bins = max(int(np.sqrt(budget)), 1)
+    x_idx = np.clip(((xs[inside] - x_low) / ((x_high - x_low) or 1) * bins).astype(int), 0, bins - 1)
+    y_idx = np.clip(((ys[inside] - y_low) / ((y_high - y_low) or 1) * bins).astype(int), 0, bins - 1)
+
+    inner = df.loc[inside, [x, y, *extra_columns]]
+    cells = inner.groupby(x_idx * bins + y_idx)
+    binned = cells.mean()
+    binned['count'] = cells.size()
+    return pd.concat([binned.reset_index(drop=True), outliers.reset_index(drop=True)], ignore_index=True)
+
+
+def stratified_sample(df, group, max_points=DEFAULT_MAX_POINTS, extreme_columns=()):
+    """
+    分层抽样：各组按行数比例分配名额，每组至少一个点，并保留每组 extreme_columns 的极值行
+
+    Returns:
+        pandas.DataFrame: 原始行的子集（保持原列）
+    """
+    if len(df) <= max_points:
+        return df
+
+    sizes = df.groupby(group, observed=True).size()
+    sizes = sizes[sizes > 0]
+    quotas = np.maximum((sizes / sizes.sum() * max_points).astype(int), 1)
+
+    keep = []
+    for name, rows in df.groupby(group, observed=True):
+        quota = int(quotas.get(name, 0))
+        if quota <= 0:
+            continue
+        extremes = _extreme_index(rows, extreme_columns)
+        if len(rows) <= quota:
+            keep.extend(rows.index)
+            continue
+        rest = rows.drop(index=list(extremes))
+        take = max(quota - len(extremes), 0)
+        keep.extend(extremes)
+        if take:
+            keep.extend(rest.sample(min(take, len(rest)), random_state=RANDOM_SEED).index)
+    return df.loc[sorted(keep)]
+
+
+def lttb(x, y, threshold=DEFAULT_MAX_POINTS):
+    """
+    Largest-Triangle-Three-Buckets 降采样
+
+    Args:
+        x, y: 一维数组（x需已排序）
+        threshold: 输出点数
+
+    Returns:
+        numpy.ndarray: 选中点的下标
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    # 首尾之外的点均分到 threshold-2 个桶
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        # 下一个桶的平均点（最后一个桶用终点）
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], max(edges[i + 2], edges[i + 1] + 1)
+            avg_x = x[next_start:next_end].mean()
+            avg_y = y[next_start:next_end].mean()
+        else:
+            avg_x, avg_y = x[n - 1], y[n - 1]
+        # 与上一个选中点、下一个桶均值构成的三角形面积最大的点
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample_points(df, x, y, max_points=DEFAULT_MAX_POINTS, mode='stratified', group=None,
+                      extra_columns=()):
+    """
+    按模式把散点数据降到预算以内
+
+    Args:
+        df: 包含 x/y 列的DataFrame（已过滤无效值）
+        max_points: 点数预算
+        mode: grid / stratified / lttb
+        group: 分层抽样的分组列，grid模式下按组分别分箱
+        extra_columns: 需要保留的其他列（grid模式取格内均值，仅限数值列）
+
+    Returns:
+        pandas.DataFrame: grid模式附带count列，其他模式为原始行的子集
+    """
+    if mode not in SAMPLING_MODES:
+        raise ValueError(f'不支持的降采样模式: {mode}')
+    if len(df) <= max_points:
+        return df
+
+    if mode == 'grid':
+        if group is None:
+            return grid_bin(df, x, y, max_points, extra_columns)
+        sizes = df.groupby(group, observed=True).size()
+        parts = []
+        for name, rows in df.groupby(group, observed=True):
+            budget = max(int(max_points * len(rows) / sizes.sum()), 1)
+            parts.append(grid_bin(rows, x, y, budget, extra_columns).assign(**{group: name}))
+        return pd.concat(parts, ignore_index=True)
+
+    if mode == 'stratified':
+        if group is None:
+            return df.sample(max_points, random_state=RANDOM_SEED)
+        return stratified_sample(df, group, max_points, extreme_columns=(x, y))
+
+    ordered = df.sort_values(x, kind='stable')
+    return ordered.iloc[lttb(ordered[x].to_numpy(), ordered[y].to_numpy(), max_points)]
+
+
+def scatter_pairs(df, x, y, max_points=DEFAULT_MAX_POINTS, mode='stratified', group=None):
+    """
+    过滤无效值、降采样后转为 [[x, y], ...]（ECharts散点数据，值为Python float）
+    """
+    columns = [x, y] + ([group] if group else [])
+    valid = df.loc[(df[x] > 0) & (df[y] > 0), columns]
+    sampled = downsample_points(valid, x, y, max_points, mode, group=group)
+    return [[round(float(a), 2), round(float(b), 2)] for a, b in zip(sampled[x], sampled[y])]
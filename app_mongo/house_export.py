@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+房源流式导出
+服务器端游标 + 字段投影，逐批读取、逐行输出NDJSON或CSV，
+无论集合多大，进程内存只保留一个批次的文档
+"""
+
+import csv
+import io
+import json
+
+from .house_search import build_search_query
+from .pagination import normalize_search
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+EXPORT_BATCH_SIZE = 500
+
+# 以这些字符开头的文本会被Excel等当作公式执行（CSV注入），导出时前置单引号
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+# 导出列：列名 -> MongoDB字段路径
+EXPORT_FIELDS = {
+    'id': '_id',
+    'title': 'title',
+    'rental_type': 'rental_type',
+    'city': 'location.city',
+    'street': 'location.street',
+    'building': 'location.building',
+    'area': 'features.area',
+    'direction': 'features.direction',
+    'monthly_rent': 'price.monthly_rent',
+    'tags': 'tags',
+    'source_url': 'crawl_meta.source_url',
+}
+
+# 数值范围过滤：请求参数 -> (字段路径, 比较符)
+RANGE_FILTERS = {
+    'min_price': ('price.monthly_rent', '$gte'),
+    'max_price': ('price.monthly_rent', '$lte'),
+    'min_area': ('features.area', '$gte'),
+    'max_area': ('features.area', '$lte'),
+}
+
+
+def parse_fields(value):
+    """解析fields参数（逗号分隔），未知列忽略，为空时导出全部列"""
+    fields = [name.strip() for name in (value or '').split(',') if name.strip() in EXPORT_FIELDS]
+    return fields or list(EXPORT_FIELDS)
+
+
+def parse_limit(value):
+    """解析limit参数，非法或非正数表示不限制"""
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        return 0
+    return max(limit, 0)
+
+
+def parse_filters(params):
+    """
+    从请求参数解析导出过滤条件
+
+    支持 q（关键词，与表格搜索一致）、city、rental_type、
+    min_price/max_price、min_area/max_area
+
+    Returns:
+        dict: 规范化后的过滤条件（只包含有效项）
+    """
+    filters = {}
+    search_value = normalize_search(params.get('q', ''))
+    if search_value:
+        filters['q'] = search_value
+    for name in ('city', 'rental_type'):
+        value = (params.get(name) or '').strip()
+        if value:
+            filters[name] = value
+    for name in RANGE_FILTERS:
+        try:
+            filters[name] = float(params.get(name))
+        except (TypeError, ValueError):
+            continue
+    return filters
+
+
+def build_export_query(filters):
+    """把过滤条件转换为MongoDB查询"""
+    query = dict(build_search_query(filters.get('q', '')))
+    if 'city' in filters:
+        query['location.city'] = filters['city']
+    if 'rental_type' in filters:
+        query['rental_type'] = filters['rental_type']
+    for name, (path, op) in RANGE_FILTERS.items():
+        if name in filters:
+            query.setdefault(path, {})[op] = filters[name]
+    return query
+
+
+def _lookup(doc, path):
+    value = doc
+    for part in path.split('.'):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def iter_house_rows(collection, filters, fields, limit=0, batch_size=EXPORT_BATCH_SIZE):
+    """
+    按服务器端游标逐条产出导出行（dict，key为导出列名）
+
+    只投影需要的字段，按_id排序保证导出顺序稳定
+    """
+    projection = {EXPORT_FIELDS[name]: 1 for name in fields}
+    if 'id' not in fields:
+        projection['_id'] = 0
+    cursor = collection.find(build_export_query(filters), projection, batch_size=batch_size).sort('_id', 1)
+    if limit:
+        cursor = cursor.limit(limit)
+    try:
+        for doc in cursor:
+            row = {name: _lookup(doc, EXPORT_FIELDS[name]) for name in fields}
+            if 'id' in row:
+                row['id'] = str(row['id'])
+            yield row
+    finally:
+        cursor.close()
+
+
+def ndjson_lines(rows):
+    """每行一个JSON对象"""
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False, default=str) + '\n'
+
+
+def _csv_cell(value):
+    """CSV单元格：列表用|连接，None为空，公式前缀的文本前置单引号"""
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        value = '|'.join(map(str, value))
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_lines(rows, fields):
+    """CSV输出（带UTF-8 BOM，Excel可直接打开），逐行编码"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return data
+
+    writer.writerow(fields)
+    yield '﻿' + flush()
+    for row in rows:
+        writer.writerow([_csv_cell(row[name]) for name in fields])
+        yield flush()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+房源关键词搜索
+基于 HouseDocument.search_keywords 多键索引：查询词切分后用 $all 匹配，
+再按字段权重计算相关度排序；关键词尚未回填时回退到正则搜索
+"""
+
+import logging
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from mongodb_integration.models.search_tokens import (
+    SEARCH_FIELDS, build_search_keywords, query_tokens, query_terms
+)
+from .cache_utils import cache_query_result
+from .models import MongoStats
+
+logger = logging.getLogger(__name__)
+
+# 回填完成标记在stats_cache中的定位键
+SEARCH_STAT_TYPE = 'search_index'
+SEARCH_STAT_KEY = 'search_keywords'
+
+# 参与相关度打分的候选文档上限：排序延迟只与该上限有关，不随匹配条数增长。
+# 候选按关键词索引顺序选取，匹配超过上限的高频词只在前 MAX_RANK_CANDIDATES 条中排序
+MAX_RANK_CANDIDATES = 2000
+
+# 正则回退时搜索的字段（与关键词字段一致）
+REGEX_FIELDS = [path for path, _weight in SEARCH_FIELDS]
+
+
+@cache_query_result(timeout=60, key_prefix='search_ready')
+def keywords_ready():
+    """关键词是否已回填完成（回填命令结束时写入标记）"""
+    try:
+        return MongoStats.objects(stat_type=SEARCH_STAT_TYPE, stat_key=SEARCH_STAT_KEY).only('id').first() is not None
+    except Exception as e:
+        logger.warning(f"读取搜索索引状态失败: {e}")
+        return False
+
+
+def _regex_query(search_value):
+    """旧的多字段正则搜索（关键词未就绪时使用）"""
+    return {
+        '$or': [{path: {'$regex': search_value, '$options': 'i'}} for path in REGEX_FIELDS]
+    }
+
+
+def build_search_query(search_value):
+    """
+    根据搜索词构建MongoDB查询条件
+
+    Args:
+        search_value: 已规范化的搜索词
+
+    Returns:
+        dict: 查询条件，搜索词为空时返回空字典
+    """
+    if not search_value:
+        return {}
+    tokens = query_tokens(search_value)
+    if not tokens or not keywords_ready():
+        return _regex_query(search_value)
+    return {'search_keywords': {'$all': tokens}}
+
+
+def relevance_stages(search_value):
+    """
+    相关度打分阶段：每个搜索片段出现在某字段中即加上该字段权重，
+    出现在标题开头额外加分
+    """
+    terms = query_terms(search_value) or [search_value]
+    score_parts = []
+    for term in terms:
+        for path, weight in SEARCH_FIELDS:
+            field = {'$toLower': {'$ifNull': [f'${path}', '']}}
+            score_parts.append({
+                '$cond': [{'$gte': [{'$indexOfCP': [field, term]}, 0]}, weight, 0]
+            })
+        title = {'$toLower': {'$ifNull': ['$title', '']}}
+        score_parts.append({'$cond': [{'$eq': [{'$indexOfCP': [title, term]}, 0]}, 5, 0]})
+    return [{'$addFields': {'_score': {'$add': score_parts}}}]
+
+
+def ranked_search(collection, search_value, skip=0, limit=20, base_query=None, projection=None):
+    """
+    按相关度排序返回一页搜索结果
+
+    Args:
+        collection: pymongo集合
+        search_value: 已规范化的搜索词
+        skip: 跳过条数
+        limit: 返回条数
+        base_query: 额外的过滤条件（城市、价格等）
+        projection: 返回字段
+
+    Returns:
+        list: 文档列表（含 _score 字段）
+    """
+    query = build_search_query(search_value)
+    if base_query:
+        query = {'$and': [base_query, query]} if query else base_query
+
+    # 候选集先由关键词多键索引收窄，再截取上限条数打分（至少覆盖请求的页），
+    # $sort后紧跟$skip/$limit时按top-k排序，内存只保留skip+limit条
+    pipeline = [
+        {'$match': query},
+        {'$limit': max(MAX_RANK_CANDIDATES, skip + limit)},
+    ]
+    pipeline.extend(relevance_stages(search_value))
+    pipeline.append({'$sort': {'_score': -1, '_id': 1}})
+    pipeline.append({'$skip': skip})
+    pipeline.append({'$limit': limit})
+    if projection:
+        pipeline.append({'$project': dict(projection, _score=1)})
+    return list(collection.aggregate(pipeline))
+
+
+def backfill_search_keywords(collection, batch_size=1000, rebuild=False):
+    """
+    为已有房源生成搜索关键词并写入完成标记
+
+    Args:
+        collection: pymongo集合
+        batch_size: 每批bulk_write的文档数
+        rebuild: 为True时重建全部文档，否则只处理缺少关键词的文档
+
+    Returns:
+        int: 更新的文档数
+    """
+    projection = {path: 1 for path, _weight in SEARCH_FIELDS}
+    projection['tags'] = 1
+    query = {} if rebuild else {'search_keywords': {'$exists': False}}
+
+    updated = 0
+    ops = []
+    for doc in collection.find(query, projection, batch_size=batch_size):
+        ops.append(UpdateOne({'_id': doc['_id']}, {'$set': {'search_keywords': build_search_keywords(doc)}}))
+        if len(ops) >= batch_size:
+            updated += collection.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += collection.bulk_write(ops, ordered=False).modified_count
+
+    MongoStats.objects(stat_type=SEARCH_STAT_TYPE, stat_key=SEARCH_STAT_KEY).update_one(
+        upsert=True,
+        set__stat_value={'updated': updated, 'finished_at': datetime.now()},
+        set__updated_time=datetime.now(),
+        set_on_insert__created_time=datetime.now()
+    )
+    logger.info(f"搜索关键词回填完成，更新 {updated} 条")
+    return updated
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""
+回填房源搜索关键词
+新写入的房源由 HouseDocument.save() 自动生成关键词，已有数据执行一次：
+python manage.py build_search_keywords
+"""
+
+from django.core.management.base import BaseCommand
+
+from app_mongo.house_search import backfill_search_keywords
+from mongodb_integration.mongodb_config import get_collection
+
+
+class Command(BaseCommand):
+    help = '为已有房源生成search_keywords并建立多键索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批写入的文档数')
+        parser.add_argument('--rebuild', action='store_true', help='重建全部文档的关键词')
+
+    def handle(self, *args, **options):
+        collection = get_collection()
+        collection.create_index('search_keywords')
+
+        updated = backfill_search_keywords(
+            collection, batch_size=options['batch_size'], rebuild=options['rebuild']
+        )
+        # Web进程中的就绪状态缓存60秒后过期，之后搜索自动切换到关键词索引
+        self.stdout.write(self.style.SUCCESS(f"✅ 搜索关键词回填完成，更新 {updated} 条"))
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+全量重建房源统计汇总
+首次启用增量汇总时必须执行一次，之后可定期校正最小/最大值等无法增量回退的指标：
+python manage.py reconcile_stats_rollup --interval 3600
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from mongodb_integration.mongodb_config import get_database
+from mongodb_integration.stats_rollup import reconcile_rollups
+
+
+class Command(BaseCommand):
+    help = '从houses集合重建stats_cache中的城市/类型/朝向/面积区间汇总'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='循环重建间隔（秒），0表示只执行一次'
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            started = time.time()
+            written = reconcile_rollups(get_database())
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ 统计汇总已重建: {written} 个分组，耗时 {time.time() - started:.2f}s"
+            ))
+            if interval <= 0:
+                break
+            time.sleep(interval)
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+刷新首页仪表板快照
+可由计划任务定期执行，例如：python manage.py refresh_dashboard_snapshot --interval 300
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from app_mongo.dashboard_snapshot import refresh_dashboard_snapshot
+
+
+class Command(BaseCommand):
+    help = '重新计算mongo_index使用的仪表板快照'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='循环刷新间隔（秒），0表示只刷新一次'
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            snapshot = refresh_dashboard_snapshot()
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ 快照已刷新: 房源 {snapshot['houseslength']} 条, 用户 {snapshot['userlength']} 个"
+            ))
+            if interval <= 0:
+                break
+            time.sleep(interval)
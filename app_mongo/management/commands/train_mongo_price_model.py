@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+基于MongoDB房源训练租金预测模型并注册为新版本
+例如：python manage.py train_mongo_price_model --n-jobs -1 --batch-size 5000
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app_mongo import mongo_price_model
+from mongodb_integration.mongodb_config import get_collection
+
+
+class Command(BaseCommand):
+    help = '从MongoDB分批读取房源，训练随机森林租金模型'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--n-estimators', type=int, default=100, help='决策树数量')
+        parser.add_argument('--n-jobs', type=int, default=-1, help='并行核心数，-1表示全部核心')
+        parser.add_argument('--batch-size', type=int, default=5000, help='每批读取的文档数')
+        parser.add_argument('--no-activate', action='store_true', help='只保存，不切换为当前版本')
+
+    def handle(self, *args, **options):
+        try:
+            version = mongo_price_model.train_mongo_price_model(
+                get_collection(),
+                n_estimators=options['n_estimators'],
+                n_jobs=options['n_jobs'],
+                batch_size=options['batch_size'],
+                activate=not options['no_activate']
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        meta = mongo_price_model.registry.read_meta(version)
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ 模型训练完成，版本 {version}，样本 {meta.get('n_samples')} 条，耗时 {meta.get('train_seconds')}s"
+        ))
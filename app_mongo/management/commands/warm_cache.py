@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+缓存预热
+部署后或数据导入后执行，例如：python manage.py warm_cache --task house_stats --task price_impact
+"""
+
+from django.core.management.base import BaseCommand
+
+from app_mongo.cache_warmup import get_tasks, prime_all
+
+
+class Command(BaseCommand):
+    help = '立即执行缓存预热任务'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--task', action='append', dest='tasks', default=[],
+            help='只预热指定任务（可重复），默认全部'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=None,
+            help='同时执行的任务数，默认使用settings.CACHE_WARMUP'
+        )
+
+    def handle(self, *args, **options):
+        tasks = get_tasks()
+        unknown = [name for name in options['tasks'] if name not in tasks]
+        if unknown:
+            self.stderr.write(self.style.ERROR(f"未知的预热任务: {', '.join(unknown)}（可选: {', '.join(tasks)}）"))
+            return
+
+        results = prime_all(options['tasks'] or None, options['concurrency'])
+        for name, (elapsed, error) in results.items():
+            if error:
+                self.stderr.write(self.style.ERROR(f"❌ {name} 预热失败: {error}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"✅ {name} 预热完成 ({elapsed:.2f}s)"))
@@ -7,6 +7,10 @@ MongoDB模型定义
 import mongoengine as me
 from datetime import datetime
 from mongoengine import fields
+from mongodb_integration.mongodb_config import (
+    MONGODB_URI_NO_AUTH, MONGODB_URI_ADMIN, MONGODB_DATABASE,
+    get_mongodb_client, shared_client_factory, release_mongodb_client, set_default_uri
+)
 
 # 连接MongoDB - 无认证配置（修复版本）
 try:
@@ -22,54 +26,40 @@ def safe_mongodb_connect():
     """安全的MongoDB连接函数"""
     global MONGODB_CONNECTION_SUCCESS
 
+    # 连接池大小、超时和读偏好由共享客户端注册表统一配置（settings.MONGODB_CLIENT_OPTIONS）
     connection_attempts = [
         # 方案1：尝试无认证连接（开发环境端口27017）
         {
-            'params': {
-                'db': 'house_data',
-                'host': '127.0.0.1',
-                'port': 27017,
-                'maxPoolSize': 10,
-                'serverSelectionTimeoutMS': 3000,
-                'connectTimeoutMS': 5000,
-                'socketTimeoutMS': 10000
-            },
+            'uri': MONGODB_URI_NO_AUTH,
             'name': '无认证连接'
         },
         # 方案2：尝试常见的管理员认证
         {
-            'params': {
-                'db': 'house_data',
-                'host': '127.0.0.1',
-                'port': 27017,
-                'username': 'admin',
-                'password': 'admin123',
-                'authentication_source': 'admin',
-                'maxPoolSize': 10,
-                'serverSelectionTimeoutMS': 3000,
-                'connectTimeoutMS': 5000,
-                'socketTimeoutMS': 10000
-            },
+            'uri': MONGODB_URI_ADMIN,
             'name': '管理员认证连接'
         }
     ]
 
     for attempt in connection_attempts:
         try:
-            me.disconnect()
-            me.connect(**attempt['params'])
+            client = get_mongodb_client(attempt['uri'])
             # 测试连接和数据操作
-            me.connection.get_db().command('ping')
+            client.admin.command('ping')
 
             # 测试实际的数据操作（这是关键）
-            test_collection = me.connection.get_db().test_collection
-            test_collection.find_one()  # 尝试查询操作
+            client[MONGODB_DATABASE].test_collection.find_one()  # 尝试查询操作
+
+            # 视图与MongoEngine共用同一个客户端
+            set_default_uri(attempt['uri'])
+            me.disconnect()
+            me.connect(db=MONGODB_DATABASE, host=attempt['uri'], mongo_client_class=shared_client_factory)
 
             print(f"✅ MongoDB {attempt['name']} 成功")
             MONGODB_CONNECTION_SUCCESS = True
             return True
         except Exception as e:
             print(f"❌ {attempt['name']} 失败: {e}")
+            release_mongodb_client(attempt['uri'])
             continue
 
     print("❌ 所有MongoDB连接方式都失败，将使用降级模式")
@@ -123,6 +113,7 @@ class MongoHistory(me.Document):
 
 # 重新导入已有的房源模型
 from mongodb_integration.models.mongo_models import HouseDocument
+from mongodb_integration.stats_rollup import read_rollups, TOTAL_DIMENSION
 
 class MongoStats(me.Document):
     """MongoDB统计缓存模型"""
@@ -247,10 +238,22 @@ class MongoQueryHelper:
     @staticmethod
     def get_house_stats():
         """获取房源统计信息"""
-        from .cache_utils import cache_aggregation_result
+        from .cache_utils import cache_aggregation_result, house_tags
 
-        @cache_aggregation_result(timeout=600, key_prefix='house_stats')
+        @cache_aggregation_result(timeout=600, key_prefix='house_stats', tags=house_tags())
         def _get_stats():
+            # 优先读取增量维护的汇总文档
+            total = read_rollups(MongoStats._get_db(), TOTAL_DIMENSION)
+            if total:
+                return {
+                    '_id': None,
+                    'total_count': total[0]['count'],
+                    'avg_price': total[0]['avg_price'],
+                    'max_price': total[0]['max_price'],
+                    'min_price': total[0]['min_price'],
+                    'avg_area': total[0]['avg_area']
+                }
+
             pipeline = [
                 {
                     '$group': {
@@ -271,10 +274,14 @@ class MongoQueryHelper:
     @staticmethod
     def get_city_distribution():
         """获取城市分布统计"""
-        from .cache_utils import cache_aggregation_result
+        from .cache_utils import cache_aggregation_result, house_tags
 
-        @cache_aggregation_result(timeout=600, key_prefix='city_dist')
+        @cache_aggregation_result(timeout=600, key_prefix='city_dist', tags=house_tags())
         def _get_distribution():
+            rollups = read_rollups(MongoStats._get_db(), 'city')
+            if rollups:
+                return [{'_id': row['name'], 'count': row['count']} for row in rollups]
+
             pipeline = [
                 {
                     '$group': {
@@ -293,10 +300,14 @@ class MongoQueryHelper:
     @staticmethod
     def get_type_distribution():
         """获取房型分布统计"""
-        from .cache_utils import cache_aggregation_result
+        from .cache_utils import cache_aggregation_result, house_tags
 
-        @cache_aggregation_result(timeout=600, key_prefix='type_dist')
+        @cache_aggregation_result(timeout=600, key_prefix='type_dist', tags=house_tags())
         def _get_distribution():
+            rollups = read_rollups(MongoStats._get_db(), 'type')
+            if rollups:
+                return [{'_id': row['name'], 'count': row['count']} for row in rollups]
+
             pipeline = [
                 {
                     '$group': {
@@ -333,18 +344,23 @@ class MongoQueryHelper:
     @staticmethod
     def search_houses(filters=None, page=1, page_size=20):
         """高级房源搜索 - 性能优化版本"""
-        from .cache_utils import cache_query_result
+        import json
+        from .cache_utils import cache_query_result, house_tags
+        from .house_search import build_search_query, ranked_search
+        from .pagination import normalize_search
 
         # 为搜索结果添加缓存（较短的缓存时间）
-        cache_key = f"search_{hash(str(filters))}_{page}_{page_size}"
+        # 筛选条件与分页参数作为参数传入，参与缓存键；按城市筛选时只依赖该城市的标签
+        filters_key = json.dumps(filters or {}, sort_keys=True, ensure_ascii=False, default=str)
+        search_tags = house_tags((filters or {}).get('city'))
 
         # 对于显示全部数据的请求，不使用缓存以避免内存问题
         if page_size >= 1000:  # 大数据量请求不缓存
-            def _search_with_cache():
+            def _search_with_cache(filters_key, page, page_size):
                 query = HouseDocument.objects
         else:
-            @cache_query_result(timeout=180, key_prefix='search')  # 小数据量请求使用缓存
-            def _search_with_cache():
+            @cache_query_result(timeout=180, key_prefix='search', tags=search_tags)  # 小数据量请求使用缓存
+            def _search_with_cache(filters_key, page, page_size):
                 query = HouseDocument.objects
 
                 # 只选择必要的字段以提高性能
@@ -353,6 +369,8 @@ class MongoQueryHelper:
                     'location.building', 'price.monthly_rent', 'features.area',
                     'features.room_type', 'images'
                 )
+                keyword = None
+                base_query = {}
 
                 if filters:
                     # 城市筛选
@@ -375,9 +393,11 @@ class MongoQueryHelper:
                     if filters.get('max_area'):
                         query = query.filter(features__area__lte=filters['max_area'])
 
-                    # 关键词搜索
-                    if filters.get('keyword'):
-                        query = query.filter(title__icontains=filters['keyword'])
+                    # 关键词搜索：走search_keywords多键索引，不再对标题做icontains全表扫描
+                    keyword = normalize_search(filters.get('keyword'))
+                    if keyword:
+                        base_query = dict(query._query)
+                        query = query.filter(__raw__=build_search_query(keyword))
 
                 # 优化分页查询
                 offset = (page - 1) * page_size
@@ -391,7 +411,18 @@ class MongoQueryHelper:
                 total = total_result[0]['total'] if total_result else 0
 
                 # 获取分页数据 - 处理显示全部的情况
-                if page_size >= total:
+                if keyword:
+                    # 有关键词时按相关度排序，再按排序后的ID取回完整文档
+                    show_all = page_size >= total
+                    ranked = ranked_search(
+                        HouseDocument._get_collection(), keyword,
+                        skip=0 if show_all else offset, limit=max(total, 1) if show_all else page_size,
+                        base_query=base_query, projection={'_id': 1}
+                    )
+                    ranked_ids = [doc['_id'] for doc in ranked]
+                    docs_by_id = {doc.id: doc for doc in query.filter(id__in=ranked_ids)}
+                    houses = [docs_by_id[_id] for _id in ranked_ids if _id in docs_by_id]
+                elif page_size >= total:
                     # 显示全部数据，不使用分页
                     houses = list(query)
                 else:
@@ -406,7 +437,7 @@ class MongoQueryHelper:
                     'total_pages': (total + page_size - 1) // page_size
                 }
 
-        return _search_with_cache()
+        return _search_with_cache(filters_key, page, page_size)
 
 # 性能监控工具
 class PerformanceMonitor:
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+基于MongoDB房源文档的租金预测模型
+特征：面积、房型、租赁类型、朝向、城市、行政区、标签；
+训练数据按投影字段分批从游标读取，预测接受任意数量的假设房源一次批量打分
+"""
+
+import itertools
+import logging
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder
+
+from app.utils.model_registry import ModelRegistry
+
+logger = logging.getLogger(__name__)
+
+CATEGORICAL_FEATURES = ['rental_type', 'room_type', 'direction', 'city', 'district']
+NUMERIC_FEATURES = ['area']
+TAG_FEATURE = 'tags'
+FEATURES = NUMERIC_FEATURES + CATEGORICAL_FEATURES + [TAG_FEATURE]
+TARGET = 'price'
+
+# 训练时从MongoDB读取的字段
+TRAINING_PROJECTION = {
+    '_id': 0,
+    'rental_type': 1,
+    'features.area': 1,
+    'features.room_type': 1,
+    'features.direction': 1,
+    'location.city': 1,
+    'location.district': 1,
+    'tags': 1,
+    'price.monthly_rent': 1
+}
+
+# 单次预测请求允许的最大房源数
+MAX_PREDICT_BATCH = 20000
+
+registry = ModelRegistry('mongo_house_price')
+
+
+def split_tags(value):
+    """标签字段分词（模块级函数，模型可被joblib序列化）"""
+    if not value:
+        return []
+    return [tag for tag in value.split('|') if tag]
+
+
+def _join_tags(tags):
+    if not isinstance(tags, (list, tuple, str)):
+        return ''
+    if isinstance(tags, str):
+        tags = tags.replace('，', ',').split(',')
+    return '|'.join(str(tag).strip() for tag in (tags or []) if str(tag).strip())
+
+
+def _flatten(doc):
+    """嵌套文档 -> 扁平特征行"""
+    location = doc.get('location') or {}
+    features = doc.get('features') or {}
+    price = doc.get('price') or {}
+    return {
+        'area': features.get('area'),
+        'rental_type': doc.get('rental_type'),
+        'room_type': features.get('room_type'),
+        'direction': features.get('direction'),
+        'city': location.get('city'),
+        'district': location.get('district'),
+        'tags': doc.get('tags') or [],
+        'price': price.get('monthly_rent')
+    }
+
+
+def prepare_frame(records):
+    """
+    规范化特征列：面积转float32，分类列填充空字符串，标签拼成 a|b|c
+
+    Args:
+        records: 扁平特征字典列表
+    """
+    df = pd.DataFrame.from_records(records, columns=FEATURES + [TARGET])
+    df['area'] = pd.to_numeric(df['area'], errors='coerce').astype('float32')
+    for column in CATEGORICAL_FEATURES:
+        df[column] = df[column].fillna('').astype(str)
+    df[TAG_FEATURE] = df[TAG_FEATURE].map(_join_tags)
+    return df
+
+
+def iter_training_batches(collection, batch_size=5000):
+    """
+    按批读取训练数据，每批是一个只含特征列的DataFrame
+
+    Args:
+        collection: 房源集合
+        batch_size: 每批文档数（同时作为游标batch_size）
+    """
+    cursor = collection.find(
+        {'price.monthly_rent': {'$gt': 0}, 'features.area': {'$gt': 0}},
+        TRAINING_PROJECTION,
+        batch_size=batch_size
+    )
+    batch = []
+    for doc in cursor:
+        batch.append(_flatten(doc))
+        if len(batch) >= batch_size:
+            yield prepare_frame(batch)
+            batch = []
+    if batch:
+        yield prepare_frame(batch)
+
+
+def build_model(n_estimators=100, n_jobs=-1):
+    preprocessor = ColumnTransformer(
+        transformers=[
+            ('num', 'passthrough', NUMERIC_FEATURES),
+            ('cat', OneHotEncoder(handle_unknown='ignore', min_frequency=3), CATEGORICAL_FEATURES),
+            ('tags', CountVectorizer(analyzer=split_tags, binary=True, max_features=200), TAG_FEATURE)
+        ]
+    )
+    return Pipeline(steps=[
+        ('preprocessor', preprocessor),
+        ('regressor', RandomForestRegressor(n_estimators=n_estimators, n_jobs=n_jobs, min_samples_leaf=2))
+    ])
+
+
+def _type_defaults(df):
+    """每种租赁类型最常见的房型/朝向，用于补全预测请求中缺失的字段"""
+    defaults = {}
+    for rental_type, group in df.groupby('rental_type'):
+        defaults[rental_type] = {
+            column: Counter(v for v in group[column] if v).most_common(1)[0][0]
+            for column in ('room_type', 'direction')
+            if any(group[column])
+        }
+    return defaults
+
+
+def train_mongo_price_model(collection, n_estimators=100, n_jobs=-1, batch_size=5000, activate=True):
+    """
+    从MongoDB流式读取数据训练模型并注册新版本
+
+    Returns:
+        str: 版本号
+    """
+    started = time.time()
+    batches = list(iter_training_batches(collection, batch_size=batch_size))
+    if not batches:
+        raise ValueError('No data available')
+    data = pd.concat(batches, ignore_index=True)
+
+    model = build_model(n_estimators=n_estimators, n_jobs=n_jobs)
+    model.fit(data[FEATURES], data[TARGET].astype('float64'))
+    model.named_steps['regressor'].set_params(n_jobs=1)
+
+    return registry.register(model, meta={
+        'n_samples': int(len(data)),
+        'n_estimators': n_estimators,
+        'features': FEATURES,
+        'median_area': float(data['area'].median()),
+        'type_defaults': _type_defaults(data),
+        'train_seconds': round(time.time() - started, 2)
+    }, activate=activate)
+
+
+def expand_grid(grid):
+    """
+    what-if网格：{'city': [...], 'area': [...], ...} 的笛卡尔积
+
+    Returns:
+        list: 假设房源列表
+    """
+    keys = [k for k in FEATURES if k in grid]
+    values = [grid[k] if isinstance(grid[k], list) else [grid[k]] for k in keys]
+    size = int(np.prod([len(v) for v in values])) if values else 0
+    if size > MAX_PREDICT_BATCH:
+        raise ValueError(f'网格大小 {size} 超过上限 {MAX_PREDICT_BATCH}')
+    return [dict(zip(keys, combo)) for combo in itertools.product(*values)]
+
+
+def predict_listings(listings):
+    """
+    一次批量预测
+
+    Args:
+        listings: 假设房源列表，字段为 area/rental_type/room_type/direction/city/district/tags，
+                  缺失的房型/朝向按训练集中同租赁类型最常见值补全，缺失面积用训练集中位数
+
+    Returns:
+        tuple: (预测价格列表, 模型元数据)
+    """
+    if len(listings) > MAX_PREDICT_BATCH:
+        raise ValueError(f'单次最多预测 {MAX_PREDICT_BATCH} 条')
+
+    model, meta = registry.load()
+    df = prepare_frame(listings)
+    if df.empty:
+        return [], meta
+
+    df['area'] = df['area'].fillna(meta.get('median_area', 0))
+    for rental_type, defaults in (meta.get('type_defaults') or {}).items():
+        mask = df['rental_type'] == rental_type
+        for column, value in defaults.items():
+            df.loc[mask & (df[column] == ''), column] = value
+
+    prices = model.predict(df[FEATURES])
+    return [round(float(p), 2) for p in prices], meta
+
+
+def predict_matrix(cities, types, areas=None):
+    """
+    预测 租赁类型×城市 矩阵
+
+    Args:
+        cities: 城市列表
+        types: 租赁类型列表
+        areas: {租赁类型: [各城市平均面积]}，缺失时用训练集中位数
+
+    Returns:
+        dict: {租赁类型: [各城市预测价格]}
+    """
+    listings = [
+        {
+            'rental_type': house_type,
+            'city': city,
+            'area': (areas or {}).get(house_type, [None] * len(cities))[i]
+        }
+        for house_type in types
+        for i, city in enumerate(cities)
+    ]
+    prices, _meta = predict_listings(listings)
+    return {
+        house_type: prices[row * len(cities):(row + 1) * len(cities)]
+        for row, house_type in enumerate(types)
+    }
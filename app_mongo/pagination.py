@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+键集（游标）分页工具
+按 (排序列, _id) 定位下一页，深分页与第一页代价相同，避免skip逐条扫描
+"""
+
+import base64
+import hashlib
+
+from bson import json_util
+
+
+def normalize_search(search_value):
+    """规范化搜索词：去首尾空白、合并空白、转小写"""
+    return ' '.join((search_value or '').split()).lower()
+
+
+def search_fingerprint(search_value):
+    """规范化搜索词的短摘要，用于校验游标和构造缓存键"""
+    return hashlib.md5(normalize_search(search_value).encode('utf-8')).hexdigest()[:12]
+
+
+def encode_cursor(last_doc, sort_column, sort_order, next_start, search_value=''):
+    """
+    根据当前页最后一条文档生成不透明游标
+
+    Args:
+        last_doc: 当前页最后一条文档
+        sort_column: 排序字段（支持点号路径）
+        sort_order: 1 升序 / -1 降序
+        next_start: 下一页的起始偏移
+        search_value: 当前搜索词
+
+    Returns:
+        str: URL安全的base64游标
+    """
+    value = last_doc
+    for part in sort_column.split('.'):
+        value = value.get(part) if isinstance(value, dict) else None
+
+    payload = {
+        'k': sort_column,
+        'o': sort_order,
+        's': next_start,
+        'q': search_fingerprint(search_value),
+        'v': value,
+        'id': last_doc.get('_id')
+    }
+    raw = json_util.dumps(payload).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(token, sort_column, sort_order, start, search_value=''):
+    """
+    解析游标，排序、搜索词或偏移不一致时返回None（调用方回退到skip分页）
+    """
+    if not token:
+        return None
+    try:
+        payload = json_util.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+    except Exception:
+        return None
+
+    if (payload.get('k') != sort_column or payload.get('o') != sort_order
+            or payload.get('s') != start or payload.get('q') != search_fingerprint(search_value)):
+        return None
+    return payload
+
+
+def build_keyset_query(base_query, cursor, sort_column, sort_order):
+    """
+    在基础查询上追加"位于游标之后"的条件
+
+    排序为 [(sort_column, sort_order), ('_id', sort_order)]，_id 作为并列值的决胜字段
+    """
+    value = cursor['v']
+    last_id = cursor['id']
+    op = '$gt' if sort_order == 1 else '$lt'
+
+    if value is None:
+        # MongoDB中null排在最前：升序时先翻完null再进入非null部分，降序时null已是末尾
+        if sort_order == 1:
+            after = {'$or': [
+                {sort_column: None, '_id': {op: last_id}},
+                {sort_column: {'$ne': None}}
+            ]}
+        else:
+            after = {sort_column: None, '_id': {op: last_id}}
+    else:
+        after = {'$or': [
+            {sort_column: {op: value}},
+            {sort_column: value, '_id': {op: last_id}}
+        ]}
+        if sort_order == -1:
+            after['$or'].append({sort_column: None})
+
+    if base_query:
+        return {'$and': [base_query, after]}
+    return after
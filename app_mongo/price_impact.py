@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+价格影响因素分析
+面积区间、房型、朝向、城市四个维度的均价/数量/分位数：
+正常模式用一次 $facet 聚合完成，降级模式用一次pandas分组完成
+"""
+
+import logging
+
+import pandas as pd
+from pymongo.errors import OperationFailure
+
+from mongodb_integration.stats_rollup import AREA_BOUNDARIES, AREA_LABELS
+from .cache_utils import cache_aggregation_result, house_tags
+
+logger = logging.getLogger(__name__)
+
+# 降级数据的朝向是规范值，按列表精确匹配
+VALID_DIRECTIONS = ['东', '南', '西', '北', '东南', '东北', '西南', '西北', '南北', '东西']
+# MongoDB中爬取的朝向可能是"朝南"、"南 北"等组合写法，与原实现一致按包含方位字匹配，按原值分组
+DIRECTION_PATTERN = '东|南|西|北'
+
+# 输出的分位数
+PERCENTILES = [0.25, 0.5, 0.75]
+
+# 聚合结果缓存时间（秒）
+PRICE_IMPACT_TIMEOUT = 600
+
+
+def _group_stage(key, with_percentiles):
+    group = {
+        '_id': key,
+        'avg_price': {'$avg': '$price.monthly_rent'},
+        'count': {'$sum': 1}
+    }
+    if with_percentiles:
+        # $percentile 需要 MongoDB 7.0+
+        group['percentiles'] = {
+            '$percentile': {'input': '$price.monthly_rent', 'p': PERCENTILES, 'method': 'approximate'}
+        }
+    return group
+
+
+def build_price_impact_pipeline(with_percentiles=True):
+    """构建单次往返的 $facet 聚合管道"""
+    area_bucket = {
+        'groupBy': '$features.area',
+        'boundaries': AREA_BOUNDARIES,
+        'default': 'other',
+        'output': {k: v for k, v in _group_stage(None, with_percentiles).items() if k != '_id'}
+    }
+    return [
+        {'$project': {
+            'price.monthly_rent': 1, 'features.area': 1, 'features.direction': 1,
+            'rental_type': 1, 'location.city': 1
+        }},
+        {'$facet': {
+            'area': [
+                {'$match': {'features.area': {'$gte': AREA_BOUNDARIES[0], '$lt': AREA_BOUNDARIES[-1]}}},
+                {'$bucket': area_bucket}
+            ],
+            'type': [
+                {'$group': _group_stage('$rental_type', with_percentiles)},
+                {'$sort': {'avg_price': -1}}
+            ],
+            'direction': [
+                {'$match': {'features.direction': {'$regex': DIRECTION_PATTERN}}},
+                {'$group': _group_stage('$features.direction', with_percentiles)},
+                {'$sort': {'avg_price': -1}}
+            ],
+            'city': [
+                {'$group': _group_stage('$location.city', with_percentiles)},
+                {'$sort': {'avg_price': -1}}
+            ]
+        }}
+    ]
+
+
+def _format_item(name, avg_price, count, percentiles=None):
+    item = {
+        'name': name,
+        'value': round(float(avg_price), 2),
+        'count': int(count)
+    }
+    if percentiles:
+        item.update({
+            f'p{int(p * 100)}': round(float(v), 2)
+            for p, v in zip(PERCENTILES, percentiles) if v is not None
+        })
+    return item
+
+
+def _format_groups(rows, names=None):
+    data = []
+    for row in rows:
+        key = row['_id']
+        name = names.get(key) if names is not None else key
+        if name and row.get('avg_price'):
+            data.append(_format_item(name, row['avg_price'], row['count'], row.get('percentiles')))
+    return data
+
+
+@cache_aggregation_result(timeout=PRICE_IMPACT_TIMEOUT, key_prefix='price_impact', tags=house_tags())
+def get_price_impact_data():
+    """
+    正常模式：一次聚合得到四个维度的价格影响数据
+
+    Returns:
+        dict: area_price_data / type_price_data / direction_price_data / city_price_data
+    """
+    from mongodb_integration.mongodb_config import get_collection
+
+    collection = get_collection()
+    try:
+        result = list(collection.aggregate(build_price_impact_pipeline()))
+    except OperationFailure as e:
+        # 旧版本MongoDB不支持 $percentile，去掉分位数重试
+        logger.info(f"$percentile不可用，回退为不含分位数的聚合: {e}")
+        result = list(collection.aggregate(build_price_impact_pipeline(with_percentiles=False)))
+
+    facets = result[0] if result else {}
+    area_names = dict(zip(AREA_BOUNDARIES[:-1], AREA_LABELS))
+    return {
+        'area_price_data': _format_groups(facets.get('area', []), area_names),
+        'type_price_data': _format_groups(facets.get('type', [])),
+        'direction_price_data': _format_groups(facets.get('direction', [])),
+        'city_price_data': _format_groups(facets.get('city', []))
+    }
+
+
+def _summarize(df, key):
+    grouped = df.groupby(key, observed=True)['price']
+    stats = grouped.agg(['mean', 'count'])
+    quantiles = grouped.quantile(PERCENTILES).unstack()
+    return [
+        _format_item(name, mean, count, quantiles.loc[name].tolist())
+        for name, mean, count in zip(stats.index, stats['mean'], stats['count'])
+        if mean
+    ]
+
+
+def _sort_by_value(data):
+    return sorted(data, key=lambda x: x['value'], reverse=True)
+
+
+def fallback_price_impact(houses):
+    """
+    降级模式：把模拟数据装入一个DataFrame，一次分组得到四个维度
+
+    Args:
+        houses: 扁平结构的房源字典列表（FALLBACK_HOUSES_10K）
+    """
+    df = pd.DataFrame.from_records(houses)
+    if 'direction' not in df.columns:
+        df['direction'] = df.get('orientation')
+    df['price'] = pd.to_numeric(df['price'], errors='coerce').fillna(0)
+    df['area'] = pd.to_numeric(df['area'], errors='coerce').fillna(0)
+    df['area_range'] = pd.cut(df['area'], bins=AREA_BOUNDARIES, labels=AREA_LABELS, right=False)
+    df['rental_type'] = df['rental_type'].fillna('未知')
+    df['city'] = df['city'].fillna('未知')
+
+    area_data = _summarize(df.dropna(subset=['area_range']), 'area_range')
+    direction_df = df[df['direction'].isin(VALID_DIRECTIONS)]
+
+    return {
+        'area_price_data': area_data,
+        'type_price_data': _summarize(df, 'rental_type'),
+        'direction_price_data': _sort_by_value(_summarize(direction_df, 'direction')),
+        'city_price_data': _sort_by_value(_summarize(df, 'city'))
+    }
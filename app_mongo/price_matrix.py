@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+城市×房型价格矩阵
+一次 $group 按 {rental_type, location.city} 计算全部格子的均价，
+结果存入stats_cache；爬虫管道写入新房源后删除该文档，下次读取时重新计算
+"""
+
+import logging
+from datetime import datetime
+
+from .models import MongoStats
+
+logger = logging.getLogger(__name__)
+
+# 矩阵在stats_cache中的定位键（stat_type与 mongodb_integration.derived_stats 保持一致）
+MATRIX_STAT_TYPE = 'price_matrix'
+MATRIX_STAT_KEY = 'city_type'
+
+# 缺少样本时的估算参数
+BASE_PRICES = {'整租': 4000, '合租': 2000, '单间': 1500}
+CITY_FACTORS = {'广州': 1.2, '深圳': 1.5, '佛山': 0.8}
+DEFAULT_BASE_PRICE = 2500
+
+
+def estimate_price(house_type, city):
+    """没有实际数据的格子按房型和城市系数估算"""
+    base_price = next((price for key, price in BASE_PRICES.items() if key in house_type), DEFAULT_BASE_PRICE)
+    city_factor = next((factor for key, factor in CITY_FACTORS.items() if key in city), 1.0)
+    return round(base_price * city_factor, 2)
+
+
+def build_price_matrix(collection):
+    """
+    一次聚合计算城市×房型均价矩阵
+
+    Args:
+        collection: 房源集合
+
+    Returns:
+        dict: cities / types / predictions({房型: [各城市均价]}) / areas({房型: [各城市平均面积]}) / generated_at
+    """
+    pipeline = [
+        {'$group': {
+            '_id': {'type': '$rental_type', 'city': '$location.city'},
+            # 只对正价格求均值，$avg会忽略null
+            'avg_price': {'$avg': {'$cond': [{'$gt': ['$price.monthly_rent', 0]}, '$price.monthly_rent', None]}},
+            'avg_area': {'$avg': '$features.area'},
+            'count': {'$sum': 1}
+        }}
+    ]
+
+    cells = {}
+    cell_areas = {}
+    cities = set()
+    types = set()
+    for row in collection.aggregate(pipeline):
+        house_type = row['_id'].get('type')
+        city = row['_id'].get('city')
+        if not house_type or not city:
+            continue
+        types.add(house_type)
+        cities.add(city)
+        if row.get('avg_price'):
+            cells[(house_type, city)] = round(float(row['avg_price']), 2)
+        if row.get('avg_area'):
+            cell_areas[(house_type, city)] = round(float(row['avg_area']), 2)
+
+    all_cities = sorted(cities)
+    all_types = sorted(types)
+    predictions = {
+        house_type: [cells.get((house_type, city)) or estimate_price(house_type, city) for city in all_cities]
+        for house_type in all_types
+    }
+    areas = {
+        house_type: [cell_areas.get((house_type, city)) for city in all_cities]
+        for house_type in all_types
+    }
+    return {
+        'cities': all_cities,
+        'types': all_types,
+        'predictions': predictions,
+        'areas': areas,
+        'generated_at': datetime.now()
+    }
+
+
+def refresh_price_matrix(collection):
+    """重新计算并写入stats_cache"""
+    matrix = build_price_matrix(collection)
+    MongoStats.objects(stat_type=MATRIX_STAT_TYPE, stat_key=MATRIX_STAT_KEY).update_one(
+        upsert=True,
+        set__stat_value=matrix,
+        set__updated_time=datetime.now(),
+        set_on_insert__created_time=datetime.now()
+    )
+    logger.info(f"价格矩阵已刷新: {len(matrix['types'])} 种房型 × {len(matrix['cities'])} 个城市")
+    return matrix
+
+
+def get_price_matrix(collection):
+    """
+    读取预计算的价格矩阵，不存在（首次访问或已被写入失效）时同步计算
+    """
+    doc = MongoStats.objects(
+        stat_type=MATRIX_STAT_TYPE, stat_key=MATRIX_STAT_KEY
+    ).only('stat_value').first()
+    if doc is not None and doc.stat_value:
+        return doc.stat_value
+    return refresh_price_matrix(collection)
@@ -6,31 +6,128 @@ Python可视化视图
 """
 
 from django.shortcuts import render
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, Http404, StreamingHttpResponse
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import etag, require_GET
 from django.contrib.auth.decorators import login_required
-from pymongo import MongoClient
+from mongodb_integration.mongodb_config import get_database
 from .chart_generator import ChartGenerator
 from .fallback_data import FALLBACK_HOUSES
+from .viz_data import get_versioned_frame
+from .chart_cache import DIGEST_RE, chart_cache_key, encode_chart, get_chart_cache
+from .chart_render import get_render_pool
+from .downsample import SAMPLING_MODES, clamp_max_points
+import base64
 import json
 import logging
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
 def get_mongodb_data():
-    """获取MongoDB数据"""
+    """
+    获取MongoDB房源数据
+
+    Returns:
+        pandas.DataFrame: 只含图表字段的列式数据（进程内按数据版本缓存，只读）；
+                          连接失败或没有数据时返回None
+    """
+    return get_versioned_mongodb_data()[0]
+
+def get_versioned_mongodb_data():
+    """
+    获取MongoDB房源数据及其数据版本（同一次读取，版本与数据一致）
+
+    Returns:
+        tuple: (DataFrame, 数据版本)；连接失败或没有数据时返回 (None, None)
+    """
     try:
-        client = MongoClient('mongodb://localhost:27017/')
-        db = client['house_data']
-        
-        # 获取房源数据
-        houses_data = list(db.houses.find())
-        client.close()
-        
-        return houses_data
+        db = get_database()
+        houses_data, version = get_versioned_frame(db)
+        return (houses_data, version) if len(houses_data) else (None, None)
     except Exception as e:
         logger.error(f"MongoDB连接失败: {e}")
-        return None
+        return None, None
+
+# 图表类型 -> ChartGenerator 方法
+CHART_METHODS = {
+    'price_histogram': 'generate_price_histogram',
+    'area_price_scatter': 'generate_area_price_scatter',
+    'price_trend_line': 'generate_price_trend_line',
+    'city_price_boxplot': 'generate_city_price_boxplot',
+    'interactive_heatmap': 'generate_interactive_heatmap',
+    'interactive_scatter_3d': 'generate_interactive_scatter_3d',
+}
+
+# 支持降采样参数的图表
+SAMPLED_CHARTS = {'area_price_scatter', 'interactive_scatter_3d'}
+
+STATIC_CHARTS = ['price_histogram', 'area_price_scatter', 'price_trend_line', 'city_price_boxplot']
+INTERACTIVE_CHARTS = ['interactive_heatmap', 'interactive_scatter_3d']
+
+def load_chart_data():
+    """
+    图表数据及其版本
+
+    Returns:
+        tuple: (房源数据, 数据版本, 数据来源说明)
+    """
+    houses_data, version = get_versioned_mongodb_data()
+    if houses_data is None:
+        return FALLBACK_HOUSES, 'fallback', "降级模式"
+    return houses_data, version, "MongoDB"
+
+def chart_params(chart_type, params):
+    """只保留图表方法支持的参数并校验，避免无关参数产生不同的缓存键"""
+    params = params or {}
+    if chart_type not in SAMPLED_CHARTS:
+        return {}
+    sampling = params.get('sampling', 'stratified')
+    return {
+        'max_points': clamp_max_points(params.get('max_points')),
+        'sampling': sampling if sampling in SAMPLING_MODES else 'stratified',
+    }
+
+def iter_chart_artifacts(chart_types, houses_data, version, params=None):
+    """
+    批量获取图表：先查渲染缓存，未命中的提交到渲染进程池并发渲染，按完成顺序返回
+
+    Yields:
+        tuple: (图表类型, Artifact或None, 是否命中缓存, 错误信息)
+    """
+    chart_cache = get_chart_cache()
+    jobs = {}
+    keys = {}
+    for chart_type in chart_types:
+        method_params = chart_params(chart_type, params)
+        cache_key = chart_cache_key(chart_type, method_params, version)
+        artifact = chart_cache.get(cache_key)
+        if artifact is not None:
+            yield chart_type, artifact, True, None
+        else:
+            keys[chart_type] = cache_key
+            jobs[chart_type] = (CHART_METHODS[chart_type], method_params)
+
+    for chart_type, result, error in get_render_pool().iter_render(jobs, houses_data):
+        if error:
+            yield chart_type, None, False, error
+            continue
+        body, content_type = encode_chart(result)
+        yield chart_type, chart_cache.put(keys[chart_type], body, content_type), False, None
+
+def artifact_payload(chart_type, artifact, cached, error):
+    """批量/单个图表接口中的一条结果"""
+    if artifact is None:
+        return {'chart_type': chart_type, 'success': False, 'error': error}
+    return {
+        'chart_type': chart_type,
+        'success': True,
+        'chart_url': reverse('chart_artifact', args=[artifact.digest]),
+        'etag': artifact.digest,
+        'content_type': artifact.content_type,
+        'cached': cached
+    }
 
 @login_required
 def python_dashboard(request):
@@ -43,7 +140,7 @@ def python_dashboard(request):
         # 获取数据
         houses_data = get_mongodb_data()
         
-        if houses_data:
+        if houses_data is not None:
             # 使用真实数据
             total_houses = len(houses_data)
             data_source = "MongoDB"
@@ -87,37 +184,23 @@ def static_charts_page(request):
         useravatar = request.session.get('useravatar', '/static/picture/avatar.jpg')
         
         # 获取数据
-        houses_data = get_mongodb_data()
+        houses_data, version, data_source = load_chart_data()
         
-        if houses_data:
-            # 生成静态图表
-            generator = ChartGenerator(houses_data)
-            
-            # 生成各种静态图表
-            price_histogram = generator.generate_price_histogram()
-            area_price_scatter = generator.generate_area_price_scatter()
-            price_trend_line = generator.generate_price_trend_line()
-            city_price_boxplot = generator.generate_city_price_boxplot()
-            
-            data_source = "MongoDB"
-        else:
-            # 使用降级数据
-            generator = ChartGenerator(FALLBACK_HOUSES)
-            
-            price_histogram = generator.generate_price_histogram()
-            area_price_scatter = generator.generate_area_price_scatter()
-            price_trend_line = generator.generate_price_trend_line()
-            city_price_boxplot = generator.generate_city_price_boxplot()
-            
-            data_source = "降级模式"
+        # 并发渲染各种静态图表（命中缓存的直接使用），页面通过URL加载图片
+        charts = {}
+        for chart_type, artifact, _cached, error in iter_chart_artifacts(STATIC_CHARTS, houses_data, version):
+            if artifact is not None:
+                charts[chart_type] = reverse('chart_artifact', args=[artifact.digest])
+            else:
+                charts[chart_type] = ChartGenerator().generate_error_chart(chart_type, error)
         
         context = {
             'username': username,
             'useravatar': useravatar,
-            'price_histogram': price_histogram,
-            'area_price_scatter': area_price_scatter,
-            'price_trend_line': price_trend_line,
-            'city_price_boxplot': city_price_boxplot,
+            'price_histogram': charts['price_histogram'],
+            'area_price_scatter': charts['area_price_scatter'],
+            'price_trend_line': charts['price_trend_line'],
+            'city_price_boxplot': charts['city_price_boxplot'],
             'data_source': data_source,
             'page_title': 'Python静态图表分析'
         }
@@ -137,31 +220,18 @@ def interactive_charts_page(request):
         useravatar = request.session.get('useravatar', '/static/picture/avatar.jpg')
         
         # 获取数据
-        houses_data = get_mongodb_data()
+        houses_data, version, data_source = load_chart_data()
         
-        if houses_data:
-            # 生成交互式图表
-            generator = ChartGenerator(houses_data)
-            
-            # 生成各种交互式图表
-            interactive_heatmap = generator.generate_interactive_heatmap()
-            interactive_scatter_3d = generator.generate_interactive_scatter_3d()
-            
-            data_source = "MongoDB"
-        else:
-            # 使用降级数据
-            generator = ChartGenerator(FALLBACK_HOUSES)
-            
-            interactive_heatmap = generator.generate_interactive_heatmap()
-            interactive_scatter_3d = generator.generate_interactive_scatter_3d()
-            
-            data_source = "降级模式"
+        # 并发渲染各种交互式图表（HTML直接嵌入页面）
+        charts = {}
+        for chart_type, artifact, _cached, error in iter_chart_artifacts(INTERACTIVE_CHARTS, houses_data, version):
+            charts[chart_type] = artifact.body.decode('utf-8') if artifact is not None else f'<p>图表生成失败: {error}</p>'
         
         context = {
             'username': username,
             'useravatar': useravatar,
-            'interactive_heatmap': interactive_heatmap,
-            'interactive_scatter_3d': interactive_scatter_3d,
+            'interactive_heatmap': charts['interactive_heatmap'],
+            'interactive_scatter_3d': charts['interactive_scatter_3d'],
             'data_source': data_source,
             'page_title': 'Python交互式图表分析'
         }
@@ -174,41 +244,39 @@ def interactive_charts_page(request):
 
 @csrf_exempt
 def chart_api(request):
-    """图表API接口"""
+    """
+    图表API接口
+
+    渲染结果按 (图表类型, 参数, 数据版本) 缓存，响应中总是返回图表URL（chart_url）；
+    默认（format=base64/html）与原接口一致在chart_data中内联图表（静态图为base64 data URI，交互图为HTML），
+    format=url 时只返回URL，由客户端按URL加载（可被浏览器缓存）
+    """
     try:
         if request.method == 'POST':
             data = json.loads(request.body)
             chart_type = data.get('chart_type')
-            chart_format = data.get('format', 'base64')  # base64 或 html
-            
-            # 获取数据
-            houses_data = get_mongodb_data()
-            if not houses_data:
-                houses_data = FALLBACK_HOUSES
+            chart_format = data.get('format', 'base64')  # base64、html 或 url
+            params = data.get('params') or {}
             
-            # 创建图表生成器
-            generator = ChartGenerator(houses_data)
-            
-            # 根据类型生成图表
-            if chart_type == 'price_histogram':
-                result = generator.generate_price_histogram()
-            elif chart_type == 'area_price_scatter':
-                result = generator.generate_area_price_scatter()
-            elif chart_type == 'city_price_boxplot':
-                result = generator.generate_city_price_boxplot()
-            elif chart_type == 'interactive_heatmap':
-                result = generator.generate_interactive_heatmap()
-            elif chart_type == 'interactive_scatter_3d':
-                result = generator.generate_interactive_scatter_3d()
-            else:
+            if chart_type not in CHART_METHODS:
                 return JsonResponse({'error': '不支持的图表类型'}, status=400)
             
-            return JsonResponse({
-                'success': True,
-                'chart_data': result,
-                'chart_type': chart_type,
-                'format': chart_format
-            })
+            # 获取数据并渲染（命中缓存时不再渲染）
+            houses_data, version, _data_source = load_chart_data()
+            chart_type, artifact, cached, error = next(
+                iter_chart_artifacts([chart_type], houses_data, version, params)
+            )
+            if artifact is None:
+                return JsonResponse({'error': error}, status=500)
+            
+            result = artifact_payload(chart_type, artifact, cached, error)
+            result['format'] = chart_format
+            if chart_format != 'url':
+                if artifact.content_type == 'image/png':
+                    result['chart_data'] = f"data:image/png;base64,{base64.b64encode(artifact.body).decode()}"
+                else:
+                    result['chart_data'] = artifact.body.decode('utf-8')
+            return JsonResponse(result)
         
         else:
             return JsonResponse({'error': '仅支持POST请求'}, status=405)
@@ -217,44 +285,71 @@ def chart_api(request):
         logger.error(f"图表API错误: {e}")
         return JsonResponse({'error': str(e)}, status=500)
 
-def calculate_price_stats(houses_data):
-    """计算价格统计信息"""
-    prices = []
+@csrf_exempt
+def chart_batch_api(request):
+    """
+    批量图表接口：请求 {"chart_types": [...], "params": {...}}，
+    以NDJSON流逐行返回，每个图表渲染完成（或命中缓存）立即输出一行
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': '仅支持POST请求'}, status=405)
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': '请求格式错误'}, status=400)
     
-    for house in houses_data:
-        if isinstance(house.get('price'), dict):
-            price = house['price'].get('monthly_rent', 0)
-        else:
-            price = house.get('price', 0)
-        
-        if price > 0:
-            prices.append(price)
+    chart_types = data.get('chart_types') or STATIC_CHARTS
+    unsupported = [chart_type for chart_type in chart_types if chart_type not in CHART_METHODS]
+    if unsupported:
+        return JsonResponse({'error': f'不支持的图表类型: {unsupported}'}, status=400)
+    params = data.get('params') or {}
     
-    if prices:
+    def stream():
+        houses_data, version, _data_source = load_chart_data()
+        for item in iter_chart_artifacts(chart_types, houses_data, version, params):
+            yield json.dumps(artifact_payload(*item), ensure_ascii=False) + '\n'
+    
+    response = StreamingHttpResponse(stream(), content_type='application/x-ndjson')
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+@require_GET
+@etag(lambda request, digest: digest)
+def chart_artifact(request, digest):
+    """
+    按内容摘要返回缓存的图表；内容不可变，ETag即摘要，浏览器重复请求得到304
+    """
+    if not DIGEST_RE.match(digest):
+        raise Http404('图表不存在')
+    artifact = get_chart_cache().get_blob(digest)
+    if artifact is None:
+        raise Http404('图表不存在或已过期')
+    response = HttpResponse(artifact.body, content_type=artifact.content_type)
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+def calculate_price_stats(houses_data):
+    """计算价格统计信息（houses_data为get_mongodb_data返回的DataFrame）"""
+    prices = houses_data['price']
+    prices = np.sort(prices[prices > 0].to_numpy(dtype='float64'))
+    
+    if len(prices):
         return {
-            'count': len(prices),
-            'min': min(prices),
-            'max': max(prices),
-            'avg': sum(prices) / len(prices),
-            'median': sorted(prices)[len(prices)//2]
+            'count': int(len(prices)),
+            'min': float(prices[0]),
+            'max': float(prices[-1]),
+            'avg': float(prices.mean()),
+            'median': float(prices[len(prices)//2])
         }
     else:
         return {'count': 0, 'min': 0, 'max': 0, 'avg': 0, 'median': 0}
 
 def calculate_city_stats(houses_data):
-    """计算城市统计信息"""
-    city_counts = {}
-    
-    for house in houses_data:
-        if isinstance(house.get('location'), dict):
-            city = house['location'].get('city', '未知')
-        else:
-            city = house.get('city', '未知')
-        
-        city_counts[city] = city_counts.get(city, 0) + 1
+    """计算城市统计信息（houses_data为get_mongodb_data返回的DataFrame）"""
+    city_counts = houses_data['city'].value_counts()
     
     # 按数量排序
-    sorted_cities = sorted(city_counts.items(), key=lambda x: x[1], reverse=True)
+    sorted_cities = [(str(city), int(count)) for city, count in city_counts.items() if count > 0]
     
     return {
         'total_cities': len(city_counts),
@@ -304,39 +399,26 @@ def python_housetyperank(request):
         # 获取数据
         houses_data = get_mongodb_data()
 
-        if houses_data:
+        if houses_data is not None:
             # 使用真实MongoDB数据
             data_source = "MongoDB"
 
             # 生成房型分析图表
             chart_generator = ChartGenerator()
 
-            # 1. 房型分布统计
-            type_stats = {}
-            for house in houses_data:
-                rental_type = house.get('rental_type', '整租')
-                if rental_type not in type_stats:
-                    type_stats[rental_type] = {'count': 0, 'prices': []}
-                type_stats[rental_type]['count'] += 1
-                price = house.get('price', {})
-                if isinstance(price, dict):
-                    monthly_rent = price.get('monthly_rent', 0)
-                else:
-                    monthly_rent = price
-                if monthly_rent:
-                    type_stats[rental_type]['prices'].append(monthly_rent)
-
-            # 获取前3种最常见的房型
-            sorted_types = sorted(type_stats.items(), key=lambda x: x[1]['count'], reverse=True)[:3]
-            top_three_types = [item[0] for item in sorted_types]
+            # 1. 房型分布统计，获取前3种最常见的房型
+            type_counts = houses_data['rental_type'].value_counts()
+            top_three_types = [str(t) for t, count in type_counts.head(3).items() if count > 0]
+            has_price = houses_data['price'] > 0
 
             # 2. 生成图表
             charts = {}
             for i, house_type in enumerate(top_three_types):
-                if type_stats[house_type]['prices']:
+                type_prices = houses_data.loc[has_price & (houses_data['rental_type'] == house_type), 'price']
+                if len(type_prices):
                     # 生成价格分布图
                     chart_html = chart_generator.generate_price_distribution_chart(
-                        type_stats[house_type]['prices'],
+                        type_prices.astype(float).tolist(),
                         f"{house_type}房源价格分布"
                     )
                     charts[f'chart_{i+1}'] = chart_html
@@ -382,7 +464,7 @@ def python_servicemoney(request):
         # 获取数据
         houses_data = get_mongodb_data()
 
-        if houses_data:
+        if houses_data is not None:
             # 使用真实MongoDB数据
             data_source = "MongoDB"
 
@@ -21,6 +21,8 @@ urlpatterns = [
     # 数据统计
     path('tableData/', views.mongo_table_data, name='mongo_table_data'),
     path('api/tableData/', views.mongo_table_data_api, name='mongo_table_data_api'),
+    path('api/export/', views.mongo_export_houses, name='mongo_export_houses'),
+    path('api/pool-stats/', views.mongo_pool_stats, name='mongo_pool_stats'),
     path('historyTableData/', views.mongo_history_table_data, name='mongo_history_table_data'),
     path('addHistory/<str:house_id>/', views.mongo_add_history, name='mongo_add_history'),
     
@@ -36,12 +38,16 @@ urlpatterns = [
     # 房价预测
     path('predict-all-prices/', views.mongo_predict_all_prices, name='mongo_predict_all_prices'),
     path('pricePredict/', views.mongo_predict_all_prices, name='mongo_price_predict_alt'),
+    path('api/price-matrix/', views.mongo_price_matrix_api, name='mongo_price_matrix_api'),
+    path('api/predict/', views.mongo_predict_api, name='mongo_predict_api'),
 
     # Python可视化模块
     path('python-viz/', python_viz_views.python_dashboard, name='python_dashboard'),
     path('python-viz/static-charts/', python_viz_views.static_charts_page, name='static_charts_page'),
     path('python-viz/interactive-charts/', python_viz_views.interactive_charts_page, name='interactive_charts_page'),
     path('python-viz/api/chart/', python_viz_views.chart_api, name='chart_api'),
+    path('python-viz/api/charts/', python_viz_views.chart_batch_api, name='chart_batch_api'),
+    path('python-viz/api/chart/<str:digest>/', python_viz_views.chart_artifact, name='chart_artifact'),
 
     # Python可视化版本的页面
     path('python-housetyperank/', python_viz_views.python_housetyperank, name='python_housetyperank'),
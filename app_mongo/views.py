@@ -8,8 +8,10 @@ import time
 import json
 from collections import defaultdict
 from django.shortcuts import render, redirect
-from django.http import JsonResponse
-from app_mongo.models import MongoUser, MongoHistory, HouseDocument, MongoQueryHelper, PerformanceMonitor
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.html import escape, format_html, format_html_join
+from app_mongo.models import MongoUser, MongoHistory, HouseDocument, PerformanceMonitor
+from mongodb_integration.mongodb_config import get_database, get_pool_stats, get_command_stats, get_slow_commands
 from datetime import datetime
 import pandas as pd
 import math
@@ -139,6 +141,9 @@ def mongo_register(request):
                         avatar=avatar_path
                     )
                     new_user.save()
+                    bump_tags(USERS_TAG, user_tag(name))
+                    # 用户数和最新用户列表已变化，后台刷新首页快照
+                    refresh_dashboard_snapshot_async()
                     msg = f"✅ 注册成功！用户 '{name}' 已创建，请使用注册信息登录。"
                     return render(request, 'mongo/login.html', {"msg": msg})
             else:
@@ -160,10 +165,12 @@ def mongo_logout(request):
     return redirect('mongo_login')
 
 # MongoDB版本的首页
-from django.views.decorators.cache import cache_page
-from .cache_utils import cache_query_result
+from .cache_utils import (
+    cache_query_result, bump_tags, house_tags, history_tag, user_tag, HOUSES_TAG, USERS_TAG
+)
+from .dashboard_snapshot import get_dashboard_snapshot, refresh_dashboard_snapshot_async
 
-@cache_page(60 * 5)  # 缓存5分钟
+# 首页统计来自预计算快照，页面本身包含用户信息，不再整页缓存
 def mongo_index(request):
     # 检查用户是否已登录
     if 'mongo_username' not in request.session:
@@ -190,54 +197,21 @@ def mongo_index(request):
         str1 = "~".join(stats['cities'])
 
     else:
-        # 正常模式：使用MongoDB数据
+        # 正常模式：读取预计算的仪表板快照（一次索引读取）
         try:
-            # 使用MongoDB聚合管道获取用户注册时间分布
-            user_time_pipeline = [
-                {
-                    '$group': {
-                        '_id': {
-                            '$dateToString': {
-                                'format': '%Y-%m-%d',
-                                'date': '$time'
-                            }
-                        },
-                        'count': {'$sum': 1}
-                    }
-                },
-                {'$sort': {'_id': 1}}
-            ]
-
-            user_time_data = list(MongoUser.objects.aggregate(user_time_pipeline))
-            if user_time_data:
-                # 过滤掉None值并格式化数据
-                result = []
-                for item in user_time_data:
-                    date_str = item['_id']
-                    if date_str:  # 过滤掉None值
-                        result.append({'name': date_str, 'value': item['count']})
-
-                # 如果过滤后没有数据，创建默认数据
-                if not result:
-                    from datetime import datetime, timedelta
-                    today = datetime.now()
-                    result = [
-                        {'name': (today - timedelta(days=2)).strftime('%Y-%m-%d'), 'value': 2},
-                        {'name': (today - timedelta(days=1)).strftime('%Y-%m-%d'), 'value': 3},
-                        {'name': today.strftime('%Y-%m-%d'), 'value': 1}
-                    ]
-            else:
-                # 如果没有用户数据，创建一些默认数据
-                from datetime import datetime, timedelta
-                today = datetime.now()
-                result = [
-                    {'name': (today - timedelta(days=2)).strftime('%Y-%m-%d'), 'value': 2},
-                    {'name': (today - timedelta(days=1)).strftime('%Y-%m-%d'), 'value': 3},
-                    {'name': today.strftime('%Y-%m-%d'), 'value': 1}
-                ]
+            snapshot = get_dashboard_snapshot()
+            result = snapshot.get('userTime', [])
+            newuserlist = snapshot.get('newuserlist', [])
+            houseslength = snapshot.get('houseslength', 0)
+            userlength = snapshot.get('userlength', 0)
+            averageprice = snapshot.get('averageprice', 0)
+            buildingtype = snapshot.get('buildingtype', '')
+            area_max = snapshot.get('area_max', 0)
+            str0 = snapshot.get('str0', '')
+            str1 = snapshot.get('str1', '')
         except Exception as e:
-            print(f"用户时间数据获取失败: {e}")
-            # 创建默认数据
+            # MongoDB查询失败时的默认值
+            print(f"首页快照获取失败: {e}")
             from datetime import datetime, timedelta
             today = datetime.now()
             result = [
@@ -245,47 +219,6 @@ def mongo_index(request):
                 {'name': (today - timedelta(days=1)).strftime('%Y-%m-%d'), 'value': 3},
                 {'name': today.strftime('%Y-%m-%d'), 'value': 1}
             ]
-
-        try:
-            # 获取最新用户
-            newuserlist = MongoUser.objects.order_by('-time').limit(5)
-
-            # 使用MongoDB聚合获取房源统计
-            house_stats = MongoQueryHelper.get_house_stats()
-
-            # 房源总量
-            houseslength = house_stats.get('total_count', 0)
-
-            # 用户总量
-            userlength = MongoUser.objects.count()
-
-            # 最高价格房源 - 优化查询，只获取需要的字段
-            highest_price_house = HouseDocument.objects.only('price.monthly_rent', 'location.building').order_by('-price.monthly_rent').first()
-            averageprice = highest_price_house.price.monthly_rent if highest_price_house else 0
-            buildingtype = highest_price_house.location.building if highest_price_house else ''
-
-            # 最大面积房源 - 修正字段名并优化查询
-            largest_area_house = HouseDocument.objects.only('features.area').order_by('-features.area').first()
-            area_max = largest_area_house.features.area if largest_area_house else 0
-
-            # 使用MongoDB聚合获取房型分布
-            type_distribution = MongoQueryHelper.get_type_distribution()
-
-            # 过滤合理的房型并取前3
-            valid_types = []
-            for item in type_distribution:
-                rental_type = item['_id']
-                if rental_type and len(valid_types) < 3:
-                    valid_types.append(rental_type)
-
-            str0 = "~".join(valid_types)
-
-            # 使用MongoDB聚合获取城市分布
-            city_distribution = MongoQueryHelper.get_city_distribution()
-            top_3_cities = [item['_id'] for item in city_distribution[:3]]
-            str1 = "~".join(top_3_cities)
-        except:
-            # MongoDB查询失败时的默认值
             newuserlist = []
             houseslength = 0
             userlength = 1
@@ -384,150 +317,118 @@ def mongo_table_data(request):
 
     # 使用正常模式但保留分布式存储架构
     fallback_mode = False
-    request.session['fallback_mode'] = False
+    if request.session.get('fallback_mode'):
+        request.session['fallback_mode'] = False  # 只在变化时写session
 
+    # 页面只渲染表格骨架和筛选项，数据统一由 api/tableData/ 服务器端分页加载，
+    # 页面大小和服务器内存不再随集合增长
+    context = {
+        'username': username,
+        'useravatar': useravatar,
+        'database_type': 'MongoDB',
+        'server_side': True
+    }
     if fallback_mode:
         # 降级模式：使用10K模拟数据
-        from .fallback_data_10k import FALLBACK_HOUSES_10K, get_fallback_stats_10k
-
-        stats = get_fallback_stats_10k()
-        houses = FALLBACK_HOUSES_10K
-        total = len(houses)
-        cities = stats['cities']
-        rental_types = stats['rental_types']
-
-        context = {
-            'username': username,
-            'useravatar': useravatar,
-            'houses': houses,
-            'total': total,
-            'cities': cities,
-            'rental_types': rental_types,
-            'database_type': 'MongoDB (演示模式 - 10K数据)',
-            'server_side': False,
-            'fallback_mode': True
-        }
+        context.update(_fallback_table_options())
+        context.update({'database_type': 'MongoDB (演示模式 - 10K数据)', 'fallback_mode': True})
     else:
         # 正常模式：使用MongoDB数据
         try:
-            import pymongo
-            client = pymongo.MongoClient('mongodb://localhost:27017/')
-            db = client['house_data']
-            collection = db['houses']
-
-            # 启用服务器端分页，移除数据限制
-            total = collection.count_documents({})
-            cities = collection.distinct('location.city')
-            rental_types = collection.distinct('rental_type')
-
-            # 获取所有房源数据用于客户端分页
-            houses_data = []
-            # 移除1000条限制，使用实际数据量（但为了性能考虑，仍然限制在合理范围内）
-            limit_count = min(total, 5000)  # 最多5000条，平衡性能和数据完整性
-            for doc in collection.find().limit(limit_count):
-                location = doc.get('location', {})
-                features = doc.get('features', {})
-                price_info = doc.get('price', {})
-                crawl_meta = doc.get('crawl_meta', {})
-
-                # 处理价格字段
-                if isinstance(price_info, dict):
-                    price_str = f"¥{price_info.get('monthly_rent', 0):.0f}/月"
-                else:
-                    price_str = f"¥{price_info:.0f}/月" if isinstance(price_info, (int, float)) else str(price_info)
-
-                # 处理面积字段
-                area_value = features.get('area', 0)
-                area_str = f"{area_value:.1f}㎡" if isinstance(area_value, (int, float)) else str(area_value)
-
-                # 处理图片
-                images = doc.get('images', [])
-                if images and len(images) > 0:
-                    image_html = f'<img src="{images[0]}" alt="房源图片" style="max-width: 50px; max-height: 50px; border-radius: 4px;" onerror="this.src=\'/static/picture/no-image.png\'; this.onerror=null;" loading="lazy">'
-                else:
-                    image_html = '<img src="/static/picture/no-image.png" alt="暂无图片" style="max-width: 50px; max-height: 50px; border-radius: 4px;">'
-
-                # 处理标签
-                tags = doc.get('tags', [])
-                if tags:
-                    tags_html = ''.join([f'<span class="label label-info">{tag}</span> ' for tag in tags[:3]])
-                else:
-                    tags_html = '<span class="text-muted">无标签</span>'
-
-                # 生成操作按钮HTML
-                house_id = str(doc.get('_id', ''))
-                source_url = crawl_meta.get('source_url', '#') if isinstance(crawl_meta, dict) else '#'
-                actions_html = f'''
-                    <a target="_blank" href="{source_url}" class="btn btn-info btn-sm">房源详情</a>
-                    <a href="/mongo/addHistory/{house_id}" class="btn btn-danger btn-sm" onclick="return confirm('确定要收藏这个房源吗？')">收藏房源</a>
-                '''
-
-                houses_data.append({
-                    'id': house_id,
-                    'title': doc.get('title', ''),
-                    'rental_type': doc.get('rental_type', ''),
-                    'location': {
-                        'city': location.get('city', ''),
-                        'street': location.get('street', ''),
-                        'building': location.get('building', '')
-                    },
-                    'features': {
-                        'area': area_value,
-                        'direction': features.get('direction', '未知')
-                    },
-                    'price': {
-                        'monthly_rent': price_info.get('monthly_rent', 0) if isinstance(price_info, dict) else price_info
-                    },
-                    'images': images,
-                    'tags': tags,
-                    'crawl_meta': {
-                        'source_url': source_url
-                    }
-                })
-
-            context = {
-                'username': username,
-                'useravatar': useravatar,
-                'houses': houses_data,
-                'total': total,
-                'cities': cities,
-                'rental_types': rental_types,
-                'database_type': 'MongoDB',
-                'server_side': False  # 使用客户端分页
-            }
+            context.update(_table_filter_options())
         except Exception as e:
             # MongoDB连接失败，使用10K降级数据
-            from .fallback_data_10k import FALLBACK_HOUSES_10K, get_fallback_stats_10k
-
-            stats = get_fallback_stats_10k()
-
-            # 为降级数据添加ID字段
-            houses_with_id = []
-            for i, house in enumerate(FALLBACK_HOUSES_10K):
-                house_copy = house.copy()
-                house_copy['id'] = f"fallback_{i}"
-                houses_with_id.append(house_copy)
-
-            context = {
-                'username': username,
-                'useravatar': useravatar,
-                'houses': houses_with_id,
-                'total': len(FALLBACK_HOUSES_10K),
-                'cities': stats['cities'],
-                'rental_types': stats['rental_types'],
+            context.update(_fallback_table_options())
+            context.update({
                 'database_type': 'MongoDB (连接失败，演示模式)',
-                'server_side': False,
                 'fallback_mode': True,
                 'error_message': str(e)
-            }
+            })
 
     return render(request, 'mongo/tableData.html', context)
 
+@cache_query_result(timeout=600, key_prefix='table_options', tags=house_tags())
+def _table_filter_options():
+    """表格页的总数和筛选项（城市、房源类型）"""
+    collection = get_database()['houses']
+    return {
+        'total': collection.estimated_document_count(),
+        'cities': sorted(city for city in collection.distinct('location.city') if city),
+        'rental_types': sorted(rental_type for rental_type in collection.distinct('rental_type') if rental_type),
+    }
+
+def _fallback_table_options():
+    from .fallback_data_10k import get_fallback_stats_10k
+
+    stats = get_fallback_stats_10k()
+    return {
+        'total': stats['total_houses'],
+        'cities': sorted(stats['cities']),
+        'rental_types': sorted(stats['rental_types']),
+    }
+
+
+from .pagination import normalize_search, encode_cursor, decode_cursor, build_keyset_query
+from .house_search import build_search_query, ranked_search
+from .price_impact import get_price_impact_data, fallback_price_impact
+from .price_matrix import get_price_matrix
+from .mongo_price_model import predict_matrix, predict_listings, expand_grid
+from .viz_data import get_houses_frame
+from .downsample import SAMPLING_MODES, clamp_max_points, scatter_pairs
+from .house_export import (
+    EXPORT_FORMATS, parse_fields, parse_filters, parse_limit, iter_house_rows,
+    ndjson_lines, csv_lines
+)
+
+def _build_table_search_query(search_value):
+    """构建表格搜索条件（关键词多键索引，未回填时回退到正则）"""
+    return build_search_query(search_value)
+
+@cache_query_result(timeout=120, key_prefix='table_count', tags=house_tags())
+def _count_table_matches(search_value):
+    """按规范化搜索词统计匹配的房源数（TTL缓存，翻页时不再重复计数）"""
+    return HouseDocument._get_collection().count_documents(_build_table_search_query(search_value))
+
+NO_IMAGE_HTML = '<img src="/static/picture/no-image.png" alt="暂无图片" style="max-width: 50px; max-height: 50px; border-radius: 4px;">'
+NO_TAGS_HTML = '<span class="text-muted">无标签</span>'
+
+def _http_url(url):
+    """只放行http(s)链接，javascript:等其他协议一律视为无效"""
+    url = str(url or '').strip()
+    return url if url.lower().startswith(('http://', 'https://')) else None
+
+def _table_image_html(images):
+    image_url = _http_url(images[0]) if images else None
+    if not image_url:
+        return NO_IMAGE_HTML
+    return format_html(
+        '<img src="{}" alt="房源图片" style="max-width: 50px; max-height: 50px; border-radius: 4px;" '
+        'onerror="this.src=\'/static/picture/no-image.png\'; this.onerror=null;" loading="lazy">',
+        image_url
+    )
+
+def _table_tags_html(tags):
+    if not tags:
+        return NO_TAGS_HTML
+    return format_html_join('', '<span class="label label-info">{}</span> ', ((tag,) for tag in tags[:3]))
+
+def _table_actions_html(house_id, source_url=None):
+    """房源详情链接（仅http(s)）和收藏按钮"""
+    return format_html(
+        '''
+                    <a target="_blank" href="{}" class="btn btn-info btn-sm">房源详情</a>
+                    <a href="/mongo/addHistory/{}" class="btn btn-danger btn-sm" onclick="return confirm('确定要收藏这个房源吗？')">收藏房源</a>
+                ''',
+        _http_url(source_url) or '#', house_id
+    )
 
 def mongo_table_data_api(request):
     """
     DataTable服务器端分页API端点
     处理Ajax请求，返回分页数据
+
+    支持键集分页：响应中的cursor为下一页的不透明游标，
+    请求下一页时以cursor参数传回即可避免skip扫描
     """
     # 检查用户是否已登录
     if 'mongo_username' not in request.session:
@@ -538,6 +439,7 @@ def mongo_table_data_api(request):
     start = int(request.GET.get('start', 0))
     length = int(request.GET.get('length', 20))
     search_value = request.GET.get('search[value]', '').strip()
+    next_cursor = None
 
     fallback_mode = request.session.get('fallback_mode', False)
 
@@ -564,14 +466,15 @@ def mongo_table_data_api(request):
         # 格式化数据
         data = []
         for house in page_houses:
+            # DataTables以HTML渲染单元格，文本一律转义
             row = [
-                house['title'],
-                house['rental_type'],
-                house['city'],
-                house['street'],
-                house['building'],
+                escape(house['title']),
+                escape(house['rental_type']),
+                escape(house['city']),
+                escape(house['street']),
+                escape(house['building']),
                 f"{house['area']:.1f}",
-                house['orientation'],
+                escape(house['orientation']),
                 f"{house['price']:.0f}"
             ]
             data.append(row)
@@ -586,40 +489,42 @@ def mongo_table_data_api(request):
             columns = ['title', 'rental_type', 'location.city', 'location.street', 'location.building', 'features.area', 'features.direction', 'price.monthly_rent']
             sort_column = columns[order_column] if order_column < len(columns) else 'title'
 
-            # 连接MongoDB（使用开发环境端口27017）
-            import pymongo
-            client = pymongo.MongoClient('mongodb://localhost:27017/')
-            db = client['house_data']
+            # 使用进程内共享的MongoDB连接池
+            db = get_database()
             collection = db['houses']
 
             # 构建查询条件
-            query = {}
-            if search_value:
-                # 全文搜索（使用正确的MongoDB字段路径）
-                query = {
-                    '$or': [
-                        {'title': {'$regex': search_value, '$options': 'i'}},
-                        {'location.city': {'$regex': search_value, '$options': 'i'}},
-                        {'location.street': {'$regex': search_value, '$options': 'i'}},
-                        {'location.building': {'$regex': search_value, '$options': 'i'}},
-                        {'rental_type': {'$regex': search_value, '$options': 'i'}},
-                        {'features.direction': {'$regex': search_value, '$options': 'i'}}
-                    ]
-                }
+            search_value = normalize_search(search_value)
+            query = _build_table_search_query(search_value)
 
-            # 获取总记录数
-            total_records = collection.count_documents({})
-            filtered_records = collection.count_documents(query)
+            # 总记录数使用集合元数据估算，过滤后的记录数按规范化搜索词TTL缓存
+            total_records = collection.estimated_document_count()
+            filtered_records = _count_table_matches(search_value) if search_value else total_records
 
-            # 构建排序
+            # 构建排序（_id 作为并列值的决胜字段，保证键集分页顺序稳定）
             sort_order = 1 if order_dir == 'asc' else -1
-            sort_spec = [(sort_column, sort_order)]
+            sort_spec = [(sort_column, sort_order), ('_id', sort_order)]
+
+            # 有搜索词且显式请求 order=relevance 时按相关度排序，否则按列排序
+            rank_by_relevance = bool(search_value) and request.GET.get('order') == 'relevance'
+
+            # 获取分页数据：游标与当前排序/搜索/偏移一致时走键集分页，否则回退到skip
+            page_cursor = None if rank_by_relevance else decode_cursor(request.GET.get('cursor'), sort_column, sort_order, start, search_value)
+            if rank_by_relevance:
+                docs = ranked_search(collection, search_value, skip=start, limit=length)
+            elif page_cursor:
+                page_query = build_keyset_query(query, page_cursor, sort_column, sort_order)
+                docs = list(collection.find(page_query).sort(sort_spec).limit(length))
+            else:
+                docs = list(collection.find(query).sort(sort_spec).skip(start).limit(length))
+
+            # 下一页游标，DataTables在下一次请求中以cursor参数原样传回
+            if len(docs) == length and not rank_by_relevance:
+                next_cursor = encode_cursor(docs[-1], sort_column, sort_order, start + length, search_value)
 
-            # 获取分页数据
-            cursor = collection.find(query).sort(sort_spec).skip(start).limit(length)
             data = []
 
-            for i, doc in enumerate(cursor, start=start+1):
+            for i, doc in enumerate(docs, start=start+1):
                 # 处理嵌套字段
                 location = doc.get('location', {})
                 features = doc.get('features', {})
@@ -630,47 +535,29 @@ def mongo_table_data_api(request):
                 if isinstance(price_info, dict):
                     price_str = f"¥{price_info.get('monthly_rent', 0):.0f}/月"
                 else:
-                    price_str = f"¥{price_info:.0f}/月" if isinstance(price_info, (int, float)) else str(price_info)
+                    price_str = f"¥{price_info:.0f}/月" if isinstance(price_info, (int, float)) else escape(price_info)
 
                 # 处理面积字段
                 area_value = features.get('area', 0)
-                area_str = f"{area_value:.1f}㎡" if isinstance(area_value, (int, float)) else str(area_value)
-
-                # 处理图片
-                images = doc.get('images', [])
-                if images and len(images) > 0:
-                    image_html = f'<img src="{images[0]}" alt="房源图片" style="max-width: 50px; max-height: 50px; border-radius: 4px;" onerror="this.src=\'/static/picture/no-image.png\'; this.onerror=null;" loading="lazy">'
-                else:
-                    image_html = '<img src="/static/picture/no-image.png" alt="暂无图片" style="max-width: 50px; max-height: 50px; border-radius: 4px;">'
+                area_str = f"{area_value:.1f}㎡" if isinstance(area_value, (int, float)) else escape(area_value)
 
-                # 处理标签
-                tags = doc.get('tags', [])
-                if tags:
-                    tags_html = ''.join([f'<span class="label label-info">{tag}</span> ' for tag in tags[:3]])
-                else:
-                    tags_html = '<span class="text-muted">无标签</span>'
-
-                # 生成操作按钮HTML
+                # 图片、标签、操作按钮：爬取的数据不可信，DataTables以HTML渲染单元格，全部转义
                 house_id = str(doc.get('_id', ''))
-                source_url = crawl_meta.get('source_url', '#') if isinstance(crawl_meta, dict) else '#'
-                actions_html = f'''
-                    <a target="_blank" href="{source_url}" class="btn btn-info btn-sm">房源详情</a>
-                    <a href="/mongo/addHistory/{house_id}" class="btn btn-danger btn-sm" onclick="return confirm('确定要收藏这个房源吗？')">收藏房源</a>
-                '''
+                source_url = crawl_meta.get('source_url') if isinstance(crawl_meta, dict) else None
 
                 row = [
                     i,  # 编号
-                    image_html,  # 图片
-                    doc.get('title', ''),  # 房源名称
-                    doc.get('rental_type', ''),  # 房源类型
-                    location.get('building', ''),  # 房源布局/地址
-                    tags_html,  # 标签
-                    location.get('city', ''),  # 行政区
-                    location.get('street', ''),  # 街道
+                    _table_image_html(doc.get('images', [])),  # 图片
+                    escape(doc.get('title', '')),  # 房源名称
+                    escape(doc.get('rental_type', '')),  # 房源类型
+                    escape(location.get('building', '')),  # 房源布局/地址
+                    _table_tags_html(doc.get('tags', [])),  # 标签
+                    escape(location.get('city', '')),  # 行政区
+                    escape(location.get('street', '')),  # 街道
                     area_str,  # 房源面积
-                    features.get('direction', '未知'),  # 朝向
+                    escape(features.get('direction', '未知')),  # 朝向
                     price_str,  # 价钱
-                    actions_html  # 操作
+                    _table_actions_html(house_id, source_url)  # 操作
                 ]
                 data.append(row)
         except:
@@ -682,32 +569,19 @@ def mongo_table_data_api(request):
 
             data = []
             for i, house in enumerate(FALLBACK_HOUSES_10K[:length], start=start+1):
-                # 处理图片
-                image_html = '<img src="/static/picture/no-image.png" alt="暂无图片" style="max-width: 50px; max-height: 50px; border-radius: 4px;">'
-
-                # 处理标签
-                tags_html = '<span class="text-muted">无标签</span>'
-
-                # 生成操作按钮HTML（降级模式使用索引作为ID）
-                house_id = f"fallback_{i}"
-                actions_html = f'''
-                    <a target="_blank" href="#" class="btn btn-info btn-sm">房源详情</a>
-                    <a href="/mongo/addHistory/{house_id}" class="btn btn-danger btn-sm" onclick="return confirm('确定要收藏这个房源吗？')">收藏房源</a>
-                '''
-
                 row = [
                     i,  # 编号
-                    image_html,  # 图片
-                    house['title'],  # 房源名称
-                    house['rental_type'],  # 房源类型
-                    house['building'],  # 房源布局/地址
-                    tags_html,  # 标签
-                    house['city'],  # 行政区
-                    house['street'],  # 街道
+                    NO_IMAGE_HTML,  # 图片
+                    escape(house['title']),  # 房源名称
+                    escape(house['rental_type']),  # 房源类型
+                    escape(house['building']),  # 房源布局/地址
+                    NO_TAGS_HTML,  # 标签
+                    escape(house['city']),  # 行政区
+                    escape(house['street']),  # 街道
                     f"{house['area']:.1f}㎡",  # 房源面积
-                    house['orientation'],  # 朝向
+                    escape(house['orientation']),  # 朝向
                     f"¥{house['price']:.0f}/月",  # 价钱
-                    actions_html  # 操作
+                    _table_actions_html(f"fallback_{i}")  # 操作（降级模式使用索引作为ID）
                 ]
                 data.append(row)
 
@@ -719,12 +593,85 @@ def mongo_table_data_api(request):
         'data': data,
         'iTotalRecords': total_records,  # 兼容旧版本DataTables
         'iTotalDisplayRecords': filtered_records,  # 兼容旧版本DataTables
-        'aaData': data  # 兼容旧版本DataTables
+        'aaData': data,  # 兼容旧版本DataTables
+        'cursor': next_cursor  # 下一页键集分页游标
     }
 
     return JsonResponse(response)
 
+# 房源流式导出
+def mongo_export_houses(request):
+    """
+    流式导出房源（NDJSON或CSV）
+
+    参数：format=ndjson|csv，fields=逗号分隔的列，limit，
+    以及过滤条件 q/city/rental_type/min_price/max_price/min_area/max_area。
+    使用服务器端游标逐批读取，内存占用与导出行数无关；
+    MongoDB不可用（含演示模式）时返回503，不导出演示数据
+    """
+    if 'mongo_username' not in request.session:
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+
+    export_format = request.GET.get('format', 'ndjson').lower()
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'error': f'不支持的导出格式: {export_format}'}, status=400)
+
+    fields = parse_fields(request.GET.get('fields'))
+    filters = parse_filters(request.GET)
+    limit = parse_limit(request.GET.get('limit'))
+
+    if request.session.get('fallback_mode', False):
+        return JsonResponse({'error': '演示模式下不支持导出，请在MongoDB可用时重试'}, status=503)
+    try:
+        collection = get_database()['houses']
+        # 先取第一行，连接失败时在响应开始前返回错误
+        rows = iter_house_rows(collection, filters, fields, limit)
+        first = next(rows, None)
+        rows = rows if first is None else _prepend(first, rows)
+    except Exception as e:
+        print(f"导出房源失败: {e}")
+        return JsonResponse({'error': 'MongoDB暂时不可用，请稍后重试'}, status=503)
+
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    if export_format == 'csv':
+        response = StreamingHttpResponse(csv_lines(rows, fields), content_type='text/csv; charset=utf-8')
+    else:
+        response = StreamingHttpResponse(ndjson_lines(rows), content_type='application/x-ndjson; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="houses_{timestamp}.{export_format}"'
+    return response
+
+def _prepend(first, rows):
+    yield first
+    yield from rows
+
+# MongoDB连接池状态
+def mongo_pool_stats(request):
+    """
+    返回当前进程共享连接池的统计信息（签出次数、等待时间、打开的连接数），
+    以及按视图累计的MongoDB命令统计和最近的慢查询
+    """
+    if 'mongo_username' not in request.session:
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+
+    stats = get_pool_stats()
+    stats['commands_by_view'] = get_command_stats()
+    stats['slow_commands'] = get_slow_commands(limit=50)
+    return JsonResponse(stats)
+
 # MongoDB版本的收藏历史
+@cache_query_result(timeout=300, key_prefix='history',
+                    tags=lambda username: [history_tag(username), user_tag(username), HOUSES_TAG])
+def _load_history(username):
+    """用户的收藏历史（逐条解引用房源，结果按标签缓存）"""
+    user = MongoUser.objects(username=username).first()
+    if not user:
+        return []
+    history_records = MongoHistory.objects(user=user).order_by('-collected_time')
+    return [
+        {'house': record.house, 'collected_time': record.collected_time}
+        for record in history_records
+    ]
+
 def mongo_history_table_data(request):
     # 检查用户是否已登录
     if 'mongo_username' not in request.session:
@@ -755,15 +702,8 @@ def mongo_history_table_data(request):
             user = MongoUser.objects(username=username).first()
 
             if user:
-                # 获取用户的收藏历史
-                history_records = MongoHistory.objects(user=user).order_by('-collected_time')
-                history_data = []
-
-                for record in history_records:
-                    history_data.append({
-                        'house': record.house,
-                        'collected_time': record.collected_time
-                    })
+                # 获取用户的收藏历史（缓存，收藏或房源变化时按标签失效）
+                history_data = _load_history(username)
             else:
                 history_data = []
         except:
@@ -811,6 +751,7 @@ def mongo_add_history(request, house_id):
         if not existing:
             history = MongoHistory(user=user, house=house)
             history.save()
+            bump_tags(history_tag(username))
 
     return redirect('mongo_history_table_data')
 
@@ -959,9 +900,7 @@ def mongo_type_in_city(request):
     else:
         try:
             # 正常模式：使用MongoDB数据，模仿MySQL版本的逻辑
-            from pymongo import MongoClient
-            client = MongoClient('mongodb://localhost:27017/')
-            db = client['house_data']
+            db = get_database()
 
             # 获取所有独特的房源类型
             types = [t for t in db.houses.distinct('rental_type') if t]
@@ -1003,8 +942,6 @@ def mongo_type_in_city(request):
 
             # 将字典转换为嵌套列表
             result = [house_counts[type_] for type_ in sorted(types)]
-
-            client.close()
         except Exception as e:
             # MongoDB查询失败，返回空数据
             print(f"MongoDB查询失败: {e}")
@@ -1126,9 +1063,7 @@ def mongo_house_type_rank(request):
         try:
             # 正常模式：使用MongoDB数据，模仿MySQL版本的逻辑
             print("进入正常模式 - housetyperank")  # 调试信息
-            from pymongo import MongoClient
-            client = MongoClient('mongodb://localhost:27017/')
-            db = client['house_data']
+            db = get_database()
             print(f"MongoDB连接成功，数据库: {db.name}")  # 调试信息
 
             # 获取所有唯一的城市
@@ -1196,8 +1131,6 @@ def mongo_house_type_rank(request):
                         price = house.get('price', 0) or 0
                         list3_legend.append(title)
                         list3.append({'value': price, 'name': title})
-
-            client.close()
         except Exception as e:
             # MongoDB查询失败，使用降级数据
             print(f"MongoDB查询失败: {e}")  # 添加调试信息
@@ -1242,187 +1175,23 @@ def mongo_service_money(request):
     fallback_mode = False  # 使用正常模式，与tableData保持一致
 
     if fallback_mode:
-        # 降级模式：使用10K完整数据
+        # 降级模式：使用10K完整数据，一次pandas分组得到全部维度
         from .fallback_data_10k import FALLBACK_HOUSES_10K
 
-        # 1. 面积对价格的影响分析
-        area_price_data = []
-        area_ranges = [(0, 30), (30, 50), (50, 80), (80, 120), (120, 200), (200, 1000)]
-        area_labels = ['30㎡以下', '30-50㎡', '50-80㎡', '80-120㎡', '120-200㎡', '200㎡以上']
-
-        for i, (min_area, max_area) in enumerate(area_ranges):
-            filtered_houses = [
-                house for house in FALLBACK_HOUSES_10K
-                if min_area <= house.get('area', 0) < max_area
-            ]
-            if filtered_houses:
-                avg_price = sum(house.get('price', 0) for house in filtered_houses) / len(filtered_houses)
-                area_price_data.append({
-                    'name': area_labels[i],
-                    'value': round(avg_price, 2),
-                    'count': len(filtered_houses)
-                })
-
-        # 2. 房型对价格的影响分析
-        type_stats = {}
-        for house in FALLBACK_HOUSES_10K:
-            rental_type = house.get('rental_type', '未知')
-            price = house.get('price', 0)
-            if rental_type not in type_stats:
-                type_stats[rental_type] = {'prices': [], 'count': 0}
-            type_stats[rental_type]['prices'].append(price)
-            type_stats[rental_type]['count'] += 1
-
-        type_price_data = []
-        for rental_type, stats in type_stats.items():
-            if stats['prices']:
-                avg_price = sum(stats['prices']) / len(stats['prices'])
-                type_price_data.append({
-                    'name': rental_type,
-                    'value': round(avg_price, 2),
-                    'count': stats['count']
-                })
-
-        # 3. 朝向对价格的影响分析
-        direction_stats = {}
-        valid_directions = ['东', '南', '西', '北', '东南', '东北', '西南', '西北', '南北', '东西']
-
-        for house in FALLBACK_HOUSES_10K:
-            direction = house.get('direction', house.get('orientation', '未知'))
-            if direction in valid_directions:
-                price = house.get('price', 0)
-                if direction not in direction_stats:
-                    direction_stats[direction] = {'prices': [], 'count': 0}
-                direction_stats[direction]['prices'].append(price)
-                direction_stats[direction]['count'] += 1
-
-        direction_price_data = []
-        for direction, stats in direction_stats.items():
-            if stats['prices']:
-                avg_price = sum(stats['prices']) / len(stats['prices'])
-                direction_price_data.append({
-                    'name': direction,
-                    'value': round(avg_price, 2),
-                    'count': stats['count']
-                })
-
-        # 按平均价格排序
-        direction_price_data.sort(key=lambda x: x['value'], reverse=True)
-
-        # 4. 城市对价格的影响分析
-        city_stats = {}
-        for house in FALLBACK_HOUSES_10K:
-            city = house.get('city', '未知')
-            price = house.get('price', 0)
-            if city not in city_stats:
-                city_stats[city] = {'prices': [], 'count': 0}
-            city_stats[city]['prices'].append(price)
-            city_stats[city]['count'] += 1
-
-        city_price_data = []
-        for city, stats in city_stats.items():
-            if stats['prices']:
-                avg_price = sum(stats['prices']) / len(stats['prices'])
-                city_price_data.append({
-                    'name': city,
-                    'value': round(avg_price, 2),
-                    'count': stats['count']
-                })
-
-        # 按平均价格排序
-        city_price_data.sort(key=lambda x: x['value'], reverse=True)
+        impact = fallback_price_impact(FALLBACK_HOUSES_10K)
+        area_price_data = impact['area_price_data']
+        type_price_data = impact['type_price_data']
+        direction_price_data = impact['direction_price_data']
+        city_price_data = impact['city_price_data']
 
     else:
         try:
-            # 正常模式：使用MongoDB数据，模仿MySQL版本的逻辑
-            print("进入正常模式 - servicemoney")  # 调试信息
-            from pymongo import MongoClient
-            client = MongoClient('mongodb://localhost:27017/')
-            db = client['house_data']
-            print(f"MongoDB连接成功，数据库: {db.name}")  # 调试信息
-
-            # 1. 面积对价格的影响分析
-            area_price_data = []
-            area_ranges = [(0, 30), (30, 50), (50, 80), (80, 120), (120, 200), (200, 1000)]
-            area_labels = ['30㎡以下', '30-50㎡', '50-80㎡', '80-120㎡', '120-200㎡', '200㎡以上']
-
-            for i, (min_area, max_area) in enumerate(area_ranges):
-                pipeline = [
-                    {'$match': {'features.area': {'$gte': min_area, '$lt': max_area}}},
-                    {'$group': {
-                        '_id': None,
-                        'avg_price': {'$avg': '$price.monthly_rent'},
-                        'count': {'$sum': 1}
-                    }}
-                ]
-                result = list(db.houses.aggregate(pipeline))
-                if result and result[0]['avg_price']:
-                    area_price_data.append({
-                        'name': area_labels[i],
-                        'value': round(result[0]['avg_price'], 2),
-                        'count': result[0]['count']
-                    })
-
-            # 2. 房型对价格的影响分析
-            type_pipeline = [
-                {'$group': {
-                    '_id': '$rental_type',
-                    'avg_price': {'$avg': '$price.monthly_rent'},
-                    'count': {'$sum': 1}
-                }},
-                {'$sort': {'avg_price': -1}}
-            ]
-            type_results = list(db.houses.aggregate(type_pipeline))
-            type_price_data = []
-            for item in type_results:
-                if item['_id'] and item['avg_price']:
-                    type_price_data.append({
-                        'name': item['_id'],
-                        'value': round(item['avg_price'], 2),
-                        'count': item['count']
-                    })
-
-            # 3. 朝向对价格的影响分析
-            valid_directions = ['东', '南', '西', '北', '东南', '东北', '西南', '西北', '南北', '东西']
-            direction_pipeline = [
-                {'$match': {'features.direction': {'$regex': '东|南|西|北'}}},
-                {'$group': {
-                    '_id': '$features.direction',
-                    'avg_price': {'$avg': '$price.monthly_rent'},
-                    'count': {'$sum': 1}
-                }},
-                {'$sort': {'avg_price': -1}}
-            ]
-            direction_results = list(db.houses.aggregate(direction_pipeline))
-            direction_price_data = []
-            for item in direction_results:
-                if item['_id'] and item['avg_price']:
-                    direction_price_data.append({
-                        'name': item['_id'],
-                        'value': round(item['avg_price'], 2),
-                        'count': item['count']
-                    })
-
-            # 4. 城市对价格的影响分析
-            city_pipeline = [
-                {'$group': {
-                    '_id': '$location.city',
-                    'avg_price': {'$avg': '$price.monthly_rent'},
-                    'count': {'$sum': 1}
-                }},
-                {'$sort': {'avg_price': -1}}
-            ]
-            city_results = list(db.houses.aggregate(city_pipeline))
-            city_price_data = []
-            for item in city_results:
-                if item['_id'] and item['avg_price']:
-                    city_price_data.append({
-                        'name': item['_id'],
-                        'value': round(item['avg_price'], 2),
-                        'count': item['count']
-                    })
-
-            client.close()
+            # 正常模式：一次 $facet 聚合得到面积/房型/朝向/城市四个维度（TTL缓存）
+            impact = get_price_impact_data()
+            area_price_data = impact['area_price_data']
+            type_price_data = impact['type_price_data']
+            direction_price_data = impact['direction_price_data']
+            city_price_data = impact['city_price_data']
         except Exception as e:
             # MongoDB查询失败，使用降级数据
             print(f"MongoDB查询失败 (servicemoney): {e}")  # 添加调试信息
@@ -1471,6 +1240,12 @@ def mongo_heatmap_analysis(request):
     useravatar = request.session['mongo_username'].get('avatar')
     fallback_mode = False  # 使用正常模式，与其他页面保持一致
 
+    # 散点图点数预算与降采样模式（grid / stratified / lttb）
+    max_points = clamp_max_points(request.GET.get('max_points'))
+    sampling = request.GET.get('sampling', 'stratified')
+    if sampling not in SAMPLING_MODES:
+        sampling = 'stratified'
+
     if fallback_mode:
         # 降级模式：使用500条真实数据
         from .fallback_data import FALLBACK_HOUSES
@@ -1503,13 +1278,9 @@ def mongo_heatmap_analysis(request):
                 else:
                     city_type_price.append([i, j, 0])
 
-        # 生成面积-价格散点图数据（取前100个点避免过多）
-        area_price_data = []
-        for house in FALLBACK_HOUSES[:100]:
-            area = house.get('area', 0)
-            price = house.get('price', 0)
-            if area > 0 and price > 0:
-                area_price_data.append([area, price])
+        # 生成面积-价格散点图数据（按点数预算降采样）
+        area_price_data = scatter_pairs(pd.DataFrame(FALLBACK_HOUSES), 'area', 'price',
+                                        max_points, sampling, group='city')
     else:
         try:
             # 正常模式：使用MongoDB数据
@@ -1547,14 +1318,9 @@ def mongo_heatmap_analysis(request):
             # 获取面积价格散点图数据 - 使用更可靠的方法
             area_price_data = []
             try:
-                # 直接查询数据
-                houses = HouseDocument.objects.filter(
-                    features__area__gt=0,
-                    price__monthly_rent__gt=0
-                ).values('features__area', 'price__monthly_rent')[:500]
-
-                area_price_data = [[float(item['features__area']), float(item['price__monthly_rent'])]
-                                 for item in houses if item.get('features__area') and item.get('price__monthly_rent')]
+                # 全量数据来自进程内缓存的列式数据，按点数预算降采样后发送给ECharts
+                area_price_data = scatter_pairs(get_houses_frame(get_database()), 'area', 'price',
+                                                max_points, sampling, group='city')
 
                 # 如果数据不足，添加一些模拟数据
                 if len(area_price_data) < 20:
@@ -1732,68 +1498,17 @@ def mongo_predict_all_prices(request):
     fallback_mode = request.session.get('fallback_mode', False)
 
     try:
-        # 模拟机器学习预测逻辑
-        from pymongo import MongoClient
-        client = MongoClient('mongodb://localhost:27017/')
-        db = client['house_data']
-
-        # 获取所有城市和房型
-        all_cities = sorted(list(db.houses.distinct('location.city')))
-        all_types = sorted(list(db.houses.distinct('rental_type')))
-
-        # 过滤掉空值
-        all_cities = [city for city in all_cities if city]
-        all_types = [house_type for house_type in all_types if house_type]
-
-        # 生成预测结果字典
-        predictions = {}
-        for house_type in all_types:
-            price_list = []
-            for city in all_cities:
-                # 查询该城市该房型的平均价格作为预测值
-                pipeline = [
-                    {'$match': {
-                        'rental_type': house_type,
-                        'location.city': city,
-                        'price.monthly_rent': {'$gt': 0}
-                    }},
-                    {'$group': {
-                        '_id': None,
-                        'avg_price': {'$avg': '$price.monthly_rent'},
-                        'avg_area': {'$avg': '$features.area'}
-                    }}
-                ]
+        # 城市×房型均价矩阵：一次 $group 预计算并存入stats_cache，新房源入库后失效
+        matrix = get_price_matrix(get_database()['houses'])
+        all_cities = matrix['cities']
+        all_types = matrix['types']
+        predictions = matrix['predictions']
 
-                result = list(db.houses.aggregate(pipeline))
-                if result and result[0]['avg_price']:
-                    # 基于实际数据的预测
-                    predicted_price = round(result[0]['avg_price'], 2)
-                else:
-                    # 基于房型和城市的估算
-                    base_price = 2500
-                    if '整租' in house_type:
-                        base_price = 4000
-                    elif '合租' in house_type:
-                        base_price = 2000
-                    elif '单间' in house_type:
-                        base_price = 1500
-
-                    # 城市系数
-                    city_factor = 1.0
-                    if '广州' in city:
-                        city_factor = 1.2
-                    elif '深圳' in city:
-                        city_factor = 1.5
-                    elif '佛山' in city:
-                        city_factor = 0.8
-
-                    predicted_price = round(base_price * city_factor, 2)
-
-                price_list.append(predicted_price)
-
-            predictions[house_type] = price_list
-
-        client.close()
+        # 已训练模型时用回归模型一次批量预测整个矩阵，否则展示各格子均价
+        try:
+            predictions = predict_matrix(all_cities, all_types, matrix.get('areas'))
+        except FileNotFoundError:
+            pass
 
     except Exception as e:
         print(f"MongoDB预测查询失败: {e}")
@@ -1817,3 +1532,47 @@ def mongo_predict_all_prices(request):
     }
 
     return render(request, 'mongo/pricePredict.html', context)
+
+# 城市×房型价格矩阵API（供前端异步加载）
+def mongo_price_matrix_api(request):
+    if 'mongo_username' not in request.session:
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+
+    try:
+        matrix = get_price_matrix(get_database()['houses'])
+    except Exception as e:
+        print(f"价格矩阵查询失败: {e}")
+        return JsonResponse({'error': str(e)}, status=503)
+
+    return JsonResponse({
+        'cities': matrix['cities'],
+        'types': matrix['types'],
+        'predictions': matrix['predictions'],
+        'generated_at': matrix['generated_at'].isoformat() if matrix.get('generated_at') else None
+    })
+
+# 批量房价预测API：POST {"listings": [...]} 或 {"grid": {"city": [...], "area": [...]}}
+# 需要CSRF令牌（X-CSRFToken请求头）
+def mongo_predict_api(request):
+    if 'mongo_username' not in request.session:
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+
+    try:
+        payload = json.loads(request.body or b'{}')
+        if not isinstance(payload, dict):
+            return JsonResponse({'error': '请求体必须是JSON对象'}, status=400)
+        listings = expand_grid(payload['grid']) if 'grid' in payload else payload.get('listings', [])
+        if not isinstance(listings, list):
+            raise ValueError('listings必须是数组')
+        prices, meta = predict_listings(listings)
+    except FileNotFoundError:
+        return JsonResponse({'error': 'Model not found. Run manage.py train_mongo_price_model first.'}, status=404)
+    except (ValueError, TypeError, KeyError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    response = {'count': len(prices), 'predictions': prices, 'model_version': meta.get('version')}
+    if 'grid' in payload:
+        response['listings'] = listings
+    return JsonResponse(response)
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+可视化数据加载
+只投影图表需要的字段，按游标批次直接写入列式数组（数值float32、文本categorical），
+加载结果按数据版本缓存在进程内，数据未变化时各图表请求共享同一个DataFrame
+"""
+
+import logging
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from mongodb_integration.stats_rollup import (
+    STATS_COLLECTION, ROLLUP_STAT_TYPE, TOTAL_DIMENSION, TOTAL_VALUE, rollup_key
+)
+
+logger = logging.getLogger(__name__)
+
+# 列名 -> 文档字段路径（列名与降级数据的扁平字段保持一致）
+NUMERIC_COLUMNS = {
+    'area': 'features.area',
+    'price': 'price.monthly_rent',
+}
+CATEGORY_COLUMNS = {
+    'city': 'location.city',
+    'street': 'location.street',
+    'building': 'location.building',
+    'rental_type': 'rental_type',
+    'direction': 'features.direction',
+    'room_type': 'features.room_type',
+}
+TEXT_COLUMNS = {
+    'title': 'title',
+}
+COLUMNS = list(NUMERIC_COLUMNS) + list(CATEGORY_COLUMNS) + list(TEXT_COLUMNS)
+
+VIZ_PROJECTION = dict(
+    {'_id': 0},
+    **{path: 1 for path in (*NUMERIC_COLUMNS.values(), *CATEGORY_COLUMNS.values(), *TEXT_COLUMNS.values())}
+)
+
+MISSING_TEXT = '未知'
+
+# 两次数据版本检查的最小间隔（秒）
+VERSION_CHECK_INTERVAL = 5
+# 缓存最长保留时间（秒），兜底没有经过汇总更新的写入
+FRAME_MAX_AGE = 600
+
+_frame_lock = threading.Lock()
+_frame_cache = {'version': None, 'frame': None, 'loaded_at': 0.0, 'checked_at': 0.0}
+
+
+def _get_path(doc, path):
+    value = doc
+    for part in path.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _batch_columns(docs):
+    """一批文档 -> {列名: 数组}，文本列在批内即转为categorical"""
+    columns = {}
+    for name, path in NUMERIC_COLUMNS.items():
+        columns[name] = np.fromiter((_to_float(_get_path(doc, path)) for doc in docs),
+                                    dtype=np.float32, count=len(docs))
+    for name, path in CATEGORY_COLUMNS.items():
+        columns[name] = pd.Categorical([_get_path(doc, path) or MISSING_TEXT for doc in docs])
+    for name, path in TEXT_COLUMNS.items():
+        columns[name] = [_get_path(doc, path) or '' for doc in docs]
+    return columns
+
+
+def _concat_batches(batches):
+    if not batches:
+        batches = [_batch_columns([])]
+    data = {}
+    for name in NUMERIC_COLUMNS:
+        data[name] = np.concatenate([batch[name] for batch in batches])
+    for name in CATEGORY_COLUMNS:
+        data[name] = union_categoricals([batch[name] for batch in batches])
+    for name in TEXT_COLUMNS:
+        data[name] = [value for batch in batches for value in batch[name]]
+    return pd.DataFrame(data, columns=COLUMNS)
+
+
+def load_houses_frame(collection, query=None, batch_size=5000):
+    """
+    流式加载房源列式数据
+
+    Args:
+        collection: 房源集合
+        query: 过滤条件
+        batch_size: 游标批大小，同时也是转换为数组的批大小
+
+    Returns:
+        pandas.DataFrame: 列为 COLUMNS，area/price为float32，城市/街道等为category
+    """
+    cursor = collection.find(query or {}, VIZ_PROJECTION, batch_size=batch_size)
+    batches = []
+    docs = []
+    for doc in cursor:
+        docs.append(doc)
+        if len(docs) >= batch_size:
+            batches.append(_batch_columns(docs))
+            docs = []
+    if docs:
+        batches.append(_batch_columns(docs))
+    return _concat_batches(batches)
+
+
+def data_version(db):
+    """
+    房源数据版本：估算文档数 + 最新_id + 总汇总的更新时间
+    新增房源改变前两项，管道/HouseDataService 的更新会刷新汇总时间
+    """
+    latest = db.houses.find_one({}, {'_id': 1}, sort=[('_id', -1)])
+    rollup = db[STATS_COLLECTION].find_one(
+        {'stat_type': ROLLUP_STAT_TYPE, 'stat_key': rollup_key(TOTAL_DIMENSION, TOTAL_VALUE)},
+        {'updated_time': 1, '_id': 0}
+    )
+    return (
+        db.houses.estimated_document_count(),
+        str(latest['_id']) if latest else None,
+        rollup.get('updated_time') if rollup else None,
+    )
+
+
+def get_houses_frame(db, force=False):
+    """
+    读取进程内缓存的房源DataFrame，数据版本变化时重新加载
+
+    返回的DataFrame被多个请求共享，调用方只读不改
+
+    Args:
+        db: MongoDB数据库
+        force: 忽略缓存强制重新加载
+    """
+    return get_versioned_frame(db, force)[0]
+
+
+def get_versioned_frame(db, force=False):
+    """
+    同 get_houses_frame，同时返回该DataFrame对应的数据版本
+
+    两者在同一次加锁内读取，另一线程此时重新加载也不会得到新数据配旧版本
+
+    Returns:
+        tuple: (DataFrame, 数据版本)
+    """
+    now = time.time()
+    with _frame_lock:
+        cached = _frame_cache['frame']
+        fresh = cached is not None and now - _frame_cache['loaded_at'] < FRAME_MAX_AGE
+        if not force and fresh and now - _frame_cache['checked_at'] < VERSION_CHECK_INTERVAL:
+            return cached, _frame_cache['version']
+
+        version = data_version(db)
+        _frame_cache['checked_at'] = now
+        if not force and fresh and version == _frame_cache['version']:
+            return cached, version
+
+        started = time.time()
+        frame = load_houses_frame(db.houses)
+        _frame_cache.update(version=version, frame=frame, loaded_at=now)
+        logger.info(f"可视化数据已加载: {len(frame)} 条, 耗时 {time.time() - started:.2f}s, "
+                    f"内存 {frame.memory_usage(deep=True).sum() / 1024 / 1024:.1f}MB")
+        return frame, version
+
+
+def prime_houses_frame(db, refresh_ahead=0.8):
+    """
+    预热进程内DataFrame：数据版本变化、或缓存已存活超过 FRAME_MAX_AGE*refresh_ahead 时重新加载，
+    使请求不会遇到过期重载
+    """
+    with _frame_lock:
+        expiring = time.time() - _frame_cache['loaded_at'] >= FRAME_MAX_AGE * refresh_ahead
+    return get_houses_frame(db, force=expiring)
+
+
+def clear_frame_cache():
+    with _frame_lock:
+        _frame_cache.update(version=None, frame=None, loaded_at=0.0, checked_at=0.0)
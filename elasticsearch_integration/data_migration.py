@@ -4,7 +4,8 @@
 从MongoDB迁移数据到Elasticsearch分布式存储
 """
 
-import pymongo
+import os
+import sys
 from elasticsearch import Elasticsearch
 from elasticsearch.helpers import bulk, parallel_bulk
 import json
@@ -15,6 +16,10 @@ import time
 
 from elasticsearch_config import ElasticsearchManager, ElasticsearchConfig
 
+# 添加项目根目录到路径，复用共享的MongoDB客户端
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mongodb_integration.mongodb_config import get_mongodb_client, MONGODB_DATABASE, MONGODB_COLLECTION
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -32,9 +37,10 @@ class DataMigrator:
     def setup_mongodb(self):
         """设置MongoDB连接"""
         try:
-            self.mongo_client = pymongo.MongoClient('mongodb://localhost:27017/')
-            self.mongo_db = self.mongo_client['house_data']
-            self.mongo_collection = self.mongo_db['houses']
+            # 共享客户端由连接注册表管理，迁移结束后不要close()
+            self.mongo_client = get_mongodb_client()
+            self.mongo_db = self.mongo_client[MONGODB_DATABASE]
+            self.mongo_collection = self.mongo_db[MONGODB_COLLECTION]
             logger.info("✅ MongoDB连接成功")
         except Exception as e:
             logger.error(f"❌ MongoDB连接失败: {e}")
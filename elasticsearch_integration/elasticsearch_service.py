@@ -15,6 +15,17 @@ from elasticsearch_config import ElasticsearchManager, ElasticsearchConfig
 
 logger = logging.getLogger(__name__)
 
+try:
+    from mongodb_integration.mongodb_config import get_database
+    from mongodb_integration.stats_rollup import apply_rollup_change, apply_rollup_changes
+except ImportError:  # 单独运行ES脚本时项目根目录不在sys.path中
+    get_database = None
+
+try:
+    from app_mongo.cache_utils import bump_tags, house_write_tags
+except ImportError:  # 未在Django项目中运行时不维护缓存标签
+    bump_tags = None
+
 class HouseSearchService:
     """房源搜索服务"""
     
@@ -339,19 +350,69 @@ class HouseSearchService:
             logger.error(f"市场分析失败: {e}")
             return {}
 
+def _merge_doc(base: Dict[str, Any], changes: Dict[str, Any]) -> Dict[str, Any]:
+    """按Elasticsearch partial update的语义合并嵌套字段"""
+    merged = dict(base)
+    for key, value in changes.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge_doc(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
 class HouseDataService:
     """房源数据服务"""
     
-    def __init__(self):
+    def __init__(self, maintain_rollups: bool = True):
         self.es_manager = ElasticsearchManager()
         self.client = self.es_manager.client
         self.index_name = ElasticsearchConfig.INDEX_NAME
+        # 同步维护MongoDB stats_cache中的城市/类型/朝向/面积汇总
+        self.maintain_rollups = maintain_rollups and get_database is not None
+    
+    def _get_source(self, house_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            return self.client.get(index=self.index_name, id=house_id)['_source']
+        except Exception:
+            return None
+    
+    def _get_sources(self, house_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批量读取已存在的文档，用于批量覆盖时扣除旧的汇总贡献"""
+        if not house_ids:
+            return {}
+        try:
+            docs = self.client.mget(index=self.index_name, body={'ids': house_ids})['docs']
+        except Exception:
+            return {}
+        return {str(doc['_id']): doc['_source'] for doc in docs if doc.get('found')}
+    
+    def _update_rollups(self, old_doc: Optional[Dict[str, Any]], new_doc: Optional[Dict[str, Any]]):
+        if not self.maintain_rollups:
+            return
+        try:
+            apply_rollup_change(get_database(), old_doc, new_doc)
+        except Exception as e:
+            logger.error(f"统计汇总更新失败: {e}")
+    
+    def _invalidate_cache(self, *docs: Optional[Dict[str, Any]]):
+        """递增新旧文档涉及的缓存标签；文档内容未知时按全量变更处理"""
+        if bump_tags is None:
+            return
+        docs = [doc for doc in docs if doc is not None]
+        tags = set()
+        for doc in docs or [None]:
+            tags.update(house_write_tags(doc))
+        bump_tags(*tags)
     
     def add_house(self, house_data: Dict[str, Any]) -> bool:
         """添加房源"""
         try:
             house_data['created_at'] = datetime.now()
             house_data['updated_at'] = datetime.now()
+            # 同ID重复添加视为覆盖，需要扣除旧文档的汇总贡献
+            old_doc = None
+            if self.maintain_rollups and house_data.get('house_id'):
+                old_doc = self._get_source(house_data['house_id'])
             
             response = self.client.index(
                 index=self.index_name,
@@ -359,6 +420,9 @@ class HouseDataService:
                 body=house_data
             )
             
+            self._update_rollups(old_doc, house_data)
+            self._invalidate_cache(old_doc, house_data)
+            
             logger.info(f"房源添加成功: {response['_id']}")
             return True
             
@@ -370,6 +434,7 @@ class HouseDataService:
         """更新房源"""
         try:
             update_data['updated_at'] = datetime.now()
+            old_doc = self._get_source(house_id) if self.maintain_rollups else None
             
             response = self.client.update(
                 index=self.index_name,
@@ -377,6 +442,11 @@ class HouseDataService:
                 body={"doc": update_data}
             )
             
+            new_doc = _merge_doc(old_doc, update_data) if old_doc is not None else None
+            if old_doc is not None:
+                self._update_rollups(old_doc, new_doc)
+            self._invalidate_cache(old_doc, new_doc)
+            
             logger.info(f"房源更新成功: {house_id}")
             return True
             
@@ -387,11 +457,17 @@ class HouseDataService:
     def delete_house(self, house_id: str) -> bool:
         """删除房源"""
         try:
+            old_doc = self._get_source(house_id) if self.maintain_rollups else None
+            
             response = self.client.delete(
                 index=self.index_name,
                 id=house_id
             )
             
+            if old_doc is not None:
+                self._update_rollups(old_doc, None)
+            self._invalidate_cache(old_doc)
+            
             logger.info(f"房源删除成功: {house_id}")
             return True
             
@@ -414,7 +490,23 @@ class HouseDataService:
                 }
                 actions.append(action)
             
-            success, failed = bulk(self.client, actions)
+            old_docs = {}
+            if self.maintain_rollups:
+                old_docs = self._get_sources([str(h['house_id']) for h in houses_data if h.get('house_id')])
+            
+            success, failed = bulk(self.client, actions, raise_on_error=False)
+            
+            # 只为写入成功的文档更新汇总，与MongoDB管道的批量写入路径一致
+            failed_ids = {str(item.get('index', {}).get('_id')) for item in failed}
+            written = [h for h in houses_data if str(h.get('house_id')) not in failed_ids]
+            changes = [(old_docs.get(str(h.get('house_id'))), h) for h in written]
+            if self.maintain_rollups and changes:
+                try:
+                    apply_rollup_changes(get_database(), changes)
+                except Exception as e:
+                    logger.error(f"统计汇总更新失败: {e}")
+            if changes:
+                self._invalidate_cache(*[doc for change in changes for doc in change])
             
             logger.info(f"批量添加完成 - 成功: {success}, 失败: {len(failed)}")
             return {"success": success, "failed": len(failed)}
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+缓存预热访问记录中间件
+记录成功响应的视图(url name)，缓存预热调度据此判断哪些页面是热门页面；
+中间件加载时（Web进程启动）同时启动后台预热调度
+"""
+
+import logging
+
+from app_mongo.cache_warmup import record_view, start_warmup_scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class CacheWarmupMiddleware:
+    """视图访问计数中间件"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        start_warmup_scheduler()
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        if match is not None and match.url_name and response.status_code < 400:
+            try:
+                record_view(match.url_name)
+            except Exception as e:
+                logger.debug(f"视图访问记录失败: {e}")
+
+        return response
@@ -1,22 +1,66 @@
 # -*- coding: utf-8 -*-
 """
 性能监控中间件
-监控请求响应时间和数据库查询性能
+监控请求响应时间和数据库查询性能（MongoDB命令与MySQL查询）
 """
 
 import time
 import logging
+import zlib
 from django.conf import settings
 from django.db import connection
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+from mongodb_integration.mongodb_config import collect_commands
+
+try:
+    import brotli
+except ImportError:  # 未安装brotli时只使用gzip
+    brotli = None
 
 logger = logging.getLogger(__name__)
 
+# 需要压缩的非text/*内容类型
+COMPRESSIBLE_TYPES = {
+    'application/json',
+    'application/javascript',
+    'application/x-javascript',
+    'application/xml',
+    'application/x-ndjson',
+    'image/svg+xml',
+}
+
+# gzip文件头中加入的随机字节数（与Django GZipMiddleware相同，缓解BREACH攻击）
+GZIP_MAX_RANDOM_BYTES = 100
+# zlib输出带gzip头和尾的格式
+GZIP_WBITS = 31
+
+def _server_timing(name, duration_ms, description=None):
+    entry = f'{name};dur={duration_ms:.1f}'
+    if description:
+        entry += f';desc="{description}"'
+    return entry
+
 class PerformanceMonitoringMiddleware:
-    """性能监控中间件"""
+    """
+    性能监控中间件
+
+    MongoDB命令由 mongodb_config 中的CommandListener按请求统计（命令数、耗时、返回文档数；应答字节数只在慢查询日志中），
+    MySQL查询仅在DEBUG模式下可从 connection.queries 获得；结果写入 Server-Timing 头
+    """
     
     def __init__(self, get_response):
         self.get_response = get_response
         
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # URL解析后才知道视图名，此后发出的命令按视图归类
+        collector = getattr(request, 'mongo_commands', None)
+        if collector is not None:
+            match = request.resolver_match
+            collector.label = (match.view_name if match else None) or view_func.__name__
+        return None
+        
     def __call__(self, request):
         # 记录请求开始时间
         start_time = time.time()
@@ -24,30 +68,46 @@ class PerformanceMonitoringMiddleware:
         # 记录数据库查询开始状态
         initial_queries = len(connection.queries)
         
-        # 处理请求
-        response = self.get_response(request)
+        # 处理请求（期间的MongoDB命令计入本请求）
+        with collect_commands() as mongo:
+            request.mongo_commands = mongo
+            response = self.get_response(request)
         
         # 计算响应时间
         end_time = time.time()
         response_time = end_time - start_time
         
         # 计算数据库查询数量
-        db_queries = len(connection.queries) - initial_queries
+        sql_queries = connection.queries[initial_queries:]
+        sql_time_ms = sum(float(query.get('time') or 0) for query in sql_queries) * 1000
+        db_queries = len(sql_queries) + mongo.commands
         
         # 添加性能头信息
         response['X-Response-Time'] = f'{response_time:.3f}s'
         response['X-DB-Queries'] = str(db_queries)
+        timings = [_server_timing('total', response_time * 1000)]
+        if mongo.commands:
+            timings.append(_server_timing(
+                'mongo', mongo.time_ms,
+                f'{mongo.commands} commands, {mongo.docs} docs'
+            ))
+        if sql_queries:
+            timings.append(_server_timing('sql', sql_time_ms, f'{len(sql_queries)} queries'))
+        existing = response.get('Server-Timing')
+        response['Server-Timing'] = ', '.join(([existing] if existing else []) + timings)
         
         # 记录慢请求
         if response_time > 1.0:  # 超过1秒的请求
             logger.warning(
                 f'Slow request: {request.method} {request.path} '
-                f'took {response_time:.3f}s with {db_queries} DB queries'
+                f'took {response_time:.3f}s with {db_queries} DB queries '
+                f'(mongo {mongo.commands} commands {mongo.time_ms:.1f}ms, {mongo.docs} docs)'
             )
         
         # 在开发模式下添加调试信息
         if settings.DEBUG:
-            print(f'🚀 {request.method} {request.path} - {response_time:.3f}s - {db_queries} queries')
+            print(f'🚀 {request.method} {request.path} - {response_time:.3f}s - {db_queries} queries '
+                  f'(mongo {mongo.time_ms:.1f}ms)')
         
         return response
 
@@ -74,17 +134,137 @@ class CacheControlMiddleware:
         
         return response
 
+def _accepted_encodings(header):
+    """解析Accept-Encoding，返回 {编码: q值}（q=0表示明确拒绝）"""
+    encodings = {}
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        encodings[name] = quality
+    return encodings
+
+
+def _is_compressible(content_type):
+    """文本类内容才压缩；图片、压缩包等已压缩的类型跳过"""
+    media_type = content_type.split(';', 1)[0].strip().lower()
+    return (
+        media_type.startswith('text/')
+        or media_type in COMPRESSIBLE_TYPES
+        or media_type.endswith(('+json', '+xml'))
+    )
+
+
+def _brotli_stream(chunks, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in chunks:
+        # 每个分块都flush，流式响应（如NDJSON）仍能逐块到达客户端
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def _brotli_stream_async(chunks, quality):
+    compressor = brotli.Compressor(quality=quality)
+    async for chunk in chunks:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def _gzip_stream(chunks):
+    # 整个响应是一个gzip成员；每个分块后Z_SYNC_FLUSH，已压缩的数据立即发往客户端
+    compressor = zlib.compressobj(wbits=GZIP_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def _gzip_stream_async(chunks):
+    compressor = zlib.compressobj(wbits=GZIP_WBITS)
+    async for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
 class CompressionMiddleware:
-    """响应压缩中间件（简化版）"""
+    """
+    响应压缩中间件
+
+    按Accept-Encoding选择brotli（已安装brotli库时）或gzip：
+    - 只压缩文本类内容（HTML/JSON/JS/CSS/NDJSON等），跳过图片等已压缩的类型
+    - 普通响应小于MIN_SIZE不压缩，压缩后没有变小时保留原文
+    - StreamingHttpResponse逐块压缩，不缓冲整个响应
+    配置见 settings.COMPRESSION
+    """
     
     def __init__(self, get_response):
         self.get_response = get_response
+        options = getattr(settings, 'COMPRESSION', {})
+        self.min_size = options.get('MIN_SIZE', 1024)
+        self.brotli_quality = options.get('BROTLI_QUALITY', 5)
+        
+    def _choose_encoding(self, request):
+        accepted = _accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        wildcard = accepted.get('*', 0)
+        if brotli is not None and accepted.get('br', wildcard) > 0:
+            return 'br'
+        if accepted.get('gzip', wildcard) > 0:
+            return 'gzip'
+        return None
         
     def __call__(self, request):
         response = self.get_response(request)
         
-        # 添加压缩提示头
-        if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
-            response['Vary'] = 'Accept-Encoding'
+        if response.has_header('Content-Encoding') or not _is_compressible(response.get('Content-Type', '')):
+            return response
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+        
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = self._choose_encoding(request)
+        if encoding is None:
+            return response
+        
+        if response.streaming:
+            if encoding == 'br':
+                stream = _brotli_stream_async if response.is_async else _brotli_stream
+                response.streaming_content = stream(response.streaming_content, self.brotli_quality)
+            else:
+                stream = _gzip_stream_async if response.is_async else _gzip_stream
+                response.streaming_content = stream(response.streaming_content)
+            # 压缩后的长度在发送完之前未知
+            if response.has_header('Content-Length'):
+                del response['Content-Length']
+        else:
+            if encoding == 'br':
+                compressed = brotli.compress(response.content, quality=self.brotli_quality)
+            else:
+                compressed = compress_string(response.content, max_random_bytes=GZIP_MAX_RANDOM_BYTES)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+        
+        # 内容编码改变后强ETag不再成立，改为弱ETag
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
         
         return response
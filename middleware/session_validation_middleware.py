@@ -3,14 +3,67 @@
 """
 Session验证中间件
 防止用户信息显示错误和session数据混乱
+
+验证结果按会话在进程内记忆，同一会话的后续请求只做字典查找；
+两个版本可以同时登录，互不清理对方的session数据，已登录页面浏览不会产生会话写入
 """
 
+from collections import OrderedDict
+import threading
+import time
+
+from django.conf import settings
 from django.utils.deprecation import MiddlewareMixin
 from django.shortcuts import redirect
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 滑动过期的续期时间戳
+REFRESHED_AT_KEY = '_refreshed_at'
+
+# 各版本路径对应的登录信息key、登录页
+SESSION_KINDS = {
+    'mysql': ('username', 'login'),
+    'mongo': ('mongo_username', 'mongo_login'),
+}
+
+
+class ValidatedSessions:
+    """
+    已验证会话的记忆（LRU，进程内）
+    key为(session_key, 版本)，值为验证通过时的用户名
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def matches(self, session_key, kind, username):
+        with self._lock:
+            cached = self._entries.get((session_key, kind))
+            if cached is None or cached != username:
+                return False
+            self._entries.move_to_end((session_key, kind))
+            return True
+
+    def remember(self, session_key, kind, username):
+        with self._lock:
+            self._entries[(session_key, kind)] = username
+            self._entries.move_to_end((session_key, kind))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def forget(self, session_key):
+        with self._lock:
+            for kind in SESSION_KINDS:
+                self._entries.pop((session_key, kind), None)
+
+
+validated_sessions = ValidatedSessions(getattr(settings, 'SESSION_VALIDATION_CACHE_SIZE', 10000))
+
+
 class SessionValidationMiddleware(MiddlewareMixin):
     """
     Session验证中间件
@@ -32,10 +85,11 @@ class SessionValidationMiddleware(MiddlewareMixin):
             '/admin/',
             '/static/',
             '/media/',
-            '/'
         ]
         
-        # 检查是否需要跳过验证
+        # 检查是否需要跳过验证（根路径是登录页，只做精确匹配）
+        if path == '/':
+            return None
         for skip_path in skip_paths:
             if path.startswith(skip_path):
                 return None
@@ -54,58 +108,52 @@ class SessionValidationMiddleware(MiddlewareMixin):
         """
         验证MySQL版本的session
         """
-        if 'username' not in request.session:
-            logger.warning(f"MySQL版本访问未登录: {request.path}")
-            return redirect('login')
-        
-        # 验证session数据完整性
-        username_data = request.session.get('username')
-        if not isinstance(username_data, dict):
-            logger.error(f"MySQL版本session数据格式错误: {username_data}")
-            request.session.clear()
-            return redirect('login')
-        
-        if 'username' not in username_data:
-            logger.error(f"MySQL版本session缺少用户名: {username_data}")
-            request.session.clear()
-            return redirect('login')
-        
-        # 清理可能的MongoDB session数据冲突
-        if 'mongo_username' in request.session:
-            logger.info("清理MySQL版本中的MongoDB session数据")
-            del request.session['mongo_username']
-            if 'fallback_mode' in request.session:
-                del request.session['fallback_mode']
-        
-        return None
+        return self._validate_session(request, 'mysql', 'MySQL版本')
     
     def _validate_mongo_session(self, request):
         """
         验证MongoDB版本的session
         """
-        if 'mongo_username' not in request.session:
-            logger.warning(f"MongoDB版本访问未登录: {request.path}")
-            return redirect('mongo_login')
+        return self._validate_session(request, 'mongo', 'MongoDB版本')
+    
+    def _validate_session(self, request, kind, label):
+        """
+        验证session数据完整性
+
+        未登录的请求交给视图/装饰器处理（它们会带上next参数跳转登录页）；
+        另一版本的登录信息（username / mongo_username / fallback_mode）保留不动
+        """
+        session_field, login_url = SESSION_KINDS[kind]
+        session = request.session
+        if session_field not in session:
+            return None
+        
+        user_data = session.get(session_field)
+        session_key = session.session_key
+        username = user_data.get('username') if isinstance(user_data, dict) else None
         
-        # 验证session数据完整性
-        mongo_username_data = request.session.get('mongo_username')
-        if not isinstance(mongo_username_data, dict):
-            logger.error(f"MongoDB版本session数据格式错误: {mongo_username_data}")
-            request.session.clear()
-            return redirect('mongo_login')
+        # 已验证过的会话不重复验证
+        if session_key and username and validated_sessions.matches(session_key, kind, username):
+            return None
         
-        if 'username' not in mongo_username_data:
-            logger.error(f"MongoDB版本session缺少用户名: {mongo_username_data}")
-            request.session.clear()
-            return redirect('mongo_login')
+        if not isinstance(user_data, dict):
+            logger.error(f"{label}session数据格式错误: {user_data}")
+            return self._reject(request, login_url)
         
-        # 清理可能的MySQL session数据冲突
-        if 'username' in request.session:
-            logger.info("清理MongoDB版本中的MySQL session数据")
-            del request.session['username']
+        if 'username' not in user_data:
+            logger.error(f"{label}session缺少用户名: {user_data}")
+            return self._reject(request, login_url)
         
+        if session_key:
+            validated_sessions.remember(session_key, kind, username)
         return None
     
+    def _reject(self, request, login_url):
+        if request.session.session_key:
+            validated_sessions.forget(request.session.session_key)
+        request.session.clear()
+        return redirect(login_url)
+    
     def process_response(self, request, response):
         """
         处理响应，记录session状态
@@ -120,4 +168,26 @@ class SessionValidationMiddleware(MiddlewareMixin):
                 username = request.session['mongo_username'].get('username', 'unknown')
                 logger.debug(f"MongoDB版本响应 - 用户: {username}, 路径: {path}")
         
+        if hasattr(request, 'session'):
+            self._refresh_expiry(request.session)
         return response
+    
+    def _refresh_expiry(self, session):
+        """
+        滑动过期：已登录会话距上次续期超过SESSION_REFRESH_INTERVAL时写一次时间戳，
+        由SessionMiddleware保存并顺延Cookie和存储的过期时间
+        """
+        if not session.accessed or session.modified:
+            if session.modified and self._is_authenticated(session):
+                session[REFRESHED_AT_KEY] = int(time.time())
+            return
+        if not self._is_authenticated(session):
+            return
+        interval = getattr(settings, 'SESSION_REFRESH_INTERVAL', settings.SESSION_COOKIE_AGE // 2)
+        refreshed_at = session.get(REFRESHED_AT_KEY)
+        if refreshed_at is None or time.time() - refreshed_at >= interval:
+            session[REFRESHED_AT_KEY] = int(time.time())
+    
+    @staticmethod
+    def _is_authenticated(session):
+        return any(field in session for field, _ in SESSION_KINDS.values())
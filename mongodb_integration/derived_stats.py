@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+派生统计失效
+stats_cache 中由房源数据预计算出的结果（如城市×房型价格矩阵），
+在爬虫管道等写入新房源后删除，Web端下次读取时重新计算
+"""
+
+# 房源写入后需要失效的统计类型（stats_cache.stat_type）
+INGEST_DERIVED_STATS = ['price_matrix']
+
+STATS_COLLECTION = 'stats_cache'
+
+
+def invalidate_derived_stats(db=None, stat_types=None):
+    """
+    删除依赖房源数据的预计算统计
+
+    Args:
+        db: pymongo数据库对象，默认使用MongoEngine当前连接
+        stat_types: 需要失效的统计类型，默认 INGEST_DERIVED_STATS
+
+    Returns:
+        int: 删除的文档数
+    """
+    if db is None:
+        from mongoengine.connection import get_db
+        db = get_db()
+
+    result = db[STATS_COLLECTION].delete_many({
+        'stat_type': {'$in': list(stat_types or INGEST_DERIVED_STATS)}
+    })
+    return result.deleted_count
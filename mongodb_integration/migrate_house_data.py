@@ -24,6 +24,7 @@ from mongodb_integration.models.mongo_models import (
     HouseDocument, LocationInfo, PriceInfo, 
     HouseFeatures, CrawlMetadata
 )
+from mongodb_integration.derived_stats import invalidate_derived_stats
 
 class HouseDataMigrator:
     """房源数据迁移器"""
@@ -126,6 +127,12 @@ class HouseDataMigrator:
                 self.errors.append(f"Batch {offset//batch_size + 1}: {str(e)}")
                 offset += batch_size
         
+        # 房源数据已变化，使价格矩阵等预计算统计失效
+        try:
+            invalidate_derived_stats()
+        except Exception as e:
+            print(f"⚠️  派生统计失效失败: {e}")
+        
         return True
     
     def process_batch(self, batch_data, offset, total_count):
@@ -9,6 +9,8 @@ from mongoengine import Document, EmbeddedDocument, fields
 from datetime import datetime
 import uuid
 
+from .search_tokens import build_search_keywords
+
 class LocationInfo(EmbeddedDocument):
     """地理位置信息（嵌套文档）"""
     # 基础位置信息
@@ -112,6 +114,9 @@ class HouseDocument(Document):
     tags = fields.ListField(fields.StringField(max_length=50))          # 标签列表
     category = fields.StringField(max_length=100)                       # 分类
     
+    # 搜索关键词（由save()根据标题、位置、房型、标签自动生成）
+    search_keywords = fields.ListField(fields.StringField())
+    
     # 状态信息
     status = fields.StringField(max_length=50, default='available',     # 房源状态
                                choices=['available', 'rented', 'offline'])
@@ -134,6 +139,14 @@ class HouseDocument(Document):
             ('location.city', 'price.monthly_rent'),  # 复合索引
             ('location.city', 'features.area'),       # 复合索引
             ('rental_type', 'status'),                # 复合索引
+            ('title', 'id'),                          # 表格键集分页（排序列 + _id）
+            ('features.area', 'id'),                  # 表格键集分页
+            ('price.monthly_rent', 'id'),             # 表格键集分页
+            'search_keywords',                        # 搜索关键词多键索引
+            {
+                'fields': ['crawl_meta.source_url'],
+                'sparse': True
+            },  # 爬虫批量upsert按来源链接定位房源
             {
                 'fields': ['location.coordinates'],
                 'cls': False,
@@ -151,6 +164,7 @@ class HouseDocument(Document):
         self.updated_at = datetime.now()
         if not self.house_id:
             self.house_id = str(uuid.uuid4())
+        self.search_keywords = build_search_keywords(self)
         return super().save(*args, **kwargs)
     
     @classmethod
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+房源搜索分词
+将标题、位置、房型等文本切分为关键词数组（中文单字+二元组，英文数字整词+前缀），
+写入 HouseDocument.search_keywords 并建立多键索引，搜索时用 $all 命中索引，
+不依赖jieba等第三方分词库，一两个汉字的短查询同样可以匹配
+"""
+
+import re
+import unicodedata
+
+# 参与搜索的字段及其相关度权重（字段路径, 权重）
+SEARCH_FIELDS = [
+    ('title', 10),
+    ('location.building', 6),
+    ('location.street', 4),
+    ('location.city', 4),
+    ('rental_type', 2),
+    ('features.room_type', 2),
+    ('features.direction', 1),
+]
+
+# 单个文档关键词数量上限，防止超长标题撑大索引
+MAX_KEYWORDS = 512
+
+# 英文/数字词前缀的最大长度
+MAX_PREFIX_LENGTH = 20
+
+_CJK_RUN = re.compile(r'[㐀-䶿一-鿿豈-﫿]+')
+_WORD_RUN = re.compile(r'[0-9a-z]+')
+
+
+def normalize_text(text):
+    """全角转半角、转小写"""
+    if not text:
+        return ''
+    return unicodedata.normalize('NFKC', str(text)).lower()
+
+
+def _cjk_ngrams(run):
+    """中文连续片段：全部单字 + 相邻二元组"""
+    grams = list(run)
+    grams.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return grams
+
+
+def _word_prefixes(word):
+    """英文/数字词：全部前缀，支持边输入边搜索"""
+    return [word[:i] for i in range(1, min(len(word), MAX_PREFIX_LENGTH) + 1)]
+
+
+def tokenize(text):
+    """
+    文本切分为建索引用的关键词
+
+    Returns:
+        list: 去重后的关键词（保持出现顺序）
+    """
+    text = normalize_text(text)
+    tokens = []
+    for run in _CJK_RUN.findall(text):
+        tokens.extend(_cjk_ngrams(run))
+    for word in _WORD_RUN.findall(text):
+        tokens.extend(_word_prefixes(word))
+    return list(dict.fromkeys(tokens))
+
+
+def query_tokens(query):
+    """
+    搜索词切分为查询关键词（全部命中才算匹配）
+
+    中文片段长度为1时用单字，否则用相邻二元组，近似子串匹配；
+    英文/数字词用整词，对应索引中的前缀
+    """
+    text = normalize_text(query)
+    tokens = []
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    for word in _WORD_RUN.findall(text):
+        tokens.append(word[:MAX_PREFIX_LENGTH])
+    return list(dict.fromkeys(tokens))
+
+
+def query_terms(query):
+    """搜索词按空白拆分后的原始片段，用于相关度打分"""
+    return [term for term in normalize_text(query).split() if term]
+
+
+def _get_path(doc, path):
+    value = doc
+    for part in path.split('.'):
+        if isinstance(value, dict):
+            value = value.get(part)
+        else:
+            value = getattr(value, part, None)
+        if value is None:
+            return None
+    return value
+
+
+def build_search_keywords(doc):
+    """
+    根据房源文档（HouseDocument或原始dict）生成关键词数组
+
+    Args:
+        doc: HouseDocument实例或MongoDB原始文档
+
+    Returns:
+        list: 关键词数组
+    """
+    keywords = []
+    for path, _weight in SEARCH_FIELDS:
+        keywords.extend(tokenize(_get_path(doc, path)))
+
+    tags = _get_path(doc, 'tags') or []
+    for tag in tags:
+        keywords.extend(tokenize(tag))
+
+    return list(dict.fromkeys(keywords))[:MAX_KEYWORDS]
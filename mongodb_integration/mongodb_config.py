@@ -1,6 +1,20 @@
 # MongoDB连接配置
 # 房源数据分析系统
 
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import bson
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
 # 配置选项1：无认证连接（开发环境）
 MONGODB_URI_NO_AUTH = 'mongodb://localhost:27017/'
 
@@ -20,27 +34,383 @@ MONGODB_DATABASE = 'house_data'
 # 集合名称
 MONGODB_COLLECTION = 'houses'
 
-# 连接选项
+# 连接选项（可在Django settings中通过 MONGODB_CLIENT_OPTIONS 覆盖）
 MONGODB_OPTIONS = {
+    'maxPoolSize': 50,                 # 连接池上限（整个进程共享）
+    'minPoolSize': 0,
+    'maxIdleTimeMS': 60000,            # 空闲连接60秒后回收
+    'waitQueueTimeoutMS': 5000,        # 连接池耗尽时最多等待5秒
     'serverSelectionTimeoutMS': 5000,  # 5秒超时
     'connectTimeoutMS': 10000,         # 10秒连接超时
     'socketTimeoutMS': 30000,          # 30秒socket超时
+    'readPreference': 'primary',
+    'uuidRepresentation': 'pythonLegacy',  # 与MongoEngine保持一致
 }
 
-def get_mongodb_client():
-    """获取MongoDB客户端"""
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """连接池事件监听器，统计连接创建、签出和等待时间"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.connections_created = 0
+            self.connections_closed = 0
+            self.checkouts = 0
+            self.checkins = 0
+            self.checkout_failures = 0
+            self.pool_cleared = 0
+            self.total_wait_time = 0.0
+            self.max_wait_time = 0.0
+
+    def connection_check_out_started(self, event):
+        # 签出在同一线程内完成，用线程局部变量记录开始时间
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        started = getattr(self._local, 'started', None)
+        wait = time.perf_counter() - started if started is not None else 0.0
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait_time += wait
+            self.max_wait_time = max(self.max_wait_time, wait)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checkins += 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_created += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_closed += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_cleared += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'connections_created': self.connections_created,
+                'connections_closed': self.connections_closed,
+                'connections_open': self.connections_created - self.connections_closed,
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'in_use': self.checkouts - self.checkins,
+                'checkout_failures': self.checkout_failures,
+                'pool_cleared': self.pool_cleared,
+                'avg_wait_ms': round(self.total_wait_time / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                'max_wait_ms': round(self.max_wait_time * 1000, 3),
+            }
+
+# 超过该耗时（毫秒）的命令记入慢查询日志（可在Django settings中通过 MONGODB_SLOW_COMMAND_MS 覆盖）
+SLOW_COMMAND_MS = 100
+# 慢查询日志保留的条数（滚动）
+SLOW_LOG_SIZE = 200
+# 握手、心跳、认证等内部命令不计入统计
+IGNORED_COMMANDS = {
+    'hello', 'ismaster', 'isMaster', 'ping', 'buildInfo', 'buildinfo',
+    'saslStart', 'saslContinue', 'authenticate', 'getnonce', 'endSessions',
+}
+# 没有请求上下文（后台线程、脚本）时的统计标签
+BACKGROUND_LABEL = '(background)'
+
+class CommandCollector:
+    """一段代码（通常是一次请求）内执行的MongoDB命令统计"""
+
+    def __init__(self, label=None):
+        self.label = label
+        self._lock = threading.Lock()
+        self.commands = 0
+        self.failures = 0
+        self.time_ms = 0.0
+        self.docs = 0
+        self.by_command = defaultdict(lambda: {'count': 0, 'time_ms': 0.0})
+
+    def add(self, command_name, duration_ms, docs, failed=False):
+        with self._lock:
+            self.commands += 1
+            self.failures += int(failed)
+            self.time_ms += duration_ms
+            self.docs += docs
+            stats = self.by_command[command_name]
+            stats['count'] += 1
+            stats['time_ms'] += duration_ms
+
+    def summary(self):
+        with self._lock:
+            return {
+                'label': self.label,
+                'commands': self.commands,
+                'failures': self.failures,
+                'time_ms': round(self.time_ms, 3),
+                'docs': self.docs,
+                'by_command': {name: dict(stats, time_ms=round(stats['time_ms'], 3))
+                               for name, stats in self.by_command.items()},
+            }
+
+_current_collector = contextvars.ContextVar('mongo_command_collector', default=None)
+
+@contextmanager
+def collect_commands(label=None):
+    """
+    统计范围内当前线程/协程发出的MongoDB命令
+
+    用法：
+        with collect_commands('mongo_index') as collector:
+            ...
+        collector.summary()
+    """
+    collector = CommandCollector(label)
+    token = _current_collector.set(collector)
+    try:
+        yield collector
+    finally:
+        _current_collector.reset(token)
+
+def _reply_docs(reply):
+    """命令返回的文档数"""
+    cursor = reply.get('cursor') if isinstance(reply, dict) else None
+    if isinstance(cursor, dict):
+        return len(cursor.get('firstBatch') or cursor.get('nextBatch') or [])
+    if isinstance(reply, dict) and isinstance(reply.get('n'), int):
+        return reply['n']
+    return 0
+
+def _reply_size(reply):
+    """应答大小（字节）；需要重新编码BSON，只对慢查询计算"""
+    try:
+        return len(bson.encode(reply))
+    except Exception:
+        return 0
+
+class CommandStatsListener(monitoring.CommandListener):
+    """
+    命令事件监听器
+
+    每条命令计入发出它的请求（collect_commands设置的CommandCollector）和按标签（视图名）的累计统计；
+    超过慢查询阈值的命令连同其视图、集合和聚合管道阶段记入滚动的慢查询日志
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._by_label = defaultdict(lambda: {'commands': 0, 'time_ms': 0.0, 'docs': 0, 'max_ms': 0.0})
+        self._slow = deque(maxlen=SLOW_LOG_SIZE)
+
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        command = event.command
+        collection = command.get(event.command_name)
+        collector = _current_collector.get()
+        info = {
+            'collector': collector,
+            'label': (collector.label if collector is not None else None) or BACKGROUND_LABEL,
+            'collection': collection if isinstance(collection, str) else None,
+            'database': event.database_name,
+        }
+        if event.command_name == 'aggregate':
+            info['pipeline'] = [
+                next(iter(stage)) for stage in command.get('pipeline', []) if isinstance(stage, dict) and stage
+            ]
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = info
+
+    def succeeded(self, event):
+        self._finish(event, _reply_docs(event.reply), event.reply, failed=False)
+
+    def failed(self, event):
+        self._finish(event, 0, None, failed=True)
+
+    def _finish(self, event, docs, reply, failed):
+        with self._lock:
+            info = self._pending.pop((event.connection_id, event.request_id), None)
+        if info is None:
+            return
+        duration_ms = event.duration_micros / 1000.0
+        if info['collector'] is not None:
+            info['collector'].add(event.command_name, duration_ms, docs, failed)
+
+        label = info['label']
+        with self._lock:
+            stats = self._by_label[label]
+            stats['commands'] += 1
+            stats['time_ms'] += duration_ms
+            stats['docs'] += docs
+            stats['max_ms'] = max(stats['max_ms'], duration_ms)
+
+        threshold = _django_setting('MONGODB_SLOW_COMMAND_MS', SLOW_COMMAND_MS)
+        if duration_ms >= threshold:
+            size = _reply_size(reply) if reply is not None else 0
+            entry = {
+                'time': datetime.now().isoformat(timespec='seconds'),
+                'label': label,
+                'command': event.command_name,
+                'database': info['database'],
+                'collection': info['collection'],
+                'duration_ms': round(duration_ms, 3),
+                'docs': docs,
+                'bytes': size,
+                'failed': failed,
+            }
+            if 'pipeline' in info:
+                entry['pipeline'] = info['pipeline']
+            with self._lock:
+                self._slow.append(entry)
+            logger.warning(
+                f"MongoDB慢查询 [{label}] {event.command_name} {info['collection']} "
+                f"{duration_ms:.1f}ms docs={docs} bytes={size} {entry.get('pipeline', '')}"
+            )
+
+    def label_stats(self):
+        with self._lock:
+            return {
+                label: dict(stats, time_ms=round(stats['time_ms'], 3), max_ms=round(stats['max_ms'], 3))
+                for label, stats in self._by_label.items()
+            }
+
+    def slow_commands(self, limit=None):
+        with self._lock:
+            entries = list(self._slow)
+        entries.reverse()
+        return entries[:limit] if limit else entries
+
+# 进程级客户端注册表：按 (进程号, URI, 选项) 复用MongoClient
+# MongoClient不是fork安全的，进程号变化（如gunicorn预加载后fork）时重新创建
+_clients = {}
+_clients_lock = threading.Lock()
+_pool_stats = PoolStatsListener()
+_command_stats = CommandStatsListener()
+_default_uri = None
+
+def _django_setting(name, default=None):
+    """读取Django配置（在纯脚本/Scrapy环境中返回默认值）"""
+    try:
+        from django.conf import settings
+        if settings.configured:
+            return getattr(settings, name, default)
+    except ImportError:
+        pass
+    return default
+
+def get_client_options(**overrides):
+    """合并默认连接选项、Django配置和调用方覆盖项"""
+    options = dict(MONGODB_OPTIONS)
+    options.update(_django_setting('MONGODB_CLIENT_OPTIONS', {}) or {})
+    options.update(overrides)
+    return options
+
+def get_default_uri():
+    """当前进程默认使用的连接URI"""
+    return _default_uri or _django_setting('MONGODB_URI') or MONGODB_URI
+
+def set_default_uri(uri):
+    """设置默认连接URI（由连接探测成功后调用）"""
+    global _default_uri
+    _default_uri = uri
+
+def _client_key(uri, options):
+    return (os.getpid(), uri, tuple(sorted((k, repr(v)) for k, v in options.items())))
+
+def get_mongodb_client(uri=None, **overrides):
+    """
+    获取共享的MongoDB客户端
+
+    同一进程内相同URI和选项只创建一个MongoClient，
+    所有视图、查询助手和脚本共用其连接池；调用方不要close()
+    """
     import pymongo
-    return pymongo.MongoClient(MONGODB_URI, **MONGODB_OPTIONS)
 
-def get_database():
+    uri = uri or get_default_uri()
+    options = get_client_options(**overrides)
+    key = _client_key(uri, options)
+
+    client = _clients.get(key)
+    # MongoEngine的disconnect()会关闭客户端，关闭后的客户端不可再用，需要重建
+    if client is None or getattr(client, '_closed', False):
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None or getattr(client, '_closed', False):
+                client = pymongo.MongoClient(uri, event_listeners=[_pool_stats, _command_stats], **options)
+                _clients[key] = client
+    return client
+
+def shared_client_factory(host=None, **_conn_settings):
+    """
+    供MongoEngine的 mongo_client_class 参数使用
+
+    只取连接URI，连接池、超时和读偏好统一来自 get_client_options()
+    """
+    if isinstance(host, (list, tuple)):
+        host = host[0] if host else None
+    return get_mongodb_client(host)
+
+def release_mongodb_client(uri=None, **overrides):
+    """关闭并移除指定URI的客户端（用于连接探测失败的情况）"""
+    uri = uri or get_default_uri()
+    key = _client_key(uri, get_client_options(**overrides))
+    with _clients_lock:
+        client = _clients.pop(key, None)
+    if client is not None:
+        client.close()
+
+def close_mongodb_clients():
+    """关闭当前进程的全部共享客户端"""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
+
+def get_pool_stats():
+    """连接池统计信息"""
+    stats = _pool_stats.snapshot()
+    options = get_client_options()
+    stats.update({
+        'clients': sum(1 for key in _clients if key[0] == os.getpid()),
+        'max_pool_size': options.get('maxPoolSize'),
+        'read_preference': options.get('readPreference'),
+    })
+    return stats
+
+def get_command_stats():
+    """按标签（视图名）累计的MongoDB命令数、耗时和返回文档数（应答字节数只记入慢查询日志）"""
+    return _command_stats.label_stats()
+
+def get_slow_commands(limit=None):
+    """滚动慢查询日志（最新的在前）"""
+    return _command_stats.slow_commands(limit)
+
+def get_database(name=None):
     """获取数据库"""
-    client = get_mongodb_client()
-    return client[MONGODB_DATABASE]
+    return get_mongodb_client()[name or MONGODB_DATABASE]
 
-def get_collection():
+def get_collection(name=None):
     """获取集合"""
-    db = get_database()
-    return db[MONGODB_COLLECTION]
+    return get_database()[name or MONGODB_COLLECTION]
 
 def test_connection():
     """测试连接"""
@@ -49,19 +419,17 @@ def test_connection():
         client.admin.command('ping')
         print("✅ MongoDB连接成功")
 
-        db = get_database()
         collection = get_collection()
         count = collection.count_documents({})
         print(f"✅ 数据库访问成功，文档数: {count}")
 
-        client.close()
         return True
     except Exception as e:
         print(f"❌ MongoDB连接失败: {e}")
         return False
 
-def setup_mongoengine():
-    """设置MongoEngine连接"""
+def setup_mongoengine(uri=None):
+    """设置MongoEngine连接（复用共享客户端）"""
     import mongoengine
 
     try:
@@ -71,11 +439,8 @@ def setup_mongoengine():
         # 建立新连接
         mongoengine.connect(
             db=MONGODB_DATABASE,
-            host='127.0.0.1',
-            port=27017,
-            serverSelectionTimeoutMS=5000,
-            connectTimeoutMS=10000,
-            socketTimeoutMS=30000
+            host=uri or get_default_uri(),
+            mongo_client_class=shared_client_factory
         )
 
         print("✅ MongoEngine连接成功")
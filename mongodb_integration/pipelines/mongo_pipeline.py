@@ -7,6 +7,10 @@ MongoDB存储管道
 
 import sys
 import os
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 # 添加项目路径
@@ -17,28 +21,204 @@ sys.path.insert(0, grandparent_dir)
 
 from itemadapter import ItemAdapter
 import mongoengine
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
 from mongodb_integration.models.data_mapper import DataMapper
+from mongodb_integration.models.mongo_models import HouseDocument
+from mongodb_integration.models.search_tokens import build_search_keywords
+from mongodb_integration.derived_stats import invalidate_derived_stats
+from mongodb_integration.stats_rollup import apply_rollup_changes
+from scrapy_spider.house_spider.write_buffer import (
+    MySQLWriteBuffer,
+    DEFAULT_BATCH_SIZE as DEFAULT_MYSQL_BATCH_SIZE,
+    DEFAULT_FLUSH_INTERVAL as DEFAULT_MYSQL_FLUSH_INTERVAL,
+    CLOSE_RETRIES,
+    FAILED_ROWS_DIR,
+)
+from scrapy_spider.house_spider.dedup_store import LISTINGS_WRITTEN, item_fingerprint, listing_fingerprint
+
+try:
+    from django.conf import settings as django_settings
+    from app_mongo.cache_utils import bump_tags, house_write_tags
+    from app_mongo.cache_warmup import notify_ingest
+except ImportError:  # 爬虫环境未安装Django时不维护Web端缓存标签
+    django_settings = None
+
+# 每写入多少条房源使一次派生统计（价格矩阵等）失效
+INVALIDATE_EVERY = 500
+
+# 批量写入：缓冲条数达到 MONGO_BULK_SIZE 或距上次写入超过 MONGO_BULK_INTERVAL 秒时写入一次
+DEFAULT_BULK_SIZE = 500
+DEFAULT_BULK_INTERVAL = 5.0
+# 连接异常时缓冲区保留待重试的最大条数，超过部分（最早的房源）转存到重放文件
+MAX_PENDING_RETRY = 5000
+
+# 汇总/缓存标签需要的旧文档字段
+ROLLUP_PROJECTION = {
+    'location.city': 1, 'rental_type': 1, 'features.direction': 1,
+    'features.area': 1, 'price.monthly_rent': 1, 'crawl_meta.source_url': 1, 'house_id': 1,
+}
+
+
+def setup_django(spider):
+    """
+    爬虫进程中初始化Django（run_spider.py 不经过 manage.py），
+    使缓存标签递增和预热通知写入Web进程共用的缓存后端
+    """
+    if django_settings is None or django_settings.configured:
+        return
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Python租房房源数据可视化分析.settings')
+    try:
+        import MySQLdb  # noqa: F401
+    except ImportError:
+        # 爬虫环境只安装了PyMySQL（见requirements.txt），供Django的MySQL后端使用
+        try:
+            import pymysql
+            pymysql.install_as_MySQLdb()
+        except ImportError:
+            pass
+    try:
+        import django
+        django.setup()
+    except Exception as e:
+        spider.logger.warning(f"Django初始化失败，不维护Web端缓存标签和预热: {e}")
+
+
+def mark_ingested(pipeline, spider, force=False):
+    """累计写入条数，达到阈值或爬虫结束时使派生统计失效，并通知缓存预热"""
+    if not pipeline.pending_ingest:
+        return
+    if not force and pipeline.pending_ingest < INVALIDATE_EVERY:
+        return
+    try:
+        deleted = invalidate_derived_stats()
+        spider.logger.debug(f"派生统计已失效: {deleted} 条")
+        pipeline.pending_ingest = 0
+    except Exception as e:
+        spider.logger.error(f"派生统计失效失败: {e}")
+    # 通知Web进程按新数据重新预热缓存
+    if django_settings is not None and django_settings.configured:
+        try:
+            notify_ingest()
+        except Exception as e:
+            spider.logger.error(f"缓存预热通知失败: {e}")
+
+
+def invalidate_batch_cache_tags(changes, spider):
+    """一批房源变更涉及的缓存标签（新旧文档所在城市 + 全部房源）合并后递增一次"""
+    if django_settings is None or not django_settings.configured:
+        return
+    tags = set()
+    for old_doc, new_doc in changes:
+        for doc in (old_doc, new_doc):
+            if doc is not None:
+                tags.update(house_write_tags(doc))
+    if not tags:
+        return
+    try:
+        bump_tags(*sorted(tags))
+    except Exception as e:
+        spider.logger.error(f"缓存标签失效失败: {e}")
+
+
+def listing_key(mongo_doc):
+    """
+    房源的稳定标识：优先使用来源链接，没有链接时用标题+位置的摘要
+
+    Returns:
+        tuple: (upsert过滤条件, 缓冲区key)
+    """
+    source_url = (mongo_doc.crawl_meta.source_url or '').strip()
+    if source_url:
+        return {'crawl_meta.source_url': source_url}, f'url:{source_url}'
+    location = mongo_doc.location
+    raw = '|'.join([mongo_doc.title or '', location.city or '', location.street or '', location.building or ''])
+    house_id = hashlib.md5(raw.encode('utf-8')).hexdigest()
+    return {'house_id': house_id}, f'id:{house_id}'
+
+
+def listing_id(key):
+    """缓冲区key -> 定长的房源标识（与插入时的house_id一致，供MySQL备份表关联）"""
+    kind, _, value = key.partition(':')
+    return value if kind == 'id' else hashlib.md5(value.encode('utf-8')).hexdigest()
+
+
+def upsert_operation(mongo_doc, query):
+    """
+    HouseDocument -> UpdateOne(upsert=True)
+
+    重复爬取时更新已有房源：创建时间、house_id和状态只在插入时写入，
+    爬取元数据逐字段更新并累加更新次数
+    """
+    now = datetime.now()
+    mongo_doc.updated_at = now
+    mongo_doc.search_keywords = build_search_keywords(mongo_doc)
+    data = mongo_doc.to_mongo().to_dict()
+    data.pop('_id', None)
+
+    # 状态可能已被人工修改（如已出租），重复爬取不覆盖
+    on_insert = {'created_at': data.pop('created_at', now), 'status': data.pop('status', 'available')}
+    house_id = data.pop('house_id', None) or query.get('house_id') or \
+        hashlib.md5(query['crawl_meta.source_url'].encode('utf-8')).hexdigest()
+    on_insert['house_id'] = house_id
+
+    crawl_meta = data.pop('crawl_meta', {})
+    crawl_meta.pop('update_count', None)
+    crawl_meta['last_updated'] = now
+    update = {
+        '$set': dict(data, **{f'crawl_meta.{key}': value for key, value in crawl_meta.items()}),
+        '$setOnInsert': on_insert,
+        '$inc': {'crawl_meta.update_count': 1},
+    }
+    return UpdateOne(query, update, upsert=True)
 
 
 class MongoDBPipeline:
-    """MongoDB存储管道"""
+    """
+    MongoDB存储管道（批量upsert）
+
+    房源先按稳定标识缓冲（同一批内重复的房源只保留最新一条），
+    达到批量大小、超过时间间隔或爬虫结束时一次 bulk_write 写入，
+    写入结果计入Scrapy统计（mongodb/bulk/*）
+
+    未能写入的房源不丢弃：写入错误的房源、连接异常时超出 MAX_PENDING_RETRY 的房源、
+    爬虫结束时重试仍失败的房源，以原始数据项写入重放文件（JSON Lines），可事后补录
+    """
     
-    def __init__(self, mongo_db='house_data', mongo_host='127.0.0.1', mongo_port=27017):
+    def __init__(self, mongo_db='house_data', mongo_host='127.0.0.1', mongo_port=27017,
+                 bulk_size=DEFAULT_BULK_SIZE, bulk_interval=DEFAULT_BULK_INTERVAL, stats=None):
         self.mongo_db = mongo_db
         self.mongo_host = mongo_host
         self.mongo_port = mongo_port
+        self.bulk_size = bulk_size
+        self.bulk_interval = bulk_interval
+        self.stats = stats
+        self.signals = None
         self.connection = None
+        self.pending_ingest = 0
+        self.buffer = {}
+        self.last_flush = time.monotonic()
         
     @classmethod
     def from_crawler(cls, crawler):
-        return cls(
+        pipeline = cls(
             mongo_db=crawler.settings.get("MONGO_DATABASE", "house_data"),
             mongo_host=crawler.settings.get("MONGO_HOST", "127.0.0.1"),
             mongo_port=crawler.settings.get("MONGO_PORT", 27017),
+            bulk_size=crawler.settings.getint("MONGO_BULK_SIZE", DEFAULT_BULK_SIZE),
+            bulk_interval=crawler.settings.getfloat("MONGO_BULK_INTERVAL", DEFAULT_BULK_INTERVAL),
+            stats=crawler.stats,
         )
+        pipeline.signals = crawler.signals
+        # 爬虫空闲时也按时间间隔写入，避免末尾少量房源长时间停留在缓冲区
+        from scrapy import signals
+        crawler.signals.connect(pipeline.spider_idle, signal=signals.spider_idle)
+        return pipeline
     
     def open_spider(self, spider):
         """爬虫开始时建立MongoDB连接"""
+        # 先于连接MongoDB：Django加载模型时会建立自己的默认连接，随后在此处替换
+        setup_django(spider)
         try:
             # 断开现有连接
             mongoengine.disconnect()
@@ -59,40 +239,203 @@ class MongoDBPipeline:
             spider.logger.error(f"MongoDB连接失败: {e}")
             
     def close_spider(self, spider):
-        """爬虫结束时关闭MongoDB连接"""
+        """爬虫结束时重试写入剩余房源，仍失败的写入重放文件，再关闭MongoDB连接"""
+        self.finish(spider)
+    
+    def finish(self, spider):
+        """
+        最终写入并关闭连接（close_spider的实现，双写管道需要其返回值）
+
+        Returns:
+            list: 本次未写入MongoDB、已转存到重放文件的房源listing_id
+        """
+        failed = []
         if self.connection:
+            for attempt in range(CLOSE_RETRIES):
+                failed.extend(self.flush(spider))
+                if not self.buffer:
+                    break
+                time.sleep(attempt + 1)
+        failed.extend(self.save_replay(list(self.buffer), spider))
+        if self.connection:
+            mark_ingested(self, spider, force=True)
             mongoengine.disconnect()
             spider.logger.info("MongoDB连接已关闭")
+        return failed
+    
+    def spider_idle(self, spider):
+        if self.buffer and time.monotonic() - self.last_flush >= self.bulk_interval:
+            self.flush(spider)
     
     def process_item(self, item, spider):
-        """处理数据项"""
+        """转换并缓冲数据项，满足批量条件时写入"""
+        self.buffer_item(dict(ItemAdapter(item)), spider)
+        if self.due():
+            self.flush(spider)
+        return item
+    
+    def buffer_item(self, item_dict, spider):
+        """
+        转换为MongoDB文档并放入缓冲区（只做本地校验，不单条写库）
+
+        Returns:
+            str: 房源的稳定标识（listing_id）；转换或校验失败时返回None
+        """
         try:
-            adapter = ItemAdapter(item)
-            
-            # 使用数据映射器转换为MongoDB文档
-            mongo_doc = DataMapper.scrapy_item_to_mongo(dict(adapter))
-            
-            # 保存到MongoDB
-            mongo_doc.save()
-            
-            spider.logger.debug(f"MongoDB保存成功: {mongo_doc.title}")
-            
-            return item
+            mongo_doc = DataMapper.scrapy_item_to_mongo(item_dict)
+            mongo_doc.validate()
+            query, key = listing_key(mongo_doc)
+            # 保留原始数据项，写入失败时原样写入重放文件
+            self.buffer[key] = (query, mongo_doc, dict(item_dict))
+            self._inc_stat('mongodb/bulk/buffered')
+            return listing_id(key)
+        except Exception as e:
+            spider.logger.error(f"MongoDB房源转换失败: {e}")
+            self._inc_stat('mongodb/bulk/invalid')
+            return None
+    
+    def due(self):
+        """缓冲条数达到批量大小，或距上次写入超过时间间隔"""
+        if not self.buffer:
+            return False
+        return len(self.buffer) >= self.bulk_size or time.monotonic() - self.last_flush >= self.bulk_interval
+    
+    def flush(self, spider):
+        """
+        把缓冲区的房源一次bulk_write写入，并批量更新汇总和缓存标签
+
+        Returns:
+            list: 未写入MongoDB、已转存到重放文件的房源listing_id（连接异常保留重试的不在其中）
+        """
+        self.last_flush = time.monotonic()
+        if not self.buffer:
+            return []
+        keys = list(self.buffer)
+        batch = list(self.buffer.values())
+        collection = HouseDocument._get_collection()
+        started = time.perf_counter()
+        
+        try:
+            # 旧文档用于汇总的增量修正（先减旧值再加新值）和旧城市的缓存标签
+            old_docs = {}
+            for doc in collection.find({'$or': [query for query, _, _ in batch]}, ROLLUP_PROJECTION):
+                url = (doc.get('crawl_meta') or {}).get('source_url')
+                old_docs[f'url:{url}' if url else f"id:{doc.get('house_id')}"] = doc
             
+            result = collection.bulk_write([upsert_operation(doc, query) for query, doc, _ in batch], ordered=False)
+            failed = set()
+        except BulkWriteError as e:
+            # 部分写入失败：失败的房源记录日志后写入重放文件，成功的照常更新汇总
+            details = e.details
+            failed = {error['index'] for error in details.get('writeErrors', [])}
+            for error in details.get('writeErrors', [])[:5]:
+                spider.logger.error(f"MongoDB批量写入错误: {error.get('errmsg')}")
+            self._inc_stat('mongodb/bulk/write_errors', len(failed))
+            result = None
+            self._record_result(details.get('nUpserted', 0), details.get('nMatched', 0), details.get('nModified', 0))
+        except PyMongoError as e:
+            # 连接类错误：保留缓冲区等待下一次写入，超出上限的最早房源转存到重放文件
+            spider.logger.error(f"MongoDB批量写入失败，稍后重试: {e}")
+            self._inc_stat('mongodb/bulk/retries')
+            overflow = list(self.buffer)[:max(len(self.buffer) - MAX_PENDING_RETRY, 0)]
+            return self.save_replay(overflow, spider)
+        
+        failed_keys = [keys[index] for index in sorted(failed)]
+        self.save_replay(failed_keys, spider)
+        self.buffer.clear()
+        written = [(key, doc) for index, (key, (_, doc, _)) in enumerate(zip(keys, batch)) if index not in failed]
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if result is not None:
+            self._record_result(result.upserted_count, result.matched_count, result.modified_count)
+        self._inc_stat('mongodb/bulk/batches')
+        self._set_stat('mongodb/bulk/last_batch_size', len(batch))
+        self._set_stat('mongodb/bulk/last_batch_ms', round(elapsed_ms, 1))
+        spider.logger.debug(f"MongoDB批量写入 {len(written)}/{len(batch)} 条，耗时 {elapsed_ms:.1f}ms")
+        
+        changes = [(old_docs.get(key), doc) for key, doc in written]
+        try:
+            apply_rollup_changes(mongoengine.connection.get_db(), changes)
         except Exception as e:
-            spider.logger.error(f"MongoDB保存失败: {e}")
-            return item
+            spider.logger.error(f"统计汇总更新失败: {e}")
+        invalidate_batch_cache_tags(changes, spider)
+        self.pending_ingest += len(written)
+        mark_ingested(self, spider)
+        self.notify_written([item_dict for index, (_, _, item_dict) in enumerate(batch) if index not in failed])
+        return [listing_id(key) for key in failed_keys]
+    
+    def notify_written(self, item_dicts):
+        """已写入的房源通知去重管道（LISTINGS_WRITTEN 信号）"""
+        if self.signals is not None and item_dicts:
+            self.signals.send_catch_log(
+                signal=LISTINGS_WRITTEN, fingerprints=[item_fingerprint(item_dict) for item_dict in item_dicts]
+            )
+    
+    def save_replay(self, keys, spider):
+        """
+        把缓冲区中指定的房源以原始数据项写入重放文件并移出缓冲区
+
+        Returns:
+            list: 转存的房源listing_id
+        """
+        if not keys:
+            return []
+        os.makedirs(FAILED_ROWS_DIR, exist_ok=True)
+        path = os.path.join(FAILED_ROWS_DIR, f"mongo_replay_{datetime.now():%Y%m%d}.jsonl")
+        with open(path, 'a', encoding='utf-8') as f:
+            for key in keys:
+                _, _, item_dict = self.buffer.pop(key)
+                f.write(json.dumps(item_dict, ensure_ascii=False, default=str) + '\n')
+        self._inc_stat('mongodb/bulk/replay_saved', len(keys))
+        spider.logger.error(f"{len(keys)} 条房源未能写入MongoDB，已保存到重放文件 {path}")
+        return [listing_id(key) for key in keys]
+    
+    def _record_result(self, upserted, matched, modified):
+        self._inc_stat('mongodb/bulk/upserted', upserted)
+        self._inc_stat('mongodb/bulk/matched', matched)
+        self._inc_stat('mongodb/bulk/modified', modified)
+    
+    def _inc_stat(self, key, count=1):
+        if self.stats is not None:
+            self.stats.inc_value(key, count)
+    
+    def _set_stat(self, key, value):
+        if self.stats is not None:
+            self.stats.set_value(key, value)
 
 
 class DualWritePipeline:
-    """双写管道 - 同时写入MySQL和MongoDB"""
+    """
+    双写管道 - 同时写入MySQL和MongoDB
+
+    两边各自缓冲：MongoDB为批量upsert（见MongoDBPipeline），MySQL为executemany写后缓冲；
+    任一边满足批量条件时两边在线程池中并行写入，每批各提交一次。
+    写入失败的批次保留重试，不丢数据
+    """
+    
+    insert_sql = """
+    INSERT INTO House_dual_write (
+        title, type, building, city, street, area, direct, price, 
+        link, tag, img, crawl_time, spider_name, crawl_id, data_quality, mongo_id, write_status
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """
     
-    def __init__(self, mysql_settings, mongo_settings):
+    def __init__(self, mysql_settings, mongo_settings, stats=None):
         self.mysql_settings = mysql_settings
         self.mongo_settings = mongo_settings
+        self.stats = stats
         self.mysql_connection = None
         self.mongo_connection = None
         self.mysql_cursor = None
+        self.mysql_buffer = None
+        self.executor = None
+        self.mongo = MongoDBPipeline(
+            mongo_db=mongo_settings['database'],
+            mongo_host=mongo_settings['host'],
+            mongo_port=mongo_settings['port'],
+            bulk_size=mongo_settings.get('bulk_size', DEFAULT_BULK_SIZE),
+            bulk_interval=mongo_settings.get('bulk_interval', DEFAULT_BULK_INTERVAL),
+            stats=stats
+        )
         
     @classmethod
     def from_crawler(cls, crawler):
@@ -101,16 +444,24 @@ class DualWritePipeline:
             'port': crawler.settings.get("MYSQL_PORT", 3306),
             'user': crawler.settings.get("MYSQL_USER", "root"),
             'password': crawler.settings.get("MYSQL_PASSWORD", "123456"),
-            'database': crawler.settings.get("MYSQL_DATABASE", "guangzhou_house")
+            'database': crawler.settings.get("MYSQL_DATABASE", "guangzhou_house"),
+            'batch_size': crawler.settings.getint("MYSQL_BATCH_SIZE", DEFAULT_MYSQL_BATCH_SIZE),
+            'flush_interval': crawler.settings.getfloat("MYSQL_FLUSH_INTERVAL", DEFAULT_MYSQL_FLUSH_INTERVAL)
         }
         
         mongo_settings = {
             'database': crawler.settings.get("MONGO_DATABASE", "house_data"),
             'host': crawler.settings.get("MONGO_HOST", "127.0.0.1"),
-            'port': crawler.settings.get("MONGO_PORT", 27017)
+            'port': crawler.settings.get("MONGO_PORT", 27017),
+            'bulk_size': crawler.settings.getint("MONGO_BULK_SIZE", DEFAULT_BULK_SIZE),
+            'bulk_interval': crawler.settings.getfloat("MONGO_BULK_INTERVAL", DEFAULT_BULK_INTERVAL)
         }
         
-        return cls(mysql_settings, mongo_settings)
+        pipeline = cls(mysql_settings, mongo_settings, stats=crawler.stats)
+        pipeline.mongo.signals = crawler.signals
+        from scrapy import signals
+        crawler.signals.connect(pipeline.spider_idle, signal=signals.spider_idle)
+        return pipeline
     
     def open_spider(self, spider):
         """爬虫开始时建立双重连接"""
@@ -131,35 +482,49 @@ class DualWritePipeline:
             
             # 创建备份表
             self.create_backup_table(spider)
+            self.mysql_buffer = MySQLWriteBuffer(
+                self.mysql_connection, self.insert_sql, 'House_dual_write',
+                batch_size=self.mysql_settings.get('batch_size', DEFAULT_MYSQL_BATCH_SIZE),
+                flush_interval=self.mysql_settings.get('flush_interval', DEFAULT_MYSQL_FLUSH_INTERVAL),
+                stats=self.stats, logger=spider.logger, on_written=self.notify_mysql_written
+            )
             
         except Exception as e:
             spider.logger.error(f"MySQL连接失败: {e}")
         
         # 建立MongoDB连接
-        try:
-            mongoengine.disconnect()
-            self.mongo_connection = mongoengine.connect(
-                db=self.mongo_settings['database'],
-                host=self.mongo_settings['host'],
-                port=self.mongo_settings['port'],
-                serverSelectionTimeoutMS=5000
-            )
-            spider.logger.info(f"MongoDB连接成功: {self.mongo_settings['host']}")
-            
-        except Exception as e:
-            spider.logger.error(f"MongoDB连接失败: {e}")
+        self.mongo.open_spider(spider)
+        self.mongo_connection = self.mongo.connection
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='dual-write')
     
     def close_spider(self, spider):
-        """爬虫结束时关闭双重连接"""
+        """
+        爬虫结束时先写完MongoDB的剩余数据，再写MySQL，最后关闭双重连接
+
+        MongoDB最终仍失败的房源要在MySQL备份表中标记写入状态，因此MySQL缓冲区在此之后才关闭
+        """
+        if self.executor:
+            self.executor.shutdown(wait=True)
+        
+        mongo_failed = []
+        if self.mongo_connection:
+            try:
+                mongo_failed = self.mongo.finish(spider)
+            except Exception as e:
+                spider.logger.error(f"MongoDB最终写入失败: {e}")
+        if self.mysql_buffer:
+            if mongo_failed:
+                self.mark_mongo_failed(mongo_failed, spider)
+            try:
+                self.mysql_buffer.close()
+            except Exception as e:
+                spider.logger.error(f"MySQL最终写入失败: {e}")
+        
         if self.mysql_cursor:
             self.mysql_cursor.close()
         if self.mysql_connection:
             self.mysql_connection.close()
             spider.logger.info("MySQL连接已关闭")
-            
-        if self.mongo_connection:
-            mongoengine.disconnect()
-            spider.logger.info("MongoDB连接已关闭")
     
     def create_backup_table(self, spider):
         """创建MySQL备份表"""
@@ -193,49 +558,36 @@ class DualWritePipeline:
         except Exception as e:
             spider.logger.error(f"创建双写备份表失败: {e}")
     
+    def spider_idle(self, spider):
+        if self._due():
+            self.flush(spider)
+    
     def process_item(self, item, spider):
-        """双写处理数据项"""
+        """双写处理数据项：两边分别缓冲，满足批量条件时并行写入"""
         adapter = ItemAdapter(item)
-        mysql_success = False
-        mongo_success = False
-        mongo_id = None
         
-        # 写入MongoDB
-        try:
-            # 使用数据适配器确保数据格式正确
-            item_dict = dict(adapter)
-
-            # 应用数据适配（如果需要）
-            if hasattr(item_dict.get('type', ''), 'strip'):
-                # 对于新爬取的数据，应用基本的数据清理
-                item_dict['type'] = item_dict.get('type', '').strip()
-                item_dict['link'] = item_dict.get('link', '').strip()
-
-                # 确保URL格式正确
-                if item_dict['link'] and not item_dict['link'].startswith('http'):
-                    if item_dict['link'].startswith('/'):
-                        item_dict['link'] = f"https://gz.lianjia.com{item_dict['link']}"
-                    else:
-                        item_dict['link'] = f"https://gz.lianjia.com/{item_dict['link']}"
+        # 使用数据适配器确保数据格式正确
+        item_dict = dict(adapter)
 
-            mongo_doc = DataMapper.scrapy_item_to_mongo(item_dict)
-            mongo_doc.save()
-            mongo_id = str(mongo_doc.id)
-            mongo_success = True
-            spider.logger.debug(f"MongoDB写入成功: {mongo_doc.title}")
-        except Exception as e:
-            spider.logger.error(f"MongoDB写入失败: {e}")
+        # 应用数据适配（如果需要）
+        if hasattr(item_dict.get('type', ''), 'strip'):
+            # 对于新爬取的数据，应用基本的数据清理
+            item_dict['type'] = item_dict.get('type', '').strip()
+            item_dict['link'] = item_dict.get('link', '').strip()
+
+            # 确保URL格式正确
+            if item_dict['link'] and not item_dict['link'].startswith('http'):
+                if item_dict['link'].startswith('/'):
+                    item_dict['link'] = f"https://gz.lianjia.com{item_dict['link']}"
+                else:
+                    item_dict['link'] = f"https://gz.lianjia.com/{item_dict['link']}"
+
+        # MongoDB：转换校验后进入批量upsert缓冲，mongo_id为房源稳定标识
+        mongo_id = self.mongo.buffer_item(item_dict, spider) if self.mongo_connection else None
         
-        # 写入MySQL
-        try:
-            insert_sql = """
-            INSERT INTO House_dual_write (
-                title, type, building, city, street, area, direct, price, 
-                link, tag, img, crawl_time, spider_name, crawl_id, data_quality, mongo_id
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
-            
-            data = (
+        # MySQL：进入写后缓冲，MongoDB侧已确定失败的在写入状态中标记
+        if self.mysql_buffer:
+            self.mysql_buffer.add((
                 adapter.get('title', ''),
                 adapter.get('type', ''),
                 adapter.get('building', ''),
@@ -251,41 +603,58 @@ class DualWritePipeline:
                 adapter.get('spider_name', ''),
                 adapter.get('crawl_id', ''),
                 adapter.get('data_quality', 0),
-                mongo_id
-            )
-            
-            self.mysql_cursor.execute(insert_sql, data)
-            self.mysql_connection.commit()
-            mysql_success = True
-            spider.logger.debug(f"MySQL写入成功: {adapter.get('title', 'Unknown')}")
-            
-        except Exception as e:
-            spider.logger.error(f"MySQL写入失败: {e}")
-            if self.mysql_connection:
-                self.mysql_connection.rollback()
-        
-        # 记录双写状态
-        write_status = "success"
-        if not mysql_success and not mongo_success:
-            write_status = "both_failed"
-        elif not mysql_success:
-            write_status = "mysql_failed"
-        elif not mongo_success:
-            write_status = "mongo_failed"
+                mongo_id,
+                'success' if mongo_id else 'mongo_failed'
+            ))
+        elif not mongo_id:
+            spider.logger.error(f"双写失败 - MySQL和MongoDB均不可用: {adapter.get('title', 'Unknown')}")
         
-        # 更新写入状态
-        if mysql_success:
-            try:
-                update_sql = "UPDATE House_dual_write SET write_status = %s WHERE mongo_id = %s"
-                self.mysql_cursor.execute(update_sql, (write_status, mongo_id))
-                self.mysql_connection.commit()
-            except Exception as e:
-                spider.logger.error(f"更新写入状态失败: {e}")
+        if self._due():
+            self.flush(spider)
+        return item
+    
+    def _due(self):
+        return (self.mysql_buffer is not None and self.mysql_buffer.due()) or \
+            (self.mongo_connection is not None and self.mongo.due())
+    
+    def flush(self, spider):
+        """两边缓冲区在线程池中并行写入"""
+        mysql_task = self.executor.submit(self.mysql_buffer.flush) if self.mysql_buffer else None
+        mongo_task = self.executor.submit(self.mongo.flush, spider) if self.mongo_connection else None
         
-        spider.logger.info(f"双写完成 - MySQL: {'✅' if mysql_success else '❌'}, "
-                          f"MongoDB: {'✅' if mongo_success else '❌'}")
+        mysql_ok = mysql_task.result() if mysql_task else False
+        mongo_failed = mongo_task.result() if mongo_task else []
+        if mongo_failed and self.mysql_buffer:
+            self.mark_mongo_failed(mongo_failed, spider)
         
-        return item
+        spider.logger.info(f"双写批量完成 - MySQL: {'✅' if mysql_ok else '❌'}, "
+                          f"MongoDB: {'✅' if mongo_task and not self.mongo.buffer else '❌'}")
+    
+    def notify_mysql_written(self, rows):
+        """MySQL备份表已提交的行同样通知去重管道（任一边写入成功即视为已入库）"""
+        if self.mongo.signals is not None:
+            self.mongo.signals.send_catch_log(
+                signal=LISTINGS_WRITTEN,
+                fingerprints=[listing_fingerprint(row[8], row[0], row[7], row[3]) for row in rows]
+            )
+    
+    def mark_mongo_failed(self, mongo_ids, spider):
+        """MongoDB写入失败（已转存到重放文件）的房源，在MySQL备份表中标记写入状态"""
+        # 尚在缓冲区的行直接修改
+        failed = set(mongo_ids)
+        self.mysql_buffer.rows = [
+            row[:-1] + ('mongo_failed',) if row[-2] in failed else row
+            for row in self.mysql_buffer.rows
+        ]
+        try:
+            placeholders = ', '.join(['%s'] * len(failed))
+            self.mysql_cursor.execute(
+                f"UPDATE House_dual_write SET write_status = 'mongo_failed' WHERE mongo_id IN ({placeholders})",
+                tuple(failed)
+            )
+            self.mysql_connection.commit()
+        except Exception as e:
+            spider.logger.error(f"更新写入状态失败: {e}")
 
 
 class DataConsistencyPipeline:
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+房源统计增量汇总
+stats_cache 中为每个 城市/租赁类型/朝向/面积区间 维护一条汇总文档
+（数量、价格和、价格平方和、最小/最大价格、面积和），
+写入房源时用 $inc upsert 增量更新，图表读取 O(分组数) 条文档即可，
+reconcile_rollups() 从房源集合全量重建
+"""
+
+import re
+from datetime import datetime
+
+from pymongo import DeleteMany, InsertOne, UpdateOne
+
+STATS_COLLECTION = 'stats_cache'
+HOUSES_COLLECTION = 'houses'
+ROLLUP_STAT_TYPE = 'rollup'
+
+# 汇总维度：维度名 -> 字段路径（area维度按区间分桶）
+DIMENSIONS = {
+    'city': 'location.city',
+    'type': 'rental_type',
+    'direction': 'features.direction',
+    'area': 'features.area',
+}
+
+# 全部房源的总汇总
+TOTAL_DIMENSION = 'all'
+TOTAL_VALUE = 'all'
+
+# 面积区间边界与标签（左闭右开）
+AREA_BOUNDARIES = [0, 30, 50, 80, 120, 200, 1000]
+AREA_LABELS = ['30㎡以下', '30-50㎡', '50-80㎡', '80-120㎡', '120-200㎡', '200㎡以上']
+
+
+def _get_path(doc, path):
+    value = doc
+    for part in path.split('.'):
+        if isinstance(value, dict):
+            value = value.get(part)
+        else:
+            value = getattr(value, part, None)
+        if value is None:
+            return None
+    return value
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def area_label(area):
+    """面积 -> 区间标签，超出范围返回None"""
+    area = _to_float(area)
+    if area is None:
+        return None
+    for low, high, label in zip(AREA_BOUNDARIES, AREA_BOUNDARIES[1:], AREA_LABELS):
+        if low <= area < high:
+            return label
+    return None
+
+
+def rollup_key(dimension, value):
+    return f"{dimension}:{value}"
+
+
+def extract_groups(doc):
+    """
+    房源所属的全部汇总分组
+
+    Args:
+        doc: HouseDocument实例或MongoDB/Elasticsearch原始文档（嵌套结构）
+
+    Returns:
+        list: [(维度, 分组值)]
+    """
+    groups = [(TOTAL_DIMENSION, TOTAL_VALUE)]
+    for dimension, path in DIMENSIONS.items():
+        value = _get_path(doc, path)
+        if dimension == 'area':
+            value = area_label(value)
+        if value:
+            groups.append((dimension, str(value)))
+    return groups
+
+
+def rollup_operations(doc, sign=1, now=None):
+    """
+    生成一条房源对汇总的增量更新操作
+
+    Args:
+        doc: 房源文档
+        sign: 1 表示新增，-1 表示移除
+        now: 更新时间
+
+    Returns:
+        list: pymongo UpdateOne操作；价格缺失时返回空列表
+    """
+    price = _to_float(_get_path(doc, 'price.monthly_rent'))
+    if price is None:
+        return []
+    area = _to_float(_get_path(doc, 'features.area')) or 0.0
+    now = now or datetime.now()
+
+    ops = []
+    for dimension, value in extract_groups(doc):
+        update = {
+            '$inc': {
+                'stat_value.count': sign,
+                'stat_value.sum': sign * price,
+                'stat_value.sumsq': sign * price * price,
+                'stat_value.area_sum': sign * area,
+            },
+            '$set': {
+                'stat_value.dimension': dimension,
+                'stat_value.value': value,
+                'updated_time': now,
+            },
+            '$setOnInsert': {'created_time': now},
+        }
+        # 最小/最大值只能单调更新，移除房源后由 reconcile_rollups() 校正
+        if sign > 0:
+            update['$min'] = {'stat_value.min': price}
+            update['$max'] = {'stat_value.max': price}
+        ops.append(UpdateOne(
+            {'stat_type': ROLLUP_STAT_TYPE, 'stat_key': rollup_key(dimension, value)},
+            update,
+            upsert=True
+        ))
+    return ops
+
+
+def apply_rollup(db, doc, sign=1):
+    """新增（sign=1）或移除（sign=-1）一条房源的汇总贡献"""
+    ops = rollup_operations(doc, sign)
+    if ops:
+        db[STATS_COLLECTION].bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+def apply_rollup_change(db, old_doc, new_doc):
+    """房源更新：先移除旧值的贡献，再加入新值"""
+    return apply_rollup_changes(db, [(old_doc, new_doc)])
+
+
+def apply_rollup_changes(db, changes):
+    """
+    批量房源变更的汇总更新，合并为一次 bulk_write
+
+    Args:
+        changes: [(旧文档或None, 新文档或None)]
+    """
+    now = datetime.now()
+    ops = []
+    for old_doc, new_doc in changes:
+        if old_doc is not None:
+            ops.extend(rollup_operations(old_doc, -1, now))
+        if new_doc is not None:
+            ops.extend(rollup_operations(new_doc, 1, now))
+    if ops:
+        db[STATS_COLLECTION].bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+# 只统计数值型价格
+_PRICE_MATCH = {'$match': {'price.monthly_rent': {'$type': 'number'}}}
+
+
+def _group_stage(key_expr):
+    return {'$group': {
+        '_id': key_expr,
+        'count': {'$sum': 1},
+        'sum': {'$sum': '$price.monthly_rent'},
+        'sumsq': {'$sum': {'$multiply': ['$price.monthly_rent', '$price.monthly_rent']}},
+        'min': {'$min': '$price.monthly_rent'},
+        'max': {'$max': '$price.monthly_rent'},
+        'area_sum': {'$sum': {'$ifNull': ['$features.area', 0]}},
+    }}
+
+
+def reconcile_rollups(db):
+    """
+    从房源集合全量重建汇总（一次 $facet 聚合）
+
+    重建期间并发写入的增量可能丢失，建议在爬虫空闲时定期执行
+
+    Returns:
+        int: 写入的汇总文档数
+    """
+    area_branches = [
+        {'case': {'$and': [{'$gte': ['$features.area', low]}, {'$lt': ['$features.area', high]}]}, 'then': label}
+        for low, high, label in zip(AREA_BOUNDARIES, AREA_BOUNDARIES[1:], AREA_LABELS)
+    ]
+    pipeline = [
+        _PRICE_MATCH,
+        {'$facet': {
+            TOTAL_DIMENSION: [_group_stage(TOTAL_VALUE)],
+            'city': [_group_stage('$location.city')],
+            'type': [_group_stage('$rental_type')],
+            'direction': [_group_stage('$features.direction')],
+            'area': [_group_stage({'$switch': {'branches': area_branches, 'default': None}})],
+        }}
+    ]
+    result = list(db[HOUSES_COLLECTION].aggregate(pipeline, allowDiskUse=True))
+    groups = result[0] if result else {}
+
+    now = datetime.now()
+    docs = []
+    for dimension, rows in groups.items():
+        for row in rows:
+            if row['_id'] in (None, ''):
+                continue
+            value = str(row['_id'])
+            stat_value = {k: row[k] for k in ('count', 'sum', 'sumsq', 'min', 'max', 'area_sum')}
+            stat_value.update(dimension=dimension, value=value, reconciled_at=now)
+            docs.append({
+                'stat_type': ROLLUP_STAT_TYPE,
+                'stat_key': rollup_key(dimension, value),
+                'stat_value': stat_value,
+                'created_time': now,
+                'updated_time': now,
+            })
+
+    # 有序执行：先清空旧汇总，再写入重建结果
+    ops = [DeleteMany({'stat_type': ROLLUP_STAT_TYPE})] + [InsertOne(doc) for doc in docs]
+    db[STATS_COLLECTION].bulk_write(ops, ordered=True)
+    return len(docs)
+
+
+def summarize(stat_value):
+    """汇总文档 -> 均值/标准差等可直接展示的指标"""
+    count = stat_value.get('count') or 0
+    if count <= 0:
+        return None
+    mean = stat_value.get('sum', 0) / count
+    variance = max(stat_value.get('sumsq', 0) / count - mean * mean, 0.0)
+    return {
+        'name': stat_value.get('value'),
+        'count': int(count),
+        'avg_price': mean,
+        'std_price': variance ** 0.5,
+        'min_price': stat_value.get('min'),
+        'max_price': stat_value.get('max'),
+        'avg_area': stat_value.get('area_sum', 0) / count,
+    }
+
+
+def rollups_ready(db):
+    """
+    汇总是否可信：只有执行过一次全量重建，增量汇总才覆盖全部历史房源
+    """
+    return db[STATS_COLLECTION].find_one({
+        'stat_type': ROLLUP_STAT_TYPE,
+        'stat_key': rollup_key(TOTAL_DIMENSION, TOTAL_VALUE),
+        'stat_value.reconciled_at': {'$exists': True}
+    }, {'_id': 1}) is not None
+
+
+def read_rollups(db, dimension):
+    """
+    读取某个维度的全部分组汇总（按数量降序）
+
+    Returns:
+        list: summarize() 结果列表；尚未全量重建时返回空列表，调用方回退到聚合查询
+    """
+    if not rollups_ready(db):
+        return []
+    # stat_key前缀匹配可使用 (stat_type, stat_key) 复合索引
+    docs = db[STATS_COLLECTION].find(
+        {'stat_type': ROLLUP_STAT_TYPE, 'stat_key': {'$regex': f'^{re.escape(dimension)}:'}},
+        {'stat_value': 1, '_id': 0}
+    )
+    rows = [summarize(doc['stat_value']) for doc in docs]
+    return sorted((row for row in rows if row), key=lambda row: row['count'], reverse=True)
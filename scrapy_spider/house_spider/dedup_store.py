@@ -0,0 +1,252 @@
+# 持久化去重指纹库
+# 跨运行记住已入库的房源（只记录下游确认写入的房源），内存占用与房源数量基本无关：
+# - bloom:  可扩展布隆过滤器，文件持久化，约 1.2 字节/条（误判率1%时），误判率可配置
+# - sqlite: 8字节哈希键存SQLite（WITHOUT ROWID主键），磁盘存储，内存恒定，几乎无误判
+
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import struct
+from urllib.parse import urlsplit
+
+DEFAULT_BACKEND = 'bloom'
+DEFAULT_PATH = 'output/dedup_fingerprints'
+DEFAULT_CAPACITY = 100000
+DEFAULT_ERROR_RATE = 0.001
+# 每新增多少条指纹落盘一次（异常退出时最多丢失这么多条，入库端按来源链接upsert兜底）
+SAVE_EVERY = 10000
+
+BLOOM_MAGIC = b'HSBF1'
+
+# Scrapy信号：房源已由存储管道写入（参数 fingerprints 为指纹列表），去重管道收到后才记入指纹库。
+# 用字符串而不是object()：本模块会以 house_spider 和 scrapy_spider.house_spider 两种包路径导入
+LISTINGS_WRITTEN = 'house_spider.listings_written'
+
+
+def _price_key(price):
+    try:
+        return f'{float(price):.2f}'
+    except (TypeError, ValueError):
+        return str(price or '')
+
+
+def _link_key(link):
+    """链接只取路径和查询串：爬虫产出相对链接，MongoDB中存的是补全域名后的绝对链接"""
+    parts = urlsplit(str(link or '').strip())
+    return parts.path + (f'?{parts.query}' if parts.query else '')
+
+
+def listing_fingerprint(link='', title='', price=0, city=''):
+    """
+    房源指纹：有来源链接时用 链接+价格，否则用 标题+价格+城市
+    价格计入指纹，价格变化的房源会重新入库（由upsert更新）
+    """
+    link = _link_key(link)
+    if link:
+        return f'{link}|{_price_key(price)}'
+    return f"{str(title or '').strip()}|{_price_key(price)}|{str(city or '').strip()}"
+
+
+def item_fingerprint(item):
+    """数据项（dict或ItemAdapter）的房源指纹"""
+    return listing_fingerprint(item.get('link', ''), item.get('title', ''), item.get('price', 0), item.get('city', ''))
+
+
+def _hash_pair(key):
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+    return struct.unpack('<QQ', digest)
+
+
+class BloomFilter:
+    """定长布隆过滤器（双重哈希）"""
+
+    def __init__(self, capacity, error_rate, bits=None, count=0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bits if bits is not None else bytearray((self.size + 7) // 8)
+        self.count = count
+
+    def _positions(self, key):
+        h1, h2 = _hash_pair(key)
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
+
+
+class BloomDedupStore:
+    """
+    可扩展布隆过滤器
+
+    当前过滤器写满后追加一个容量翻倍、误判率减半的新过滤器，
+    总误判率不超过 error_rate（首个过滤器取 error_rate/2）
+    """
+
+    GROWTH = 2
+    TIGHTENING = 0.5
+
+    def __init__(self, path, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE):
+        self.path = path
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.filters = []
+        self.unsaved = 0
+        self.is_new = not os.path.exists(path)
+        if not self.is_new:
+            self._load()
+
+    def __contains__(self, key):
+        return any(key in bloom for bloom in self.filters)
+
+    def __len__(self):
+        return sum(bloom.count for bloom in self.filters)
+
+    def add(self, key):
+        """加入指纹，返回True表示此前未见过"""
+        if key in self:
+            return False
+        if not self.filters or self.filters[-1].full:
+            index = len(self.filters)
+            self.filters.append(BloomFilter(
+                self.capacity * self.GROWTH ** index,
+                self.error_rate * (1 - self.TIGHTENING) * self.TIGHTENING ** index
+            ))
+        self.filters[-1].add(key)
+        self.unsaved += 1
+        if self.unsaved >= SAVE_EVERY:
+            self.save()
+        return True
+
+    def memory_bytes(self):
+        return sum(len(bloom.bits) for bloom in self.filters)
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        header = json.dumps({
+            'capacity': self.capacity,
+            'error_rate': self.error_rate,
+            'filters': [[bloom.capacity, bloom.error_rate, bloom.count] for bloom in self.filters],
+        }).encode('utf-8')
+        # 先写临时文件再替换，写到一半退出不会损坏已有指纹库
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(BLOOM_MAGIC + struct.pack('<I', len(header)) + header)
+            for bloom in self.filters:
+                f.write(bloom.bits)
+        os.replace(tmp_path, self.path)
+        self.unsaved = 0
+
+    def _load(self):
+        with open(self.path, 'rb') as f:
+            if f.read(len(BLOOM_MAGIC)) != BLOOM_MAGIC:
+                raise ValueError(f'不是有效的去重指纹文件: {self.path}')
+            (header_size,) = struct.unpack('<I', f.read(4))
+            header = json.loads(f.read(header_size).decode('utf-8'))
+            # 已有文件的参数优先，保证位数组与哈希个数一致
+            self.capacity = header['capacity']
+            self.error_rate = header['error_rate']
+            for capacity, error_rate, count in header['filters']:
+                bloom = BloomFilter(capacity, error_rate, count=count)
+                bloom.bits = bytearray(f.read(len(bloom.bits)))
+                self.filters.append(bloom)
+
+    def close(self):
+        self.save()
+
+
+class SQLiteDedupStore:
+    """8字节哈希键存SQLite，内存恒定；64位哈希碰撞概率约为 n²/2⁶⁵，可视为精确去重"""
+
+    COMMIT_EVERY = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self.is_new = not os.path.exists(path)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS fingerprints (hash BLOB PRIMARY KEY) WITHOUT ROWID')
+        self.uncommitted = 0
+
+    @staticmethod
+    def _hash(key):
+        return hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+
+    def __contains__(self, key):
+        return self.connection.execute(
+            'SELECT 1 FROM fingerprints WHERE hash = ?', (self._hash(key),)
+        ).fetchone() is not None
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM fingerprints').fetchone()[0]
+
+    def add(self, key):
+        """加入指纹，返回True表示此前未见过"""
+        cursor = self.connection.execute('INSERT OR IGNORE INTO fingerprints (hash) VALUES (?)', (self._hash(key),))
+        if cursor.rowcount:
+            self.uncommitted += 1
+            if self.uncommitted >= self.COMMIT_EVERY:
+                self.save()
+            return True
+        return False
+
+    def memory_bytes(self):
+        return 0
+
+    def save(self):
+        self.connection.commit()
+        self.uncommitted = 0
+
+    def close(self):
+        self.save()
+        self.connection.close()
+
+
+def open_dedup_store(backend=DEFAULT_BACKEND, path=DEFAULT_PATH, capacity=DEFAULT_CAPACITY,
+                     error_rate=DEFAULT_ERROR_RATE):
+    """按配置打开指纹库（path不含扩展名，按后端追加 .bloom / .sqlite3）"""
+    if backend == 'sqlite':
+        return SQLiteDedupStore(f'{path}.sqlite3')
+    if backend == 'bloom':
+        return BloomDedupStore(f'{path}.bloom', capacity, error_rate)
+    raise ValueError(f'不支持的去重后端: {backend}')
+
+
+def iter_mysql_fingerprints(connection, table='House_scrapy'):
+    """流式读取MySQL备份表中已有房源的指纹（服务器端游标，不整表载入内存）"""
+    import pymysql
+
+    with connection.cursor(pymysql.cursors.SSCursor) as cursor:
+        cursor.execute(f'SELECT link, title, price, city FROM {table}')
+        for link, title, price, city in cursor:
+            yield listing_fingerprint(link, title, price, city)
+
+
+def iter_mongo_fingerprints(collection, batch_size=1000):
+    """按批读取MongoDB房源的指纹（只投影指纹字段）"""
+    projection = {'crawl_meta.source_url': 1, 'title': 1, 'price.monthly_rent': 1, 'location.city': 1, '_id': 0}
+    for doc in collection.find({}, projection, batch_size=batch_size):
+        yield listing_fingerprint(
+            (doc.get('crawl_meta') or {}).get('source_url'),
+            doc.get('title'),
+            (doc.get('price') or {}).get('monthly_rent'),
+            (doc.get('location') or {}).get('city'),
+        )
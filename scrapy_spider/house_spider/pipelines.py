@@ -3,8 +3,16 @@
 
 import pymysql
 import logging
+import threading
 from datetime import datetime
 from itemadapter import ItemAdapter
+from scrapy.exceptions import DropItem
+
+from .write_buffer import MySQLWriteBuffer, DEFAULT_BATCH_SIZE, DEFAULT_FLUSH_INTERVAL
+from .dedup_store import (
+    open_dedup_store, listing_fingerprint, item_fingerprint, iter_mysql_fingerprints, iter_mongo_fingerprints,
+    LISTINGS_WRITTEN, DEFAULT_BACKEND, DEFAULT_PATH, DEFAULT_CAPACITY, DEFAULT_ERROR_RATE
+)
 
 
 class ValidationPipeline:
@@ -52,46 +60,190 @@ class ValidationPipeline:
 
 
 class DuplicatesPipeline:
-    """去重管道"""
+    """
+    去重管道 - 持久化指纹库
+
+    指纹库跨运行保留（DEDUP_BACKEND: bloom / sqlite），首次创建时从MySQL备份表和
+    MongoDB已有房源预热，重复爬取不会再次入库；布隆过滤器的误判率由 DEDUP_ERROR_RATE 控制
+
+    process_item 只检查指纹是否已存在，新指纹先记在本次运行的待确认集合中（同一次运行内照样去重）；
+    存储管道写入成功后发出 LISTINGS_WRITTEN 信号，指纹才记入指纹库。
+    写入失败的房源不会被记为已入库，下次运行会重新爬取
+    """
     
-    def __init__(self):
-        self.seen_items = set()
+    def __init__(self, backend=DEFAULT_BACKEND, path=DEFAULT_PATH, capacity=DEFAULT_CAPACITY,
+                 error_rate=DEFAULT_ERROR_RATE, warm_sources=(), settings=None, stats=None):
+        self.backend = backend
+        self.path = path
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.warm_sources = warm_sources
+        self.settings = settings or {}
+        self.stats = stats
+        self.store = None
+        self.pending = set()
+        # 双写管道在线程池中写入并发出确认信号，确认的指纹先暂存，由爬虫线程记入指纹库
+        self.confirmed = []
+        self.confirmed_lock = threading.Lock()
+        
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        pipeline = cls(
+            backend=settings.get("DEDUP_BACKEND", DEFAULT_BACKEND),
+            path=settings.get("DEDUP_PATH", DEFAULT_PATH),
+            capacity=settings.getint("DEDUP_CAPACITY", DEFAULT_CAPACITY),
+            error_rate=settings.getfloat("DEDUP_ERROR_RATE", DEFAULT_ERROR_RATE),
+            warm_sources=settings.getlist("DEDUP_WARM_SOURCES", ['mysql', 'mongo']),
+            settings=settings,
+            stats=crawler.stats
+        )
+        crawler.signals.connect(pipeline.confirm_written, signal=LISTINGS_WRITTEN)
+        return pipeline
+        
+    def open_spider(self, spider):
+        """打开指纹库，新建时从已有数据预热"""
+        self.store = open_dedup_store(self.backend, self.path, self.capacity, self.error_rate)
+        if self.store.is_new:
+            for source in self.warm_sources:
+                self.warm_load(source, spider)
+            self.store.save()
+        spider.logger.info(f"去重指纹库已加载: {self.backend}, {len(self.store)} 条指纹")
+        
+    def warm_load(self, source, spider):
+        """从MySQL备份表或MongoDB读取已有房源的指纹"""
+        connection = None
+        try:
+            if source == 'mysql':
+                connection = pymysql.connect(
+                    host=self.settings.get("MYSQL_HOST", "localhost"),
+                    port=self.settings.get("MYSQL_PORT", 3306),
+                    user=self.settings.get("MYSQL_USER", "root"),
+                    password=self.settings.get("MYSQL_PASSWORD", "123456"),
+                    database=self.settings.get("MYSQL_DATABASE", "guangzhou_house"),
+                    charset='utf8mb4'
+                )
+                fingerprints = iter_mysql_fingerprints(connection)
+            elif source == 'mongo':
+                import pymongo
+                connection = pymongo.MongoClient(
+                    host=self.settings.get("MONGO_HOST", "127.0.0.1"),
+                    port=self.settings.get("MONGO_PORT", 27017),
+                    serverSelectionTimeoutMS=5000
+                )
+                collection = connection[self.settings.get("MONGO_DATABASE", "house_data")]['houses']
+                fingerprints = iter_mongo_fingerprints(collection)
+            else:
+                spider.logger.warning(f"未知的去重预热数据源: {source}")
+                return
+            
+            added = sum(1 for fingerprint in fingerprints if self.store.add(fingerprint))
+            spider.logger.info(f"去重指纹库从 {source} 预热 {added} 条")
+            self._inc_stat(f'dedup/warm_{source}', added)
+        except Exception as e:
+            spider.logger.error(f"去重指纹库从 {source} 预热失败: {e}")
+        finally:
+            if connection is not None:
+                connection.close()
+        
+    def close_spider(self, spider):
+        # 存储管道先于本管道关闭（Scrapy按相反顺序调用close_spider），最后一批的确认已经收到
+        self.apply_confirmed()
+        if self.pending:
+            spider.logger.warning(f"{len(self.pending)} 条房源未确认写入，指纹不记入指纹库")
+        self._set_stat('dedup/unconfirmed', len(self.pending))
+        self.pending.clear()
+        if self.store:
+            self._set_stat('dedup/fingerprints', len(self.store))
+            self._set_stat('dedup/memory_bytes', self.store.memory_bytes())
+            self.store.close()
         
     def process_item(self, item, spider):
-        adapter = ItemAdapter(item)
+        self.apply_confirmed()
         
-        # 生成唯一标识 (基于标题+价格+城市)
-        item_id = f"{adapter.get('title', '')}_{adapter.get('price', 0)}_{adapter.get('city', '')}"
+        # 生成唯一标识（来源链接+价格，无链接时标题+价格+城市）
+        item_id = item_fingerprint(ItemAdapter(item))
         
-        if item_id in self.seen_items:
+        if item_id in self.pending or item_id in self.store:
             spider.logger.info(f"发现重复数据: {item_id}")
-            return None
-        else:
-            self.seen_items.add(item_id)
-            return item
+            self._inc_stat('dedup/duplicates')
+            raise DropItem(f"重复数据: {item_id}")
+        self.pending.add(item_id)
+        self._inc_stat('dedup/new')
+        return item
+    
+    def confirm_written(self, fingerprints):
+        """LISTINGS_WRITTEN 信号：存储管道已写入的房源指纹（可能在写入线程中调用）"""
+        with self.confirmed_lock:
+            self.confirmed.extend(fingerprints)
+    
+    def apply_confirmed(self):
+        """把已确认写入的指纹记入指纹库"""
+        with self.confirmed_lock:
+            confirmed, self.confirmed = self.confirmed, []
+        if not confirmed or self.store is None:
+            return
+        for fingerprint in confirmed:
+            self.pending.discard(fingerprint)
+            self.store.add(fingerprint)
+        self._inc_stat('dedup/confirmed', len(confirmed))
+    
+    def _inc_stat(self, key, count=1):
+        if self.stats is not None:
+            self.stats.inc_value(key, count)
+    
+    def _set_stat(self, key, value):
+        if self.stats is not None:
+            self.stats.set_value(key, value)
 
 
 class MySQLPipeline:
-    """MySQL存储管道 - 兼容现有表结构"""
+    """
+    MySQL存储管道 - 兼容现有表结构
+
+    数据项进入写后缓冲，满 MYSQL_BATCH_SIZE 条或超过 MYSQL_FLUSH_INTERVAL 秒时
+    executemany 批量插入并提交一次
+    """
+    
+    insert_sql = """
+    INSERT INTO House_scrapy (
+        title, type, building, city, street, area, direct, price, 
+        link, tag, img, crawl_time, spider_name, crawl_id, data_quality
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """
     
-    def __init__(self, mysql_host, mysql_port, mysql_user, mysql_password, mysql_db):
+    def __init__(self, mysql_host, mysql_port, mysql_user, mysql_password, mysql_db,
+                 batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL, stats=None):
         self.mysql_host = mysql_host
         self.mysql_port = mysql_port
         self.mysql_user = mysql_user
         self.mysql_password = mysql_password
         self.mysql_db = mysql_db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats = stats
+        self.signals = None
         self.connection = None
         self.cursor = None
+        self.buffer = None
         
     @classmethod
     def from_crawler(cls, crawler):
-        return cls(
+        pipeline = cls(
             mysql_host=crawler.settings.get("MYSQL_HOST", "localhost"),
             mysql_port=crawler.settings.get("MYSQL_PORT", 3306),
             mysql_user=crawler.settings.get("MYSQL_USER", "root"),
             mysql_password=crawler.settings.get("MYSQL_PASSWORD", "123456"),
-            mysql_db=crawler.settings.get("MYSQL_DATABASE", "guangzhou_house")
+            mysql_db=crawler.settings.get("MYSQL_DATABASE", "guangzhou_house"),
+            batch_size=crawler.settings.getint("MYSQL_BATCH_SIZE", DEFAULT_BATCH_SIZE),
+            flush_interval=crawler.settings.getfloat("MYSQL_FLUSH_INTERVAL", DEFAULT_FLUSH_INTERVAL),
+            stats=crawler.stats
         )
+        pipeline.signals = crawler.signals
+        # 爬虫空闲时按时间间隔写入缓冲区剩余数据
+        from scrapy import signals
+        crawler.signals.connect(pipeline.spider_idle, signal=signals.spider_idle)
+        return pipeline
         
     def open_spider(self, spider):
         """爬虫开始时建立数据库连接"""
@@ -106,6 +258,11 @@ class MySQLPipeline:
                 autocommit=False
             )
             self.cursor = self.connection.cursor()
+            self.buffer = MySQLWriteBuffer(
+                self.connection, self.insert_sql, 'House_scrapy',
+                batch_size=self.batch_size, flush_interval=self.flush_interval,
+                stats=self.stats, logger=spider.logger, on_written=self.notify_written
+            )
             spider.logger.info(f"MySQL连接成功: {self.mysql_host}:{self.mysql_port}/{self.mysql_db}")
             
             # 创建备份表 (如果不存在)
@@ -115,7 +272,9 @@ class MySQLPipeline:
             spider.logger.error(f"MySQL连接失败: {e}")
             
     def close_spider(self, spider):
-        """爬虫结束时关闭数据库连接"""
+        """爬虫结束时写入缓冲区剩余数据并关闭数据库连接"""
+        if self.buffer:
+            self.buffer.close()
         if self.cursor:
             self.cursor.close()
         if self.connection:
@@ -152,49 +311,45 @@ class MySQLPipeline:
         except Exception as e:
             spider.logger.error(f"创建备份表失败: {e}")
             
-    def process_item(self, item, spider):
-        """处理数据项"""
-        try:
-            adapter = ItemAdapter(item)
-            
-            # 插入到备份表
-            insert_sql = """
-            INSERT INTO House_scrapy (
-                title, type, building, city, street, area, direct, price, 
-                link, tag, img, crawl_time, spider_name, crawl_id, data_quality
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
-            
-            data = (
-                adapter.get('title', ''),
-                adapter.get('type', ''),
-                adapter.get('building', ''),
-                adapter.get('city', ''),
-                adapter.get('street', ''),
-                adapter.get('area', 0),
-                adapter.get('direct', ''),
-                adapter.get('price', 0),
-                adapter.get('link', ''),
-                adapter.get('tag', ''),
-                adapter.get('img', ''),
-                adapter.get('crawl_time', datetime.now().isoformat()),
-                adapter.get('spider_name', ''),
-                adapter.get('crawl_id', ''),
-                adapter.get('data_quality', 0)
+    def spider_idle(self, spider):
+        if self.buffer and self.buffer.due():
+            self.buffer.flush()
+    
+    def notify_written(self, rows):
+        """已提交的行通知去重管道（行内顺序见 insert_sql：link第9列、title第1列、price第8列、city第4列）"""
+        if self.signals is not None:
+            self.signals.send_catch_log(
+                signal=LISTINGS_WRITTEN,
+                fingerprints=[listing_fingerprint(row[8], row[0], row[7], row[3]) for row in rows]
             )
-            
-            self.cursor.execute(insert_sql, data)
-            self.connection.commit()
-            
-            spider.logger.debug(f"数据已保存到MySQL: {adapter.get('title', 'Unknown')}")
-            
-            return item
-            
-        except Exception as e:
-            spider.logger.error(f"保存到MySQL失败: {e}")
-            if self.connection:
-                self.connection.rollback()
+    
+    def process_item(self, item, spider):
+        """数据项进入写后缓冲，满足批量条件时批量写入"""
+        if not self.buffer:
+            spider.logger.error("MySQL未连接，数据未保存")
             return item
+        
+        adapter = ItemAdapter(item)
+        self.buffer.add((
+            adapter.get('title', ''),
+            adapter.get('type', ''),
+            adapter.get('building', ''),
+            adapter.get('city', ''),
+            adapter.get('street', ''),
+            adapter.get('area', 0),
+            adapter.get('direct', ''),
+            adapter.get('price', 0),
+            adapter.get('link', ''),
+            adapter.get('tag', ''),
+            adapter.get('img', ''),
+            adapter.get('crawl_time', datetime.now().isoformat()),
+            adapter.get('spider_name', ''),
+            adapter.get('crawl_id', ''),
+            adapter.get('data_quality', 0)
+        ))
+        if self.buffer.due():
+            self.buffer.flush()
+        return item
 
 
 class StatisticsPipeline:
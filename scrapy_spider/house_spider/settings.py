@@ -62,6 +62,19 @@ MYSQL_USER = 'root'
 MYSQL_PASSWORD = '123456'
 MYSQL_DATABASE = 'guangzhou_house'
 
+# 批量写入：满 N 条或超过 T 秒提交一次
+MYSQL_BATCH_SIZE = 200
+MYSQL_FLUSH_INTERVAL = 5.0
+MONGO_BULK_SIZE = 500
+MONGO_BULK_INTERVAL = 5.0
+
+# 去重指纹库：bloom（可扩展布隆过滤器）或 sqlite（哈希键表），跨运行持久化
+DEDUP_BACKEND = 'bloom'
+DEDUP_PATH = 'output/dedup_fingerprints'
+DEDUP_CAPACITY = 100000     # 首个过滤器容量，写满后按2倍扩容
+DEDUP_ERROR_RATE = 0.001    # 误判率预算（新房源被误判为重复的概率上限）
+DEDUP_WARM_SOURCES = ['mysql', 'mongo']  # 指纹库新建时从这些数据源预热
+
 # 自动限速设置
 AUTOTHROTTLE_ENABLED = True
 AUTOTHROTTLE_START_DELAY = 1
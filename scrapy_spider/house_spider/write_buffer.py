@@ -0,0 +1,211 @@
+# MySQL写后缓冲
+# 数据项先进入内存缓冲，满 N 条或超过 T 秒时用 executemany 批量插入并只提交一次，
+# 每批一次fsync，而不是每条房源一次
+
+import json
+import os
+import time
+from datetime import datetime
+
+try:
+    import pymysql
+    MYSQL_ERRORS = (pymysql.err.MySQLError,)
+except ImportError:
+    MYSQL_ERRORS = ()
+
+# 可重试的错误码：保留整批，下次写入时重连重试
+# pymysql对数据截断、除零等数据错误同样抛OperationalError，因此按错误码而不是异常类判断
+TRANSIENT_ERRNOS = {
+    2003,  # 无法连接服务器
+    2006,  # 服务器已断开（MySQL server has gone away）
+    2013,  # 查询过程中连接丢失
+    2055,  # 读写时连接丢失
+    1205,  # 锁等待超时
+    1213,  # 死锁
+}
+
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_FLUSH_INTERVAL = 5.0
+# 爬虫结束时最后一批的重试次数（每次间隔递增1秒）
+CLOSE_RETRIES = 3
+# 连接异常时缓冲区保留待重试的最大行数，超过部分（最早的行）写入失败文件
+MAX_PENDING_RETRY = 5000
+# 连接异常后的重试间隔（秒），每次失败翻倍直到上限，写入成功后复位
+RETRY_BACKOFF = 1.0
+MAX_RETRY_BACKOFF = 60.0
+FAILED_ROWS_DIR = 'output'
+
+
+def is_transient(error):
+    """连接中断、锁等待超时、死锁等重试可成功的MySQL错误"""
+    return isinstance(error, MYSQL_ERRORS) and bool(error.args) and error.args[0] in TRANSIENT_ERRNOS
+
+
+class MySQLWriteBuffer:
+    """
+    MySQL批量写入缓冲
+
+    - 连接异常、死锁、锁等待超时：整批保留在缓冲区，按递增间隔重连重试，数据不丢失；
+      保留的行超过 MAX_PENDING_RETRY 时最早的行写入失败文件
+    - 其他异常（某行超长、类型错误等）：回滚后逐行插入，坏行写入失败文件，其余行照常提交；
+      逐行插入中途连接异常时，除已确认的坏行外全部保留重试
+    - 爬虫结束时重试仍失败的行写入失败文件（JSON Lines），可事后补录
+    """
+
+    def __init__(self, connection, sql, table, batch_size=DEFAULT_BATCH_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, stats=None, logger=None, on_written=None,
+                 max_pending=MAX_PENDING_RETRY):
+        self.connection = connection
+        self.sql = sql
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats = stats
+        self.logger = logger
+        # 提交成功后以写入的行列表回调（如通知去重管道）
+        self.on_written = on_written
+        self.max_pending = max_pending
+        self.rows = []
+        self.last_flush = time.monotonic()
+        self.retry_at = 0.0
+        self.backoff = 0.0
+
+    def add(self, row):
+        self.rows.append(row)
+        self._inc_stat('buffered')
+        overflow = len(self.rows) - self.max_pending
+        if overflow > 0:
+            self._save_failed(self.rows[:overflow])
+            del self.rows[:overflow]
+
+    def due(self):
+        """缓冲条数达到批量大小，或距上次写入超过时间间隔；连接异常后等待重试间隔"""
+        if not self.rows:
+            return False
+        if time.monotonic() < self.retry_at:
+            return False
+        return len(self.rows) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval
+
+    def flush(self):
+        """
+        写入缓冲区中的全部行（一次 executemany + 一次提交）
+
+        Returns:
+            bool: 缓冲区是否已清空（False表示连接异常，行保留待重试）
+        """
+        self.last_flush = time.monotonic()
+        if not self.rows:
+            return True
+        rows = self.rows
+        started = time.perf_counter()
+        try:
+            self.connection.ping(reconnect=True)
+            with self.connection.cursor() as cursor:
+                cursor.executemany(self.sql, rows)
+            self.connection.commit()
+        except Exception as e:
+            self._rollback()
+            if is_transient(e):
+                self._schedule_retry(len(rows), e)
+                return False
+            self._log('warning', f"MySQL批量写入数据异常，改为逐行写入: {e}")
+            pending = self._flush_row_by_row(rows)
+            if pending:
+                self.rows = pending
+                return False
+        else:
+            self._written(rows)
+        self.rows = []
+        self.retry_at = 0.0
+        self.backoff = 0.0
+        self._inc_stat('batches')
+        self._set_stat('last_batch_size', len(rows))
+        self._set_stat('last_batch_ms', round((time.perf_counter() - started) * 1000, 1))
+        return True
+
+    def close(self):
+        """爬虫结束：重试写入剩余行，仍失败的行写入失败文件"""
+        for attempt in range(CLOSE_RETRIES):
+            if self.flush():
+                return
+            time.sleep(attempt + 1)
+        self._save_failed(self.rows)
+        self.rows = []
+
+    def _schedule_retry(self, count, error):
+        self.backoff = min(max(self.backoff * 2, RETRY_BACKOFF), MAX_RETRY_BACKOFF)
+        self.retry_at = time.monotonic() + self.backoff
+        self._log('error', f"MySQL写入失败，{count} 条保留待重试（{self.backoff:.0f}秒后）: {error}")
+        self._inc_stat('retries')
+
+    def _flush_row_by_row(self, rows):
+        """
+        逐行插入，坏行写入失败文件
+
+        Returns:
+            list: 中途连接异常时需要保留重试的行（未提交的正常行），否则为空
+        """
+        written, failed = [], []
+        try:
+            with self.connection.cursor() as cursor:
+                for row in rows:
+                    try:
+                        cursor.execute(self.sql, row)
+                        written.append(row)
+                    except Exception as e:
+                        if is_transient(e):
+                            raise
+                        self._log('error', f"MySQL写入失败: {e}")
+                        failed.append(row)
+            self.connection.commit()
+        except Exception as e:
+            # 回滚后只有已确认的坏行进入失败文件；连接异常时其余行保留重试
+            self._rollback()
+            self._save_failed(failed)
+            pending = written + rows[len(written) + len(failed):]
+            if is_transient(e):
+                self._schedule_retry(len(pending), e)
+                return pending
+            self._log('error', f"MySQL逐行写入失败: {e}")
+            self._save_failed(pending)
+            return []
+        self._written(written)
+        self._save_failed(failed)
+        return []
+
+    def _written(self, rows):
+        self._inc_stat('written', len(rows))
+        if rows and self.on_written is not None:
+            try:
+                self.on_written(rows)
+            except Exception as e:
+                self._log('error', f"写入回调失败: {e}")
+
+    def _save_failed(self, rows):
+        if not rows:
+            return
+        os.makedirs(FAILED_ROWS_DIR, exist_ok=True)
+        path = os.path.join(FAILED_ROWS_DIR, f"failed_{self.table}_{datetime.now():%Y%m%d}.jsonl")
+        with open(path, 'a', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(list(row), ensure_ascii=False, default=str) + '\n')
+        self._inc_stat('failed', len(rows))
+        self._log('error', f"{len(rows)} 条数据写入MySQL失败，已保存到 {path}")
+
+    def _rollback(self):
+        try:
+            self.connection.rollback()
+        except Exception:
+            pass
+
+    def _log(self, level, message):
+        if self.logger is not None:
+            getattr(self.logger, level)(message)
+
+    def _inc_stat(self, key, count=1):
+        if self.stats is not None:
+            self.stats.inc_value(f'mysql/{self.table}/{key}', count)
+
+    def _set_stat(self, key, value):
+        if self.stats is not None:
+            self.stats.set_value(f'mysql/{self.table}/{key}', value)
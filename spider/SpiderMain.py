@@ -49,6 +49,8 @@ house_type = [x.strip() for x in house_type if x.strip() != '']
 price = html.xpath('//*[@id="content"]/div[1]/div[1]/div/div/span/em/text()')
 imgs = html.xpath('//*[@id="content"]/div[1]/div[1]/div/a/img/@data-src')
 print(imgs[0])
+insert_query = "INSERT INTO House(title,type,building,city,street,area,direct,price,link,tag,img) VALUES (%s, %s, %s,%s, %s, %s,%s, %s, %s, %s, %s)"
+rows = []  # 整页解析完后一次 executemany + 一次提交
 for i in range(len(name)):
     try:
         print('开始爬取第'+str(i+1)+'条数据')
@@ -68,13 +70,16 @@ for i in range(len(name)):
         link = hrefs[i]
         img = imgs[i]
         print(title,type,building,city,street1,area,direct,price1,link,tag,img)
-        insert_query = "INSERT INTO House(title,type,building,city,street,area,direct,price,link,tag,img) VALUES (%s, %s, %s,%s, %s, %s,%s, %s, %s, %s, %s)"
-        data = (title,type,building,city,street1,area,direct,price1,link,tag,img)
-        cursor.execute(insert_query, data)
-        cnx.commit()
-        data = ()
+        rows.append((title,type,building,city,street1,area,direct,price1,link,tag,img))
     except Exception as e:
         print(e)
+try:
+    cursor.executemany(insert_query, rows)
+    cnx.commit()
+    print(f'已写入 {len(rows)} 条数据')
+except Exception as e:
+    cnx.rollback()
+    print(f'批量写入失败: {e}')
 cursor.close()
 cnx.close()
 print('爬取完毕')